@@ -8,30 +8,61 @@ Email: mcardle-j9@ulster.ac.uk
 B-No: B00733578
 """
 
-from flask import Flask
+from flask import Flask, g, request
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from db import init_database
 from blueprints.auth.auth import auth_bp
+from blueprints.metrics.metrics import metrics_bp
 from blueprints.users.users import users_bp
-from config import FLASK_DEBUG, FLASK_HOST, FLASK_PORT
+from config import FLASK_DEBUG, FLASK_HOST, FLASK_PORT, SERVER_TIMING_ENABLED, TRUSTED_PROXIES
+import metrics
+import profiler
+import timing
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def create_app():
+def create_app() -> Flask:
+    """
+    Create the WSGI serving mode of the auth service.
+
+    Building the app opens no database connections and starts no subprocesses, so a
+    worker can start serving as soon as it has imported this module; the connection pool
+    fills on the first request. Migrations are applied once per deploy, before workers
+    start, with `python manage.py migrate`. `python manage.py cold-start` checks how long
+    an import takes against `COLD_START_BUDGET_MS`.
+
+    Behind `TRUSTED_PROXIES` reverse proxies, the client address is taken from their
+    `X-Forwarded-For` entries, so per-IP login throttling sees real clients rather than
+    the load balancer.
+
+    Returns:
+        Flask: The configured application.
+    """
     app = Flask(__name__)
     CORS(app)
-    init_database()
+    if TRUSTED_PROXIES:
+        app.wsgi_app = ProxyFix(
+            app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES, x_host=TRUSTED_PROXIES
+        )
     app.register_blueprint(auth_bp)
     app.register_blueprint(users_bp)
+    app.register_blueprint(metrics_bp)
+    metrics.instrument(app, request, g)
+    timing.instrument(app, request, g, send_header=SERVER_TIMING_ENABLED)
+    profiler.instrument(app, request, g)
     return app
 
 
 app = create_app()
 
 if __name__ == "__main__":
+    # The development server migrates on start for convenience; deployments run
+    # `manage.py migrate` as a separate step.
+    init_database()
     logger.info(
         f"Starting Flask app on {FLASK_HOST}:{FLASK_PORT} with debug={FLASK_DEBUG}"
     )
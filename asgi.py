@@ -0,0 +1,110 @@
+"""
+File: asgi.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+from quart import Quart, g, request
+from quart_cors import cors
+from hypercorn.middleware import ProxyFixMiddleware
+from async_db import init_async_pool, close_async_pool
+from async_decorators import load_revocations_async
+from blueprints.auth.auth_async import auth_async_bp
+from blueprints.metrics.metrics_async import metrics_async_bp
+from blueprints.users.users_async import users_async_bp
+from config import (
+    FLASK_DEBUG,
+    FLASK_HOST,
+    FLASK_PORT,
+    JWT_KEYS_RELOAD_INTERVAL,
+    REVOCATION_RESYNC_INTERVAL,
+    TRUSTED_PROXIES,
+)
+from metrics import instrument
+from signing_keys import keyring
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def _resync_revocations() -> None:
+    """Keep the revocation cache in step with the database for the life of the server."""
+    while True:
+        await asyncio.sleep(REVOCATION_RESYNC_INTERVAL)
+        try:
+            await load_revocations_async()
+        except Exception as e:
+            logger.error(f"Error resyncing revocation cache: {str(e)}")
+
+
+async def _reload_signing_keys() -> None:
+    """
+    Re-read the signing key directory in the default executor, often enough that requests
+    never find the keyring stale and read it on the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, keyring.reload)
+        except Exception as e:
+            logger.error(f"Error reloading signing keys: {str(e)}")
+        await asyncio.sleep(max(JWT_KEYS_RELOAD_INTERVAL / 2, 1))
+
+
+def create_async_app() -> Quart:
+    """
+    Create the asyncio (ASGI) serving mode of the auth service.
+
+    It serves the same auth and users routes as `app.create_app`, using an asyncpg pool
+    for database access and the bounded password executor for bcrypt/argon2 work, so a
+    single process can keep many requests in flight while they wait on Postgres. EdDSA and
+    HS256 signing and all verification stay on the event loop, since they take
+    microseconds; RS256 signing, which takes milliseconds, and key directory reloads run
+    in the default executor. Run it with an ASGI server, e.g. `hypercorn asgi:app`.
+    Client addresses behind `TRUSTED_PROXIES` reverse proxies are resolved as in `app.create_app`.
+
+    Returns:
+        Quart: The configured application.
+    """
+    app = Quart(__name__)
+    app = cors(app)
+    if TRUSTED_PROXIES:
+        app.asgi_app = ProxyFixMiddleware(app.asgi_app, mode="legacy", trusted_hops=TRUSTED_PROXIES)
+    app.register_blueprint(auth_async_bp)
+    app.register_blueprint(users_async_bp)
+    app.register_blueprint(metrics_async_bp)
+    instrument(app, request, g, is_async=True)
+
+    @app.before_serving
+    async def startup() -> None:
+        await init_async_pool()
+        try:
+            await load_revocations_async()
+        except Exception as e:
+            # Authenticated routes answer 500 until a resync succeeds.
+            logger.error(f"Error loading revocation cache: {str(e)}")
+        app.revocation_resync = asyncio.create_task(_resync_revocations())
+        app.signing_keys_reload = asyncio.create_task(_reload_signing_keys())
+
+    @app.after_serving
+    async def shutdown() -> None:
+        app.revocation_resync.cancel()
+        app.signing_keys_reload.cancel()
+        await close_async_pool()
+
+    return app
+
+
+app = create_async_app()
+
+if __name__ == "__main__":
+    logger.info(
+        f"Starting async app on {FLASK_HOST}:{FLASK_PORT} with debug={FLASK_DEBUG}"
+    )
+    app.run(debug=FLASK_DEBUG, host=FLASK_HOST, port=FLASK_PORT)
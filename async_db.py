@@ -0,0 +1,85 @@
+"""
+File: async_db.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+import asyncpg
+from config import (
+    DB_NAME,
+    DB_USER,
+    DB_PASSWORD,
+    DB_HOST,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_POOL_MAX_LIFETIME,
+    ASYNC_DB_POOL_MAX_SIZE,
+)
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_pool: Optional[asyncpg.Pool] = None
+
+
+async def init_async_pool() -> asyncpg.Pool:
+    """
+    Create the asyncpg connection pool used by the asyncio serving mode.
+
+    Returns:
+        asyncpg.Pool: The process-wide pool.
+
+    Raises:
+        asyncpg.PostgresError: If the initial connections cannot be opened.
+        OSError: If the database server is unreachable.
+    """
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            host=DB_HOST,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=ASYNC_DB_POOL_MAX_SIZE,
+            max_inactive_connection_lifetime=DB_POOL_MAX_LIFETIME,
+        )
+        logger.info(
+            f"Async connection pool created (min={DB_POOL_MIN_SIZE}, max={ASYNC_DB_POOL_MAX_SIZE})."
+        )
+    return _pool
+
+
+async def close_async_pool() -> None:
+    """
+    Close the asyncpg connection pool, if one has been created.
+    """
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+@asynccontextmanager
+async def async_db_connect() -> AsyncIterator[asyncpg.Connection]:
+    """
+    Acquire a pooled asyncpg connection for the duration of an `async with` block.
+
+    Yields:
+        asyncpg.Connection: A pooled connection. Queries use `$1`-style placeholders.
+
+    Raises:
+        RuntimeError: If the pool has not been initialised.
+        asyncio.TimeoutError: If no connection is free within `DB_POOL_TIMEOUT` seconds.
+    """
+    if _pool is None:
+        raise RuntimeError("Async connection pool has not been initialised.")
+    async with _pool.acquire(timeout=DB_POOL_TIMEOUT) as conn:
+        yield conn
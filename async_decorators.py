@@ -0,0 +1,141 @@
+"""
+File: async_decorators.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+from functools import wraps
+from quart import request, jsonify, g
+import jwt
+from async_db import async_db_connect
+from revocation import epoch_is_stale, revocation_cache, token_digest, token_epochs
+import logging
+from tokens import verify_access_token
+from typing import Callable, Any
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def load_revocations_async() -> None:
+    """
+    Rebuild the shared revocation cache from the database without blocking the event loop.
+    """
+    async with async_db_connect() as conn:
+        rows = await conn.fetch(
+            "SELECT token_hash FROM blacklisted_tokens WHERE expires_at > now()"
+        )
+    revocation_cache.load(bytes(row[0]) for row in rows)
+
+
+async def is_token_revoked_async(token: str, claims: dict) -> bool:
+    """
+    Asyncio counterpart of the revocation and token epoch checks in `auth_required`.
+
+    Both checks are answered from the in-process caches when possible; the database is
+    only queried for Bloom filter hits that are not yet confirmed and for users whose
+    epoch is not cached.
+
+    Args:
+        token (str): The encoded JWT.
+        claims (dict): The token's verified claims.
+
+    Returns:
+        bool: True if the token has been revoked or predates the user's token epoch.
+
+    Raises:
+        RuntimeError: If the revocation cache has not been loaded yet.
+    """
+    if not revocation_cache.loaded:
+        raise RuntimeError("Revocation cache has not been loaded.")
+
+    revoked = revocation_cache.lookup(token)
+    if revoked is None:
+        async with async_db_connect() as conn:
+            revoked = (
+                await conn.fetchval(
+                    "SELECT 1 FROM blacklisted_tokens WHERE token_hash = $1",
+                    token_digest(token),
+                )
+                is not None
+            )
+        revocation_cache.confirm(token, revoked, claims.get("exp"))
+    if revoked:
+        return True
+
+    found, epoch = token_epochs.peek(claims["user_id"])
+    if not found:
+        async with async_db_connect() as conn:
+            epoch = await conn.fetchval(
+                "SELECT token_epoch FROM users WHERE user_id = $1",
+                int(claims["user_id"]),
+            )
+        token_epochs.set(claims["user_id"], epoch)
+    return epoch_is_stale(claims, epoch)
+
+
+def async_auth_required(func: Callable) -> Callable:
+    """
+    Asyncio counterpart of `decorators.auth_required` for Quart routes.
+
+    Args:
+        func (Callable): The Quart route coroutine to be decorated.
+
+    Returns:
+        Callable: The decorated coroutine with authentication checks.
+    """
+
+    @wraps(func)
+    async def async_auth_required_wrapper(*args: Any, **kwargs: Any) -> Any:
+        token = request.headers.get("x-access-token")
+        if not token:
+            logger.warning("Unauthorized access attempt: Token is missing.")
+            return jsonify({"Unauthorized": "Token is missing."}), 401
+
+        try:
+            data = verify_access_token(token)
+            g.claims = data
+            g.user_id = data["user_id"]
+            g.token_exp = data.get("exp")
+            g.admin = bool(data.get("admin"))
+        except (jwt.InvalidTokenError, KeyError) as e:
+            logger.warning(
+                f"Unauthorized access attempt: Invalid token. Error: {str(e)}"
+            )
+            return jsonify({"Unauthorized": "Token is invalid."}), 401
+
+        try:
+            revoked = await is_token_revoked_async(token, data)
+        except Exception as e:
+            logger.error(f"Error checking token blacklist: {str(e)}")
+            return jsonify({"Unauthorized": "Error checking token blacklist."}), 500
+        if revoked:
+            logger.warning(
+                f"Unauthorized access attempt: Token has been cancelled. Token: {token}"
+            )
+            return jsonify({"Unauthorized": "Token has been cancelled."}), 401
+
+        logger.info(f"Authorized access for user ID: {g.user_id}")
+        return await func(*args, **kwargs)
+
+    return async_auth_required_wrapper
+
+
+def async_admin_required(func: Callable) -> Callable:
+    """
+    Asyncio counterpart of `decorators.admin_required`. Apply it below `async_auth_required`.
+    """
+
+    @wraps(func)
+    async def async_admin_required_wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not g.get("admin"):
+            logger.warning(f"Forbidden access attempt by user ID: {g.get('user_id')}")
+            return jsonify({"Forbidden": "Administrator access required."}), 403
+        return await func(*args, **kwargs)
+
+    return async_admin_required_wrapper
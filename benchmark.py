@@ -0,0 +1,452 @@
+"""
+File: benchmark.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import datetime
+import gc
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from unittest.mock import patch
+import passwords
+from cache import TTLCache
+from config import BCRYPT_ROUNDS, PASSWORD_HASH_ALGORITHM
+from passwords import BcryptHasher
+from revocation import revocation_cache, token_epochs
+from throttle import Limit, LoginThrottle, MemoryStore, login_throttle
+from tokens import decode_access_token, issue_access_token, verify_access_token
+from validations import valid_email, valid_password, validate_fields
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Allocation differences smaller than this are treated as measurement noise.
+ALLOC_NOISE_BYTES = 256
+
+# Modules whose `db_connect` is replaced by the stand-in database while benchmarking.
+DB_MODULES = (
+    "blueprints.auth.auth",
+    "blueprints.users.users",
+    "introspection",
+    "revocation",
+    "revocation_feed",
+)
+
+EMAIL = "bench@example.com"
+PASSWORD = "Passw0rd!"
+CREATED = datetime.datetime(2024, 1, 1)
+USER_ROW = (1, "Bench", "User", EMAIL, "07700900000", "Belfast", False, CREATED, "1")
+
+
+class StandInCursor:
+    """
+    Cursor answering queries from a fixed list of (substring, result) rules.
+
+    The first rule whose substring occurs in the query provides the result of the
+    following `fetchone`/`fetchall`. Queries matching no rule return no rows.
+    """
+
+    rowcount = 1
+
+    def __init__(self, rules: Sequence[Tuple[str, Any]]) -> None:
+        self.rules = rules
+        self.result: Any = None
+
+    def __enter__(self) -> "StandInCursor":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+    def execute(self, query: str, params: Any = None) -> None:
+        self.result = None
+        for needle, result in self.rules:
+            if needle in query:
+                self.result = result
+                return
+
+    def fetchone(self) -> Any:
+        return self.result
+
+    def fetchall(self) -> list:
+        return self.result or []
+
+
+class StandInConnection:
+    """
+    Connection handing out `StandInCursor`s. Commits and rollbacks do nothing.
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, Any]]) -> None:
+        self.rules = rules
+
+    def cursor(self) -> StandInCursor:
+        return StandInCursor(self.rules)
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+
+class StandInDatabase:
+    """
+    Drop-in replacement for `db.db_connect` that never touches the network.
+
+    Args:
+        rules (Sequence[Tuple[str, Any]]): Query substrings and the rows they return.
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, Any]]) -> None:
+        self.connection = StandInConnection(rules)
+
+    @contextmanager
+    def __call__(self) -> Iterator[StandInConnection]:
+        yield self.connection
+
+
+def measure(
+    func: Callable[[], Any],
+    min_time: float = 0.2,
+    repeat: int = 5,
+    alloc_samples: int = 5,
+) -> dict:
+    """
+    Time a callable and measure how much memory a single call allocates.
+
+    The number of calls per repeat is doubled until one repeat takes at least `min_time`
+    seconds, then `repeat` repeats are timed with the garbage collector disabled, as
+    `timeit` does. Allocations are the peak traced memory of one call above what was
+    already allocated, taking the median over `alloc_samples` calls.
+
+    Args:
+        func (Callable[[], Any]): The operation to measure.
+        min_time (float): Minimum duration of one repeat, in seconds.
+        repeat (int): Number of timed repeats.
+        alloc_samples (int): Number of calls traced for allocations.
+
+    Returns:
+        dict: Per-call `median_ns`, `min_ns`, `mean_ns`, `stdev_ns`, `alloc_bytes` and
+              the number of calls per repeat as `iterations`.
+    """
+    func()
+
+    def run(number: int) -> float:
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            return time.perf_counter() - start
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    number = 1
+    while run(number) < min_time:
+        number *= 2
+
+    timings = [run(number) / number * 1e9 for _ in range(repeat)]
+
+    allocations = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_samples):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            func()
+            allocations.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_ns": statistics.median(timings),
+        "min_ns": min(timings),
+        "mean_ns": statistics.mean(timings),
+        "stdev_ns": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "alloc_bytes": int(statistics.median(allocations)),
+        "iterations": number,
+    }
+
+
+def _route(client: Any, method: str, path: str, expected: int, **kwargs: Any) -> Callable[[], Any]:
+    """Return a callable issuing one request, after checking it reaches the intended branch."""
+    send = getattr(client, method)
+    response = send(path, **kwargs)
+    if response.status_code != expected:
+        raise RuntimeError(
+            f"{method.upper()} {path} returned {response.status_code}, expected {expected}."
+        )
+    return lambda: send(path, **kwargs)
+
+
+def build_cases(client: Any) -> Dict[str, Callable[[], Any]]:
+    """
+    Create every benchmark case.
+
+    Must be called inside `stand_in_environment`, whose test client serves the route cases.
+
+    Args:
+        client (Any): A Flask test client for the application.
+
+    Returns:
+        Dict[str, Callable[[], Any]]: Zero-argument callables keyed by case name.
+    """
+    from flask import Flask, jsonify
+    from decorators import auth_required
+
+    token = issue_access_token(1, False, EMAIL, 0)
+    headers = {"x-access-token": token}
+    user = {
+        "first_name": "Bench",
+        "last_name": "User",
+        "email_address": EMAIL,
+        "mobile_number": "07700900000",
+        "city": "Belfast",
+        "password": PASSWORD,
+    }
+
+    guarded_app = Flask(__name__)
+
+    @guarded_app.route("/guarded")
+    @auth_required
+    def guarded() -> Any:
+        return jsonify({})
+
+    @guarded_app.route("/open")
+    def unguarded() -> Any:
+        return jsonify({})
+
+    guarded_client = guarded_app.test_client()
+    configured = passwords.configured_hasher()
+    stored_hash = configured.hash(PASSWORD)
+
+    class JsonRequest:
+        json = user
+
+    exhausted = LoginThrottle(
+        MemoryStore(16, 60), email=Limit(0, 1e-6, 0), ip=Limit(0, 1e-6, 0), backoff_base=1, backoff_max=1
+    )
+
+    return {
+        "auth_required.baseline": _route(guarded_client, "get", "/open", 200),
+        "auth_required.guarded": _route(guarded_client, "get", "/guarded", 200, headers=headers),
+        "jwt.encode": lambda: issue_access_token(1, False, EMAIL, 0),
+        "jwt.decode": lambda: decode_access_token(token),
+        "jwt.verify_cached": lambda: verify_access_token(token),
+        "validations.valid_email": lambda: valid_email(EMAIL),
+        "validations.valid_password": lambda: valid_password(PASSWORD),
+        "validations.validate_fields": lambda: validate_fields(list(user), JsonRequest),
+        "throttle.allowed": lambda: login_throttle.check(EMAIL, "192.0.2.1"),
+        "throttle.rejected": lambda: exhausted.check(EMAIL, "192.0.2.1"),
+        f"{configured.name}.hash": lambda: configured.hash(PASSWORD),
+        f"{configured.name}.verify": lambda: configured.verify(PASSWORD, stored_hash),
+        "route.register": _route(client, "post", "/api/v1/register", 201, json=user),
+        "route.login": _route(
+            client, "post", "/api/v1/login", 200, json={"email": EMAIL, "password": PASSWORD}
+        ),
+        "route.refresh": _route(
+            client, "post", "/api/v1/token/refresh", 200, json={"refresh_token": "bench"}
+        ),
+        "route.logout": _route(client, "get", "/api/v1/logout", 200, headers=headers),
+        "route.logout_all": _route(client, "post", "/api/v1/logout-all", 200, headers=headers),
+        "route.delete_account": _route(client, "delete", "/api/v1/delete_account", 204, headers=headers),
+        "route.validate_token": _route(client, "post", "/api/v1/validate-token", 200, json={"token": token}),
+        "route.introspect": _route(
+            client, "post", "/api/v1/introspect", 200, json={"tokens": [token] * 10}
+        ),
+        "route.revocations": _route(client, "get", "/api/v1/revocations?after=0", 200),
+        "route.get_user": _route(client, "get", "/api/v1/users/1", 200, headers=headers),
+        "route.update_user": _route(
+            client, "put", "/api/v1/users/1", 200, headers=headers, json={"city": "Derry"}
+        ),
+    }
+
+
+@contextmanager
+def stand_in_environment() -> Iterator[Any]:
+    """
+    Patch the application so that every route can be exercised without external services.
+
+    Database access goes to a `StandInDatabase`, logging is silenced so that results do not
+    depend on where log output goes, and routes hash with bcrypt at the minimum cost so that
+    route cases measure the service's own overhead; the configured hasher is measured by its
+    own cases. Revocations made by the logout and delete cases are not remembered, so every
+    case can reuse the same token, token epochs are cached separately from the process's
+    own cache, and the login throttle never runs out of attempts.
+
+    Yields:
+        Any: A Flask test client for the application.
+    """
+    fast_hasher = BcryptHasher(rounds=4)
+    stored_hash = fast_hasher.hash(PASSWORD)
+    revoked = bytes(32)
+    database = StandInDatabase(
+        [
+            ("INSERT INTO users", (1,)),
+            ("WITH used AS", (1, False, EMAIL, 0)),
+            ("SELECT user_id, admin, password, token_epoch", (1, False, stored_hash, 0)),
+            ("SET token_epoch = token_epoch + 1", (1,)),
+            ("SELECT token_epoch FROM users WHERE user_id", (0,)),
+            ("SELECT user_id FROM users", (1,)),
+            ("token_hash = ANY", []),
+            ("user_id, token_epoch FROM users", [(1, 0)]),
+            ("WHERE revocation_id >", [(1, revoked, datetime.datetime(2100, 1, 1))]),
+            ("SELECT token_hash FROM blacklisted_tokens", []),
+            ("FROM users WHERE user_id", USER_ROW),
+        ]
+    )
+
+    with ExitStack() as stack:
+        stack.callback(logging.disable, logging.NOTSET)
+        logging.disable(logging.CRITICAL)
+        for module in DB_MODULES:
+            stack.enter_context(patch(f"{module}.db_connect", database))
+        stack.enter_context(patch.object(passwords, "password_hasher", fast_hasher))
+        stack.enter_context(patch.object(revocation_cache, "add"))
+        stack.enter_context(patch.object(token_epochs, "set"))
+        stack.enter_context(patch.object(token_epochs, "_cache", TTLCache(1024, 60)))
+        unlimited = Limit(10**12, 10**12, 10**12)
+        stack.enter_context(patch.object(login_throttle, "store", MemoryStore(1024, 60)))
+        stack.enter_context(patch.object(login_throttle, "email", unlimited))
+        stack.enter_context(patch.object(login_throttle, "ip", unlimited))
+        stack.enter_context(patch.object(login_throttle, "enabled", True))
+
+        from app import app
+
+        yield app.test_client()
+
+
+def run_benchmarks(
+    only: Optional[Sequence[str]] = None,
+    min_time: float = 0.2,
+    repeat: int = 5,
+) -> dict:
+    """
+    Run the benchmark suite.
+
+    Args:
+        only (Sequence[str], optional): Run only cases whose name starts with one of these prefixes.
+        min_time (float): Minimum duration of one timed repeat, in seconds.
+        repeat (int): Number of timed repeats per case.
+
+    Returns:
+        dict: Machine-readable results, including the environment they were produced in.
+    """
+    results = {}
+    with stand_in_environment() as client:
+        for name, func in build_cases(client).items():
+            if only and not name.startswith(tuple(only)):
+                continue
+            results[name] = measure(func, min_time=min_time, repeat=repeat)
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "password_hash_algorithm": PASSWORD_HASH_ALGORITHM,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "results": results,
+    }
+
+
+def measure_cold_start(module: str = "app", repeat: int = 5) -> dict:
+    """
+    Measure how long a fresh interpreter takes to import a serving module.
+
+    This is what an autoscaled worker pays before it can accept its first request:
+    interpreter start-up, imports and building the app object. Each sample runs in a new
+    process from the repository root, so nothing is shared with the caller's imports.
+
+    Args:
+        module (str): The module defining the app, e.g. "app" or "asgi".
+        repeat (int): Number of processes started.
+
+    Returns:
+        dict: The median and maximum wall-clock time in milliseconds, and every sample.
+
+    Raises:
+        subprocess.CalledProcessError: If the import fails.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", f"import {module}"],
+            cwd=root,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": statistics.median(samples),
+        "max_ms": max(samples),
+        "samples_ms": samples,
+    }
+
+
+def compare(
+    baseline: dict,
+    current: dict,
+    latency_threshold: float = 0.15,
+    alloc_threshold: float = 0.10,
+) -> List[dict]:
+    """
+    Find cases that got slower or allocate more than in a stored baseline.
+
+    A case regresses when its median latency exceeds the baseline by more than
+    `latency_threshold`, or its allocations exceed the baseline by more than
+    `alloc_threshold` and by more than `ALLOC_NOISE_BYTES`. Cases missing from either
+    run are ignored.
+
+    Args:
+        baseline (dict): Results previously returned by `run_benchmarks`.
+        current (dict): Results of the run being checked.
+        latency_threshold (float): Allowed relative increase of the median latency.
+        alloc_threshold (float): Allowed relative increase of allocations.
+
+    Returns:
+        List[dict]: One entry per regressed metric, with the case name, metric, both values
+                    and the relative change.
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+
+        old, new = previous["median_ns"], result["median_ns"]
+        if old and new > old * (1 + latency_threshold):
+            regressions.append(
+                {"case": name, "metric": "median_ns", "baseline": old, "current": new, "change": new / old - 1}
+            )
+
+        old, new = previous["alloc_bytes"], result["alloc_bytes"]
+        if new - old > max(old * alloc_threshold, ALLOC_NOISE_BYTES):
+            regressions.append(
+                {
+                    "case": name,
+                    "metric": "alloc_bytes",
+                    "baseline": old,
+                    "current": new,
+                    "change": new / old - 1 if old else float("inf"),
+                }
+            )
+    return regressions
@@ -8,15 +8,38 @@ Email: mcardle-j9@ulster.ac.uk
 B-No: B00733578
 """
 
+import json
 import logging
-import bcrypt
-import jwt
 import datetime
-from flask import request, jsonify, make_response, Blueprint
+import math
+from typing import Iterator
+from flask import request, jsonify, make_response, Blueprint, g, Response
 from db import db_connect
+from config import (
+    JWKS_MAX_AGE,
+    TOKEN_INTROSPECTION_MAX_BATCH,
+    REVOCATION_FEED_MAX_LIMIT,
+    REVOCATION_FEED_MAX_WAIT,
+    REVOCATION_FEED_KEEPALIVE,
+    REVOCATION_FEED_RETRY,
+)
 from decorators import auth_required
+from introspection import introspect_tokens
+from passwords import HasherOverloaded, hash_password, check_password, needs_rehash
+from profiles import profile_cache
+from refresh_tokens import (
+    issue_refresh_token,
+    revoke_refresh_token,
+    revoke_user_refresh_tokens,
+    rotate_refresh_token,
+)
+from revocation import revocation_cache, revoke_token, token_digest, token_epochs
+from revocation_feed import fetch_revocations, revocation_notifier, stream_limit
+from signing_keys import keyring
+from throttle import login_throttle
+from timing import span
+from tokens import issue_access_token
 from validations import validate_fields, valid_password, valid_email
-import config
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,6 +47,34 @@ logger = logging.getLogger(__name__)
 auth_bp = Blueprint("auth_bp", __name__)
 
 
+def _upgrade_password_hash(user_id: int, password: str, hashed_password: str) -> None:
+    """
+    Re-hash a password with the configured hasher after a successful login.
+
+    The update only applies if the stored hash has not changed in the meantime. Failures
+    are logged and otherwise ignored so they never fail the login itself.
+
+    Args:
+        user_id (int): The ID of the user who just logged in.
+        password (str): The verified plain-text password.
+        hashed_password (str): The outdated hash currently stored for the user.
+    """
+    try:
+        with span("password_rehash"):
+            new_hash = hash_password(password)
+        with db_connect() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "UPDATE users SET password = %s WHERE user_id = %s AND password = %s",
+                (new_hash, user_id, hashed_password),
+            )
+            conn.commit()
+        logger.info("Upgraded password hash for user ID: %s", user_id)
+    except Exception as e:
+        logger.warning(
+            "Could not upgrade password hash for user ID %s: %s", user_id, str(e)
+        )
+
+
 @auth_bp.route("/api/v1/register", methods=["POST"])
 def register() -> make_response:
     """
@@ -31,16 +82,13 @@ def register() -> make_response:
 
     This route handles user registration by validating input fields, hashing the password,
     and storing the user data in the database. It returns a JWT token upon successful registration.
+    The duplicate-email check and the insert are a single statement, relying on the unique
+    index on lower(email_address).
 
     Returns:
         Tuple[make_response, int]: A Flask response object containing the JWT token or error message,
                                    along with the appropriate HTTP status code.
     """
-    log_data = request.json.copy()
-    if "password" in log_data:
-        log_data["password"] = "**********"
-    logger.info("Registration attempt with data: %s", log_data)
-
     if request.headers.get("x-access-token", None) is not None:
         logger.warning("Registration denied due to existing token.")
         return make_response(
@@ -48,6 +96,11 @@ def register() -> make_response:
             401,
         )
 
+    log_data = request.json.copy()
+    if "password" in log_data:
+        log_data["password"] = "**********"
+    logger.info("Registration attempt with data: %s", log_data)
+
     required_fields = [
         "first_name",
         "last_name",
@@ -89,31 +142,16 @@ def register() -> make_response:
         )
 
     try:
-        conn = db_connect()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT 1 FROM users WHERE email_address = %s LIMIT 1",
-            (request.json["email_address"],),
+        with span("password_hash"):
+            hashed_password = hash_password(request.json["password"])
+    except HasherOverloaded as e:
+        logger.warning("Registration shed, password hashing overloaded: %s", str(e))
+        return make_response(
+            jsonify({"Service unavailable": "Server is busy, try again shortly."}),
+            503,
+            {"Retry-After": "1"},
         )
-        if cursor.fetchone():
-            logger.warning("Email already exists in the database: %s", request.json["email_address"])
-            return make_response(
-                jsonify({"Conflict": "Email address is already in use."}),
-                409, 
-            )
-    except Exception as e:
-        logger.error("Error checking email in database: %s", str(e))
-        return make_response(jsonify({"error": "Internal server error"}), 500)
-    finally:
-        cursor.close()
-        conn.close()
-
-    hashed_password = bcrypt.hashpw(
-        request.json["password"].encode("utf-8"), bcrypt.gensalt()
-    )
-    logger.debug(
-        "Generated hashed password: %s", hashed_password.decode("utf-8")
-    )
+    logger.debug("Generated hashed password: %s", hashed_password)
 
     new_user = {
         "first_name": request.json["first_name"],
@@ -121,55 +159,55 @@ def register() -> make_response:
         "email_address": request.json["email_address"],
         "mobile_number": request.json["mobile_number"],
         "city": request.json["city"],
-        "password": hashed_password.decode("utf-8"),
+        "password": hashed_password,
         "admin": False,
         "creation_time": datetime.datetime.now(),
     }
 
     try:
-        conn = db_connect()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO users (first_name, last_name, email_address, mobile_number, city, password, admin, creation_time)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING user_id;
-        """,
-            (
-                new_user["first_name"],
-                new_user["last_name"],
-                new_user["email_address"],
-                new_user["mobile_number"],
-                new_user["city"],
-                new_user["password"],
-                new_user["admin"],
-                new_user["creation_time"],
-            ),
-        )
+        with db_connect() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO users (first_name, last_name, email_address, mobile_number, city, password, admin, creation_time)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT ((lower(email_address))) DO NOTHING
+                RETURNING user_id;
+            """,
+                (
+                    new_user["first_name"],
+                    new_user["last_name"],
+                    new_user["email_address"],
+                    new_user["mobile_number"],
+                    new_user["city"],
+                    new_user["password"],
+                    new_user["admin"],
+                    new_user["creation_time"],
+                ),
+            )
+            inserted = cursor.fetchone()
+            if inserted is not None:
+                refresh_token = issue_refresh_token(cursor, inserted[0])
+            conn.commit()
 
-        conn.commit()
-        new_user_id = cursor.fetchone()[0]
-        token = jwt.encode(
-            {
-                "user_id": str(new_user_id),
-                "admin": new_user["admin"],
-                "email_address": new_user["email_address"],
-                "exp": datetime.datetime.utcnow()
-                + datetime.timedelta(minutes=30),
-            },
-            config.FLASK_SECRET_KEY,
-            algorithm="HS256",
-        )
+        if inserted is None:
+            logger.warning("Email already exists in the database: %s", new_user["email_address"])
+            return make_response(
+                jsonify({"Conflict": "Email address is already in use."}),
+                409,
+            )
+        new_user_id = inserted[0]
+
+        with span("jwt_encode"):
+            token = issue_access_token(
+                str(new_user_id), new_user["admin"], new_user["email_address"], 0
+            )
 
         logger.info("User registered successfully with ID: %s", new_user_id)
-        return make_response(jsonify({"token": token}), 201)
+        return make_response(jsonify({"token": token, "refresh_token": refresh_token}), 201)
 
     except Exception as e:
         logger.error("Error during registration: %s", str(e))
-        conn.rollback()
         return make_response(jsonify({"error": "Internal server error"}), 500)
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @auth_bp.route("/api/v1/login", methods=["POST"])
@@ -178,7 +216,8 @@ def login() -> make_response:
     Log in an existing user.
 
     This route handles user login by validating the email and password, and returning a JWT token
-    upon successful authentication.
+    upon successful authentication. Attempts are throttled per email address and per client IP
+    before the database is queried or the password is checked.
 
     Returns:
         Tuple[make_response, int]: A Flask response object containing the JWT token or error message,
@@ -197,66 +236,79 @@ def login() -> make_response:
                 jsonify({"Bad request": "Invalid email address"}), 400
             )
 
-        try:
-            conn = db_connect()
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT user_id, admin, password FROM users WHERE email_address = %s",
-                (email,),
+        retry_after = login_throttle.check(email, request.remote_addr)
+        if retry_after:
+            return make_response(
+                jsonify({"Too many requests": "Too many login attempts, try again later."}),
+                429,
+                {"Retry-After": str(math.ceil(retry_after))},
             )
-            user = cursor.fetchone()
+
+        try:
+            with db_connect() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT user_id, admin, password, token_epoch FROM users WHERE lower(email_address) = lower(%s)",
+                    (email,),
+                )
+                user = cursor.fetchone()
 
             if user:
                 user_id = user[0]
                 admin = user[1]
                 hashed_password = user[2]
+                token_epoch = user[3]
 
                 logger.debug(
                     "Retrieved hashed password from DB: %s", hashed_password
                 )
 
-                hashed_password_bytes = hashed_password.encode("utf-8")
-
-                if bcrypt.checkpw(
-                    password.encode("utf-8"), hashed_password_bytes
-                ):
-                    token = jwt.encode(
-                        {
-                            "user_id": user_id,
-                            "admin": admin,
-                            "email_address": email,
-                            "exp": datetime.datetime.now(datetime.timezone.utc)
-                            + datetime.timedelta(minutes=30),
-                        },
-                        config.FLASK_SECRET_KEY,
-                        algorithm="HS256",
-                    )
+                with span("password_verify"):
+                    password_matches = check_password(password, hashed_password)
+
+                if password_matches:
+                    login_throttle.succeeded(email, request.remote_addr)
+                    if needs_rehash(hashed_password):
+                        _upgrade_password_hash(user_id, password, hashed_password)
+
+                    with span("jwt_encode"):
+                        token = issue_access_token(
+                            user_id, admin, email, token_epoch
+                        )
+                    with db_connect() as conn, conn.cursor() as cursor:
+                        refresh_token = issue_refresh_token(cursor, user_id)
+                        conn.commit()
 
                     logger.info(
                         "User logged in successfully with ID: %s", user_id
                     )
-                    response_data = {"token": token}
+                    response_data = {"token": token, "refresh_token": refresh_token}
                     return make_response(jsonify(response_data), 200)
                 else:
                     logger.warning(
                         "Password is incorrect for email: %s", email
                     )
+                    login_throttle.failed(email, request.remote_addr)
                     return make_response(
                         jsonify({"Forbidden": "Password is incorrect"}), 401
                     )
             else:
                 logger.warning("Email address is incorrect: %s", email)
+                login_throttle.failed(email, request.remote_addr)
                 return make_response(
                     jsonify({"Forbidden": "Email address is incorrect"}), 401
                 )
+        except HasherOverloaded as e:
+            logger.warning("Login shed, password hashing overloaded: %s", str(e))
+            return make_response(
+                jsonify({"Service unavailable": "Server is busy, try again shortly."}),
+                503,
+                {"Retry-After": "1"},
+            )
         except Exception as e:
             logger.error("Error during login: %s", str(e))
             return make_response(
                 jsonify({"error": "Internal server error"}), 500
             )
-        finally:
-            cursor.close()
-            conn.close()
 
     logger.warning("Could not verify login attempt.")
     return make_response(
@@ -266,13 +318,53 @@ def login() -> make_response:
     )
 
 
+@auth_bp.route("/api/v1/token/refresh", methods=["POST"])
+def refresh() -> make_response:
+    """
+    Exchange a refresh token for a new access token and a new refresh token.
+
+    The presented refresh token is consumed, so each one can be used once. This needs one
+    indexed statement and no password hashing, which lets clients stay signed in without
+    resubmitting their password when the short-lived access token expires.
+
+    Returns:
+        Tuple[make_response, int]: A Flask response object containing the new tokens or an error message,
+                                   along with the appropriate HTTP status code.
+    """
+    data = request.get_json(silent=True)
+    refresh_token = data.get("refresh_token") if isinstance(data, dict) else None
+    if not isinstance(refresh_token, str) or not refresh_token:
+        logger.warning("Token refresh failed: Refresh token is missing.")
+        return make_response(jsonify({"Bad request": "Refresh token is missing."}), 400)
+
+    try:
+        with db_connect() as conn, conn.cursor() as cursor:
+            rotated = rotate_refresh_token(cursor, refresh_token)
+            conn.commit()
+    except Exception as e:
+        logger.error("Error refreshing token: %s", str(e))
+        return make_response(jsonify({"error": "Internal server error"}), 500)
+
+    if rotated is None:
+        logger.warning("Token refresh failed: Invalid refresh token.")
+        return make_response(jsonify({"Forbidden": "Invalid refresh token."}), 401)
+
+    new_refresh_token, (user_id, admin, email, token_epoch) = rotated
+    with span("jwt_encode"):
+        token = issue_access_token(user_id, admin, email, token_epoch)
+    logger.info("Access token refreshed for user ID: %s", user_id)
+    return make_response(jsonify({"token": token, "refresh_token": new_refresh_token}), 200)
+
+
 @auth_bp.route("/api/v1/logout", methods=["GET"])
 @auth_required
 def logout() -> make_response:
     """
     Log out a user by blacklisting the JWT token.
 
-    This route handles user logout by adding the JWT token to a blacklist in the database.
+    This route handles user logout by adding the JWT token to a blacklist in the database
+    and to this process's revocation cache. A refresh token sent in the `x-refresh-token`
+    header is revoked along with every token rotated from it.
 
     Returns:
         Tuple[make_response, int]: A Flask response object containing a success message or error message,
@@ -286,25 +378,60 @@ def logout() -> make_response:
         )
 
     try:
-        conn = db_connect()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO blacklisted_tokens (token, blacklisted_at) VALUES (%s, %s)",
-            (token, datetime.datetime.now()),
-        )
-        conn.commit()
+        with db_connect() as conn, conn.cursor() as cursor:
+            revoke_token(cursor, token, g.token_exp)
+            refresh_token = request.headers.get("x-refresh-token")
+            if refresh_token:
+                revoke_refresh_token(cursor, refresh_token, g.user_id)
+            conn.commit()
+        revocation_cache.add(token, g.token_exp)
         logger.info(f"Token blacklisted successfully: {token}")
         return make_response(jsonify({"Success": "Logged out."}), 200)
     except Exception as e:
         logger.error(f"Error blacklisting token: {str(e)}")
-        conn.rollback()
         return make_response(
             jsonify({"error": "Internal server error. Error logging out."}),
             500,
         )
-    finally:
-        cursor.close()
-        conn.close()
+
+
+@auth_bp.route("/api/v1/logout-all", methods=["POST"])
+@auth_required
+def logout_all() -> make_response:
+    """
+    Log a user out of every session.
+
+    This route revokes every access token issued to the user so far by bumping the user's
+    token epoch, which costs a single write regardless of how many tokens are outstanding,
+    and deletes the user's refresh tokens.
+
+    Returns:
+        Tuple[make_response, int]: A Flask response object containing a success message or error message,
+                                   along with the appropriate HTTP status code.
+    """
+    try:
+        with db_connect() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "UPDATE users SET token_epoch = token_epoch + 1 WHERE user_id = %s RETURNING token_epoch",
+                (g.user_id,),
+            )
+            row = cursor.fetchone()
+            revoke_user_refresh_tokens(cursor, g.user_id)
+            conn.commit()
+
+        if not row:
+            logger.warning("Logout-all attempt failed: User not found.")
+            return make_response(jsonify({"Not found": "User not found."}), 404)
+
+        token_epochs.set(g.user_id, row[0])
+        logger.info(f"All sessions revoked for user ID: {g.user_id}")
+        return make_response(jsonify({"Success": "Logged out of all sessions."}), 200)
+    except Exception as e:
+        logger.error(f"Error revoking sessions: {str(e)}")
+        return make_response(
+            jsonify({"error": "Internal server error. Error logging out."}),
+            500,
+        )
 
 
 @auth_bp.route("/api/v1/delete_account", methods=["DELETE"])
@@ -321,39 +448,27 @@ def delete_account() -> make_response:
                                    along with the appropriate HTTP status code.
     """
     token = request.headers.get("x-access-token")
+    user_id = g.user_id
 
     try:
-        decoded_token = jwt.decode(
-            token, config.FLASK_SECRET_KEY, algorithms=["HS256"]
-        )
-        user_id = decoded_token.get("user_id")
-
-        if not user_id:
-            logger.warning("Invalid token: No user_id found.")
-            return make_response(jsonify({"Forbidden": "Invalid token."}), 401)
-
-        conn = db_connect()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "SELECT user_id FROM users WHERE user_id = %s", (user_id,)
-        )
-        user = cursor.fetchone()
-
-        if not user:
-            logger.warning("Account deletion attempt failed: User not found.")
-            return make_response(
-                jsonify({"Not found": "User not found."}), 404
+        with db_connect() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT user_id FROM users WHERE user_id = %s", (user_id,)
             )
+            user = cursor.fetchone()
 
-        cursor.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
-        conn.commit()
+            if not user:
+                logger.warning("Account deletion attempt failed: User not found.")
+                return make_response(
+                    jsonify({"Not found": "User not found."}), 404
+                )
 
-        cursor.execute(
-            "INSERT INTO blacklisted_tokens (token, blacklisted_at) VALUES (%s, %s)",
-            (token, datetime.datetime.now()),
-        )
-        conn.commit()
+            cursor.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
+            revoke_token(cursor, token, g.token_exp)
+            conn.commit()
+        revocation_cache.add(token, g.token_exp)
+        token_epochs.set(user_id, None)
+        profile_cache.invalidate(user_id)
 
         logger.info(
             f"Account with user ID {user_id} has been deleted successfully."
@@ -371,10 +486,6 @@ def delete_account() -> make_response:
             500,
         )
 
-    finally:
-        cursor.close()
-        conn.close()
-
 
 @auth_bp.route('/api/v1/validate-token', methods=['POST'])
 def validate_token() -> make_response:
@@ -393,19 +504,177 @@ def validate_token() -> make_response:
         return make_response(jsonify({"valid": False, "Forbidden": "Token is missing."}), 401)
 
     try:
-        conn = db_connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM blacklisted_tokens WHERE token = %s", (token,))
-        bl_token = cursor.fetchone()
+        with db_connect() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM blacklisted_tokens WHERE token_hash = %s", (token_digest(token),))
+            bl_token = cursor.fetchone()
         if bl_token:
             logger.warning("Token validation failed: Token has been cancelled.")
             return make_response(jsonify({"valid": False, "Forbidden": "Token has been cancelled."}), 401)
     except Exception as e:
         logger.error(f"Error checking token blacklist: {str(e)}")
         return make_response(jsonify({"valid": False, "error": "Internal server error"}), 500)
-    finally:
-        cursor.close()
-        conn.close()
 
     logger.info("Token is valid.")
     return make_response(jsonify({"valid": True}), 200)
+
+
+@auth_bp.route("/.well-known/jwks.json", methods=["GET"])
+def jwks() -> make_response:
+    """
+    Publish the public keys that access tokens are signed with.
+
+    Other services verify tokens locally by looking up the key named in a token's `kid`
+    header here. Keys appear before they start signing and stay after they stop, so a
+    copy cached for `JWKS_MAX_AGE` seconds always covers every token in circulation.
+
+    Returns:
+        make_response: A 200 response carrying the JSON Web Key Set, or an empty 304 response.
+    """
+    etag, body = keyring.published()
+    if request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(body, 200)
+        response.content_type = "application/json"
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={JWKS_MAX_AGE}"
+    return response
+
+
+@auth_bp.route("/api/v1/introspect", methods=["POST"])
+def introspect() -> make_response:
+    """
+    Validate a batch of JWT tokens.
+
+    This route verifies each token's signature and expiry locally and resolves revocations
+    for the whole batch with a single database query, returning the decoded claims of every
+    valid token.
+
+    Returns:
+        Tuple[make_response, int]: A Flask response object containing one result per token, in request
+                                   order, or an error message, along with the appropriate HTTP status code.
+    """
+    data = request.get_json(silent=True)
+    tokens = data.get("tokens") if isinstance(data, dict) else None
+    if not isinstance(tokens, list):
+        logger.warning("Token introspection failed: No token list provided.")
+        return make_response(
+            jsonify({"Bad request": "Expected a JSON list of tokens under 'tokens'."}),
+            400,
+        )
+
+    if len(tokens) > TOKEN_INTROSPECTION_MAX_BATCH:
+        logger.warning("Token introspection failed: Batch of %s tokens is too large.", len(tokens))
+        return make_response(
+            jsonify(
+                {
+                    "Unprocessable entity": f"At most {TOKEN_INTROSPECTION_MAX_BATCH} tokens can be introspected per request."
+                }
+            ),
+            422,
+        )
+
+    try:
+        results = introspect_tokens(tokens)
+    except Exception as e:
+        logger.error(f"Error introspecting tokens: {str(e)}")
+        return make_response(jsonify({"error": "Internal server error"}), 500)
+
+    logger.info(
+        "Introspected %s tokens, %s valid.",
+        len(results),
+        sum(1 for result in results if result["valid"]),
+    )
+    return make_response(jsonify({"results": results}), 200)
+
+
+def _revocation_events(after: int, limit: int) -> Iterator[str]:
+    """
+    Yield revocations as server-sent events until the feed cannot be read.
+
+    Args:
+        after (int): The cursor to resume after.
+        limit (int): Maximum number of entries fetched per query.
+
+    Yields:
+        str: One SSE frame per revocation, or a keepalive comment when idle. If reading the
+             feed fails, a final `retry` frame tells the client when to reconnect; it
+             resumes from the last event ID it received.
+    """
+    while True:
+        try:
+            generation = revocation_notifier.generation
+            entries = fetch_revocations(after, limit)
+        except Exception as e:
+            logger.error(f"Error reading revocation feed: {str(e)}")
+            yield f"retry: {int(REVOCATION_FEED_RETRY * 1000)}\n\n"
+            return
+        for entry in entries:
+            after = entry["cursor"]
+            yield f"id: {after}\nevent: revocation\ndata: {json.dumps(entry)}\n\n"
+        if len(entries) < limit and not revocation_notifier.wait(
+            generation, REVOCATION_FEED_KEEPALIVE
+        ):
+            yield ": keepalive\n\n"
+
+
+@auth_bp.route("/api/v1/revocations", methods=["GET"])
+def revocations() -> make_response:
+    """
+    Stream revoked token digests newer than a cursor.
+
+    Consumers keep a local deny-list by repeatedly asking for entries after the last cursor
+    they saw. With `wait`, the request is held open until a new revocation is committed or
+    the wait expires (long-poll). Clients sending `Accept: text/event-stream` receive a
+    server-sent event stream instead, resumable with `Last-Event-ID`. At most
+    `REVOCATION_FEED_MAX_STREAMS` streams are open at once; beyond that the route answers 503.
+
+    Only individually revoked tokens are published; tokens invalidated by a logout-all epoch
+    bump must still be checked through introspection.
+
+    Returns:
+        Tuple[make_response, int]: A Flask response object containing the revocations and the cursor
+                                   to resume from, or an error message, along with the appropriate
+                                   HTTP status code.
+    """
+    try:
+        after = int(request.headers.get("Last-Event-ID") or request.args.get("after", 0))
+        limit = int(request.args.get("limit", REVOCATION_FEED_MAX_LIMIT))
+        wait = float(request.args.get("wait", 0))
+    except ValueError:
+        logger.warning("Revocation feed failed: Invalid query parameters.")
+        return make_response(
+            jsonify({"Bad request": "'after' and 'limit' must be integers and 'wait' a number."}),
+            400,
+        )
+
+    limit = max(1, min(limit, REVOCATION_FEED_MAX_LIMIT))
+    wait = max(0.0, min(wait, REVOCATION_FEED_MAX_WAIT))
+
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        if not stream_limit.acquire():
+            logger.warning("Revocation stream refused: %s streams already open.", stream_limit.limit)
+            return make_response(
+                jsonify({"Service unavailable": "Too many revocation streams, try again shortly."}),
+                503,
+                {"Retry-After": str(math.ceil(REVOCATION_FEED_RETRY))},
+            )
+        response = Response(
+            _revocation_events(after, limit),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        response.call_on_close(stream_limit.release)
+        return response
+
+    try:
+        generation = revocation_notifier.generation
+        entries = fetch_revocations(after, limit)
+        if not entries and wait and revocation_notifier.wait(generation, wait):
+            entries = fetch_revocations(after, limit)
+    except Exception as e:
+        logger.error(f"Error reading revocation feed: {str(e)}")
+        return make_response(jsonify({"error": "Internal server error"}), 500)
+
+    cursor = entries[-1]["cursor"] if entries else after
+    return make_response(jsonify({"revocations": entries, "cursor": cursor}), 200)
@@ -0,0 +1,538 @@
+"""
+File: auth_async.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import json
+import logging
+import datetime
+import math
+from typing import AsyncIterator
+from quart import request, jsonify, Blueprint, Response, g
+from async_db import async_db_connect
+from async_decorators import async_auth_required
+from config import (
+    JWKS_MAX_AGE,
+    TOKEN_INTROSPECTION_MAX_BATCH,
+    REVOCATION_FEED_MAX_LIMIT,
+    REVOCATION_FEED_MAX_WAIT,
+    REVOCATION_FEED_KEEPALIVE,
+    REVOCATION_FEED_RETRY,
+)
+from introspection import apply_revocations, decode_batch, pending_user_ids
+from passwords import (
+    HasherOverloaded,
+    hash_password_async,
+    check_password_async,
+    needs_rehash,
+)
+from profiles import profile_cache
+from refresh_tokens import (
+    REVOKE_FAMILY_ASYNC,
+    REVOKE_USER_ASYNC,
+    issue_refresh_token_async,
+    rotate_refresh_token_async,
+)
+from revocation import (
+    REVOCATION_CHANNEL,
+    REVOCATION_LOCK_KEY,
+    revocation_cache,
+    token_digest,
+    token_epochs,
+    token_expiry,
+)
+from revocation_feed import fetch_revocations_async, revocation_notifier, stream_limit
+from signing_keys import keyring
+from throttle import login_throttle
+from tokens import issue_access_token_async
+from validations import valid_password, valid_email
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+auth_async_bp = Blueprint("auth_bp", __name__)
+
+REGISTRATION_FIELDS = [
+    "first_name",
+    "last_name",
+    "email_address",
+    "mobile_number",
+    "city",
+    "password",
+]
+
+OVERLOADED_RESPONSE = (
+    {"Service unavailable": "Server is busy, try again shortly."},
+    503,
+    {"Retry-After": "1"},
+)
+
+
+async def _revoke_token_async(conn, token: str, exp) -> None:
+    """
+    Asyncio counterpart of `revocation.revoke_token`. Must run inside `conn.transaction()`.
+    """
+    await conn.execute("SELECT pg_advisory_xact_lock($1)", REVOCATION_LOCK_KEY)
+    await conn.execute(
+        """
+        INSERT INTO blacklisted_tokens (token_hash, expires_at, blacklisted_at)
+        VALUES ($1, $2, $3) ON CONFLICT (token_hash) DO NOTHING
+        """,
+        token_digest(token),
+        token_expiry(exp),
+        datetime.datetime.now(),
+    )
+    await conn.execute(f"NOTIFY {REVOCATION_CHANNEL}")
+
+
+async def _upgrade_password_hash_async(
+    user_id: int, password: str, hashed_password: str
+) -> None:
+    """Asyncio counterpart of `auth._upgrade_password_hash`."""
+    try:
+        new_hash = await hash_password_async(password)
+        async with async_db_connect() as conn:
+            await conn.execute(
+                "UPDATE users SET password = $1 WHERE user_id = $2 AND password = $3",
+                new_hash,
+                user_id,
+                hashed_password,
+            )
+        logger.info("Upgraded password hash for user ID: %s", user_id)
+    except Exception as e:
+        logger.warning(
+            "Could not upgrade password hash for user ID %s: %s", user_id, str(e)
+        )
+
+
+@auth_async_bp.route("/api/v1/register", methods=["POST"])
+async def register():
+    """
+    Register a new user. Asyncio counterpart of `auth.register`.
+    """
+    if request.headers.get("x-access-token", None) is not None:
+        logger.warning("Registration denied due to existing token.")
+        return jsonify({"Forbidden": "Can't register with an existing token"}), 401
+
+    data = await request.get_json()
+    log_data = dict(data)
+    if "password" in log_data:
+        log_data["password"] = "**********"
+    logger.info("Registration attempt with data: %s", log_data)
+
+    missing_fields = [field for field in REGISTRATION_FIELDS if field not in data]
+    if missing_fields:
+        logger.warning("Missing fields in registration data: %s", missing_fields)
+        return (
+            jsonify(
+                {
+                    "Unprocessable entity": "Missing fields in JSON data",
+                    "missing_fields": missing_fields,
+                }
+            ),
+            422,
+        )
+
+    if not valid_password(data["password"]):
+        logger.warning("Invalid password format.")
+        return (
+            jsonify(
+                {
+                    "Unprocessable entity": "Invalid password. Password should be 8 to 16 characters and contain at least one numerical and non alpha-numerical character"
+                }
+            ),
+            422,
+        )
+
+    if not valid_email(data["email_address"]):
+        logger.warning("Invalid email address format.")
+        return jsonify({"Unprocessable entity": "Invalid email address."}), 422
+
+    try:
+        hashed_password = await hash_password_async(data["password"])
+    except HasherOverloaded as e:
+        logger.warning("Registration shed, password hashing overloaded: %s", str(e))
+        body, status, headers = OVERLOADED_RESPONSE
+        return jsonify(body), status, headers
+
+    try:
+        async with async_db_connect() as conn, conn.transaction():
+            new_user_id = await conn.fetchval(
+                """
+                INSERT INTO users (first_name, last_name, email_address, mobile_number, city, password, admin, creation_time)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                ON CONFLICT ((lower(email_address))) DO NOTHING
+                RETURNING user_id
+                """,
+                data["first_name"],
+                data["last_name"],
+                data["email_address"],
+                data["mobile_number"],
+                data["city"],
+                hashed_password,
+                False,
+                datetime.datetime.now(),
+            )
+            if new_user_id is not None:
+                refresh_token = await issue_refresh_token_async(conn, new_user_id)
+
+        if new_user_id is None:
+            logger.warning("Email already exists in the database: %s", data["email_address"])
+            return jsonify({"Conflict": "Email address is already in use."}), 409
+
+        token = await issue_access_token_async(str(new_user_id), False, data["email_address"], 0)
+        logger.info("User registered successfully with ID: %s", new_user_id)
+        return jsonify({"token": token, "refresh_token": refresh_token}), 201
+
+    except Exception as e:
+        logger.error("Error during registration: %s", str(e))
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@auth_async_bp.route("/api/v1/login", methods=["POST"])
+async def login():
+    """
+    Log in an existing user. Asyncio counterpart of `auth.login`.
+    """
+    data = await request.get_json()
+    email = data.get("email")
+    password = data.get("password")
+
+    logger.info("Login attempt with email: %s", email)
+
+    if email and password:
+        if not valid_email(email):
+            logger.warning("Invalid email address format during login.")
+            return jsonify({"Bad request": "Invalid email address"}), 400
+
+        retry_after = login_throttle.check(email, request.remote_addr)
+        if retry_after:
+            return (
+                jsonify({"Too many requests": "Too many login attempts, try again later."}),
+                429,
+                {"Retry-After": str(math.ceil(retry_after))},
+            )
+
+        try:
+            async with async_db_connect() as conn:
+                user = await conn.fetchrow(
+                    "SELECT user_id, admin, password, token_epoch FROM users WHERE lower(email_address) = lower($1)",
+                    email,
+                )
+
+            if not user:
+                logger.warning("Email address is incorrect: %s", email)
+                login_throttle.failed(email, request.remote_addr)
+                return jsonify({"Forbidden": "Email address is incorrect"}), 401
+
+            user_id, admin, hashed_password, token_epoch = user
+            if not await check_password_async(password, hashed_password):
+                logger.warning("Password is incorrect for email: %s", email)
+                login_throttle.failed(email, request.remote_addr)
+                return jsonify({"Forbidden": "Password is incorrect"}), 401
+
+            login_throttle.succeeded(email, request.remote_addr)
+            if needs_rehash(hashed_password):
+                await _upgrade_password_hash_async(user_id, password, hashed_password)
+
+            token = await issue_access_token_async(user_id, admin, email, token_epoch)
+            async with async_db_connect() as conn:
+                refresh_token = await issue_refresh_token_async(conn, user_id)
+            logger.info("User logged in successfully with ID: %s", user_id)
+            return jsonify({"token": token, "refresh_token": refresh_token}), 200
+        except HasherOverloaded as e:
+            logger.warning("Login shed, password hashing overloaded: %s", str(e))
+            body, status, headers = OVERLOADED_RESPONSE
+            return jsonify(body), status, headers
+        except Exception as e:
+            logger.error("Error during login: %s", str(e))
+            return jsonify({"error": "Internal server error"}), 500
+
+    logger.warning("Could not verify login attempt.")
+    return "Could not verify", 401, {"WWW-Authenticate": 'Basic realm="Login required"'}
+
+
+@auth_async_bp.route("/api/v1/token/refresh", methods=["POST"])
+async def refresh():
+    """
+    Exchange a refresh token for new tokens. Asyncio counterpart of `auth.refresh`.
+    """
+    data = await request.get_json(silent=True)
+    refresh_token = data.get("refresh_token") if isinstance(data, dict) else None
+    if not isinstance(refresh_token, str) or not refresh_token:
+        logger.warning("Token refresh failed: Refresh token is missing.")
+        return jsonify({"Bad request": "Refresh token is missing."}), 400
+
+    try:
+        async with async_db_connect() as conn:
+            rotated = await rotate_refresh_token_async(conn, refresh_token)
+    except Exception as e:
+        logger.error("Error refreshing token: %s", str(e))
+        return jsonify({"error": "Internal server error"}), 500
+
+    if rotated is None:
+        logger.warning("Token refresh failed: Invalid refresh token.")
+        return jsonify({"Forbidden": "Invalid refresh token."}), 401
+
+    new_refresh_token, (user_id, admin, email, token_epoch) = rotated
+    token = await issue_access_token_async(user_id, admin, email, token_epoch)
+    logger.info("Access token refreshed for user ID: %s", user_id)
+    return jsonify({"token": token, "refresh_token": new_refresh_token}), 200
+
+
+@auth_async_bp.route("/api/v1/logout", methods=["GET"])
+@async_auth_required
+async def logout():
+    """
+    Log out a user by blacklisting the JWT token. Asyncio counterpart of `auth.logout`.
+    """
+    token = request.headers.get("x-access-token")
+    try:
+        async with async_db_connect() as conn, conn.transaction():
+            await _revoke_token_async(conn, token, g.token_exp)
+            refresh_token = request.headers.get("x-refresh-token")
+            if refresh_token:
+                await conn.execute(REVOKE_FAMILY_ASYNC, token_digest(refresh_token), int(g.user_id))
+        revocation_cache.add(token, g.token_exp)
+        logger.info(f"Token blacklisted successfully: {token}")
+        return jsonify({"Success": "Logged out."}), 200
+    except Exception as e:
+        logger.error(f"Error blacklisting token: {str(e)}")
+        return jsonify({"error": "Internal server error. Error logging out."}), 500
+
+
+@auth_async_bp.route("/api/v1/logout-all", methods=["POST"])
+@async_auth_required
+async def logout_all():
+    """
+    Log a user out of every session. Asyncio counterpart of `auth.logout_all`.
+    """
+    try:
+        async with async_db_connect() as conn, conn.transaction():
+            epoch = await conn.fetchval(
+                "UPDATE users SET token_epoch = token_epoch + 1 WHERE user_id = $1 RETURNING token_epoch",
+                int(g.user_id),
+            )
+            await conn.execute(REVOKE_USER_ASYNC, int(g.user_id))
+
+        if epoch is None:
+            logger.warning("Logout-all attempt failed: User not found.")
+            return jsonify({"Not found": "User not found."}), 404
+
+        token_epochs.set(g.user_id, epoch)
+        logger.info(f"All sessions revoked for user ID: {g.user_id}")
+        return jsonify({"Success": "Logged out of all sessions."}), 200
+    except Exception as e:
+        logger.error(f"Error revoking sessions: {str(e)}")
+        return jsonify({"error": "Internal server error. Error logging out."}), 500
+
+
+@auth_async_bp.route("/api/v1/delete_account", methods=["DELETE"])
+@async_auth_required
+async def delete_account():
+    """
+    Delete a user account. Asyncio counterpart of `auth.delete_account`.
+    """
+    token = request.headers.get("x-access-token")
+    user_id = int(g.user_id)
+
+    try:
+        async with async_db_connect() as conn:
+            async with conn.transaction():
+                deleted = await conn.fetchval(
+                    "DELETE FROM users WHERE user_id = $1 RETURNING user_id", user_id
+                )
+                if deleted is None:
+                    logger.warning("Account deletion attempt failed: User not found.")
+                    return jsonify({"Not found": "User not found."}), 404
+                await _revoke_token_async(conn, token, g.token_exp)
+
+        revocation_cache.add(token, g.token_exp)
+        token_epochs.set(user_id, None)
+        profile_cache.invalidate(user_id)
+        logger.info(f"Account with user ID {user_id} has been deleted successfully.")
+        return jsonify({"Created": "Account deleted successfully."}), 204
+
+    except Exception as e:
+        logger.error(f"Error during account deletion: {str(e)}")
+        return jsonify({"error": "Internal server error. Error deleting account."}), 500
+
+
+@auth_async_bp.route("/api/v1/validate-token", methods=["POST"])
+async def validate_token():
+    """
+    Validate a JWT token. Asyncio counterpart of `auth.validate_token`.
+    """
+    data = await request.get_json()
+    token = data.get("token")
+    if not token:
+        logger.warning("Token validation failed: Token is missing.")
+        return jsonify({"valid": False, "Forbidden": "Token is missing."}), 401
+
+    try:
+        async with async_db_connect() as conn:
+            bl_token = await conn.fetchval(
+                "SELECT 1 FROM blacklisted_tokens WHERE token_hash = $1",
+                token_digest(token),
+            )
+        if bl_token:
+            logger.warning("Token validation failed: Token has been cancelled.")
+            return jsonify({"valid": False, "Forbidden": "Token has been cancelled."}), 401
+    except Exception as e:
+        logger.error(f"Error checking token blacklist: {str(e)}")
+        return jsonify({"valid": False, "error": "Internal server error"}), 500
+
+    logger.info("Token is valid.")
+    return jsonify({"valid": True}), 200
+
+
+@auth_async_bp.route("/.well-known/jwks.json", methods=["GET"])
+async def jwks():
+    """Asyncio counterpart of `auth.jwks`."""
+    etag, body = keyring.published()
+    if request.if_none_match.contains_weak(etag):
+        response = Response("", 304)
+    else:
+        response = Response(body, 200, content_type="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={JWKS_MAX_AGE}"
+    return response
+
+
+@auth_async_bp.route("/api/v1/introspect", methods=["POST"])
+async def introspect():
+    """
+    Validate a batch of JWT tokens. Asyncio counterpart of `auth.introspect`.
+    """
+    data = await request.get_json(silent=True)
+    tokens = data.get("tokens") if isinstance(data, dict) else None
+    if not isinstance(tokens, list):
+        logger.warning("Token introspection failed: No token list provided.")
+        return jsonify({"Bad request": "Expected a JSON list of tokens under 'tokens'."}), 400
+
+    if len(tokens) > TOKEN_INTROSPECTION_MAX_BATCH:
+        logger.warning("Token introspection failed: Batch of %s tokens is too large.", len(tokens))
+        return (
+            jsonify(
+                {
+                    "Unprocessable entity": f"At most {TOKEN_INTROSPECTION_MAX_BATCH} tokens can be introspected per request."
+                }
+            ),
+            422,
+        )
+
+    try:
+        results, pending = decode_batch(tokens)
+        if pending:
+            async with async_db_connect() as conn:
+                rows = await conn.fetch(
+                    "SELECT token_hash FROM blacklisted_tokens WHERE token_hash = ANY($1)",
+                    list(set(pending.values())),
+                )
+                epoch_rows = await conn.fetch(
+                    "SELECT user_id, token_epoch FROM users WHERE user_id = ANY($1)",
+                    pending_user_ids(results, pending),
+                )
+            apply_revocations(
+                results,
+                pending,
+                {bytes(row[0]) for row in rows},
+                {row[0]: row[1] for row in epoch_rows},
+            )
+    except Exception as e:
+        logger.error(f"Error introspecting tokens: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+    logger.info(
+        "Introspected %s tokens, %s valid.",
+        len(results),
+        sum(1 for result in results if result["valid"]),
+    )
+    return jsonify({"results": results}), 200
+
+
+async def _revocation_events(after: int, limit: int) -> AsyncIterator[str]:
+    """
+    Asyncio counterpart of `auth._revocation_events`.
+
+    Quart cannot run a callback when a response closes, so the stream reserves its slot
+    in `stream_limit` when it starts and gives it back when it ends; if the limit was
+    reached in between, it sends only a `retry` frame.
+    """
+    retry = f"retry: {int(REVOCATION_FEED_RETRY * 1000)}\n\n"
+    if not stream_limit.acquire():
+        yield retry
+        return
+    try:
+        while True:
+            try:
+                generation = revocation_notifier.generation
+                async with async_db_connect() as conn:
+                    entries = await fetch_revocations_async(conn, after, limit)
+            except Exception as e:
+                logger.error(f"Error reading revocation feed: {str(e)}")
+                yield retry
+                return
+            for entry in entries:
+                after = entry["cursor"]
+                yield f"id: {after}\nevent: revocation\ndata: {json.dumps(entry)}\n\n"
+            if len(entries) < limit and not await revocation_notifier.wait_async(
+                generation, REVOCATION_FEED_KEEPALIVE
+            ):
+                yield ": keepalive\n\n"
+    finally:
+        stream_limit.release()
+
+
+@auth_async_bp.route("/api/v1/revocations", methods=["GET"])
+async def revocations():
+    """
+    Stream revoked token digests newer than a cursor. Asyncio counterpart of
+    `auth.revocations`; long-poll and SSE waits do not hold a thread.
+    """
+    try:
+        after = int(request.headers.get("Last-Event-ID") or request.args.get("after", 0))
+        limit = int(request.args.get("limit", REVOCATION_FEED_MAX_LIMIT))
+        wait = float(request.args.get("wait", 0))
+    except ValueError:
+        logger.warning("Revocation feed failed: Invalid query parameters.")
+        return jsonify({"Bad request": "'after' and 'limit' must be integers and 'wait' a number."}), 400
+
+    limit = max(1, min(limit, REVOCATION_FEED_MAX_LIMIT))
+    wait = max(0.0, min(wait, REVOCATION_FEED_MAX_WAIT))
+
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        if stream_limit.open >= stream_limit.limit:
+            logger.warning("Revocation stream refused: %s streams already open.", stream_limit.limit)
+            return (
+                jsonify({"Service unavailable": "Too many revocation streams, try again shortly."}),
+                503,
+                {"Retry-After": str(math.ceil(REVOCATION_FEED_RETRY))},
+            )
+        response = Response(
+            _revocation_events(after, limit),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        # Streams stay open indefinitely, past Quart's RESPONSE_TIMEOUT.
+        response.timeout = None
+        return response
+
+    try:
+        generation = revocation_notifier.generation
+        async with async_db_connect() as conn:
+            entries = await fetch_revocations_async(conn, after, limit)
+        if not entries and wait and await revocation_notifier.wait_async(generation, wait):
+            async with async_db_connect() as conn:
+                entries = await fetch_revocations_async(conn, after, limit)
+    except Exception as e:
+        logger.error(f"Error reading revocation feed: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+    cursor = entries[-1]["cursor"] if entries else after
+    return jsonify({"revocations": entries, "cursor": cursor}), 200
@@ -0,0 +1,25 @@
+"""
+File: metrics.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+from flask import Blueprint, Response
+from metrics import CONTENT_TYPE, registry
+
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics() -> Response:
+    """
+    Expose the service's metrics in the Prometheus text format.
+
+    Returns:
+        Response: The current value of every registered metric.
+    """
+    return Response(registry.render(), content_type=CONTENT_TYPE)
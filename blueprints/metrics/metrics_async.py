@@ -0,0 +1,22 @@
+"""
+File: metrics_async.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+from quart import Blueprint
+from metrics import CONTENT_TYPE, registry
+
+metrics_async_bp = Blueprint("metrics_async_bp", __name__)
+
+
+@metrics_async_bp.route("/metrics", methods=["GET"])
+async def metrics():
+    """
+    Expose the service's metrics. Asyncio counterpart of `metrics.metrics`.
+    """
+    return registry.render(), 200, {"Content-Type": CONTENT_TYPE}
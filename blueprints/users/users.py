@@ -8,12 +8,24 @@ Email: mcardle-j9@ulster.ac.uk
 B-No: B00733578
 """
 
+import base64
+import binascii
+import datetime
+import io
+import json
 import logging
-import bcrypt
-from flask import jsonify, make_response, Blueprint, request
+from itertools import chain
+from flask import jsonify, make_response, Blueprint, request, Response
+from psycopg2.errors import UniqueViolation
+from config import USERS_LOOKUP_MAX_BATCH, USERS_PAGE_SIZE, USERS_PAGE_MAX_SIZE
+from bulk_export import export_users
+from bulk_import import MEDIA_TYPES, import_users
 from db import db_connect
-from decorators import auth_required
-from typing import Tuple
+from decorators import admin_required, auth_required
+from passwords import HasherOverloaded, hash_password
+from profiles import encode_profile, profile_cache, profile_etag
+from timing import span
+from typing import Any, Iterable, List, Mapping, Optional, Sequence, Tuple
 
 from validations import valid_email, valid_password
 
@@ -22,6 +34,217 @@ logger = logging.getLogger(__name__)
 
 users_bp = Blueprint("users_bp", __name__)
 
+USER_COLUMNS = "user_id, first_name, last_name, email_address, mobile_number, city, admin, creation_time"
+
+
+def serialize_user(user: Sequence) -> dict:
+    """
+    Convert a row selected with `USER_COLUMNS` into the JSON representation of a user.
+
+    Args:
+        user (Sequence): The database row.
+
+    Returns:
+        dict: The user's public profile.
+    """
+    return {
+        "user_id": user[0],
+        "first_name": user[1],
+        "last_name": user[2],
+        "email_address": user[3],
+        "mobile_number": user[4],
+        "city": user[5],
+        "admin": user[6],
+        "creation_time": user[7].isoformat(),
+    }
+
+
+def parse_user_ids(values: Iterable[Any]) -> List[int]:
+    """
+    Validate requested user IDs, dropping duplicates but keeping the request order.
+
+    Args:
+        values (Iterable[Any]): IDs from a JSON list, or comma-separated strings from a query string.
+
+    Returns:
+        List[int]: The distinct user IDs.
+
+    Raises:
+        ValueError: If any ID is not an integer.
+    """
+    user_ids = []
+    for value in values:
+        if isinstance(value, str):
+            user_ids.extend(int(part) for part in value.split(",") if part.strip())
+        elif isinstance(value, int) and not isinstance(value, bool):
+            user_ids.append(value)
+        else:
+            raise ValueError(f"Invalid user ID: {value!r}")
+    return list(dict.fromkeys(user_ids))
+
+
+def collect_users(user_ids: List[int], rows: Iterable[Sequence]) -> dict:
+    """
+    Arrange the rows of a bulk lookup in request order and list the IDs that were not found.
+
+    Args:
+        user_ids (List[int]): The requested IDs, as returned by `parse_user_ids`.
+        rows (Iterable[Sequence]): Rows selected with `USER_COLUMNS`.
+
+    Returns:
+        dict: `users`, the serialized profiles found, and `missing`, the IDs without a user.
+    """
+    found = {row[0]: row for row in rows}
+    return {
+        "users": [serialize_user(found[user_id]) for user_id in user_ids if user_id in found],
+        "missing": [user_id for user_id in user_ids if user_id not in found],
+    }
+
+
+def encode_cursor(row: Sequence) -> str:
+    """
+    Encode the position after a listed user as an opaque continuation cursor.
+
+    Args:
+        row (Sequence): The last row of a page, selected with `USER_COLUMNS`.
+
+    Returns:
+        str: A URL-safe cursor.
+    """
+    payload = json.dumps([row[7].isoformat(), row[0]]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    """
+    Decode a cursor produced by `encode_cursor`.
+
+    Args:
+        cursor (str): The cursor sent by the client.
+
+    Returns:
+        Tuple[datetime.datetime, int]: The creation time and ID of the last user already listed.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        creation_time, user_id = json.loads(payload)
+        return datetime.datetime.fromisoformat(creation_time), int(user_id)
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def listing_params(
+    args: Mapping[str, str]
+) -> Tuple[Optional[str], Optional[bool], Optional[Tuple[datetime.datetime, int]], int]:
+    """
+    Read the filters, cursor and page size of a user listing from a query string.
+
+    Args:
+        args (Mapping[str, str]): The request's query parameters.
+
+    Returns:
+        Tuple: The `city` filter, the `admin` filter, the decoded cursor and the page size.
+
+    Raises:
+        ValueError: If a parameter is invalid.
+    """
+    admin = args.get("admin")
+    if admin is not None:
+        if admin.lower() not in ("true", "false"):
+            raise ValueError("'admin' must be true or false.")
+        admin = admin.lower() == "true"
+    cursor = args.get("cursor")
+    after = decode_cursor(cursor) if cursor else None
+    limit = min(max(int(args.get("limit", USERS_PAGE_SIZE)), 1), USERS_PAGE_MAX_SIZE)
+    return args.get("city"), admin, after, limit
+
+
+def listing_query(
+    city: Optional[str],
+    admin: Optional[bool],
+    after: Optional[Tuple[datetime.datetime, int]],
+    limit: int,
+    numbered: bool = False,
+) -> Tuple[str, list]:
+    """
+    Build the keyset query for one page of users, newest first.
+
+    The page starts right after the (creation_time, user_id) position of the cursor, so
+    the database seeks straight to it on an index instead of skipping rows as OFFSET
+    would. One extra row is fetched to tell whether another page follows.
+
+    Args:
+        city (str, optional): Only list users in this city.
+        admin (bool, optional): Only list administrators, or only non-administrators.
+        after (Tuple[datetime.datetime, int], optional): The decoded cursor.
+        limit (int): The page size.
+        numbered (bool): Use `$1`-style placeholders (asyncpg) instead of `%s` (psycopg2).
+
+    Returns:
+        Tuple[str, list]: The query and its parameters.
+    """
+    params: list = []
+
+    def bind(value: Any) -> str:
+        params.append(value)
+        return f"${len(params)}" if numbered else "%s"
+
+    conditions = []
+    if city is not None:
+        conditions.append(f"city = {bind(city)}")
+    if admin is not None:
+        conditions.append("admin" if admin else "NOT admin")
+    if after is not None:
+        conditions.append(f"(creation_time, user_id) < ({bind(after[0])}, {bind(after[1])})")
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    query = (
+        f"SELECT {USER_COLUMNS} FROM users {where}"
+        f"ORDER BY creation_time DESC, user_id DESC LIMIT {bind(limit + 1)}"
+    )
+    return query, params
+
+
+def listing_page(rows: Sequence[Sequence], limit: int) -> dict:
+    """
+    Serialize one page of a user listing.
+
+    Args:
+        rows (Sequence[Sequence]): Up to `limit + 1` rows returned by the `listing_query` query.
+        limit (int): The page size.
+
+    Returns:
+        dict: `users`, and `next_cursor`, which is None on the last page.
+    """
+    page = rows[:limit]
+    return {
+        "users": [serialize_user(row) for row in page],
+        "next_cursor": encode_cursor(page[-1]) if len(rows) > limit else None,
+    }
+
+
+def profile_response(etag: str, body: bytes) -> make_response:
+    """
+    Answer a profile read, with 304 Not Modified if the client already holds this version.
+
+    Args:
+        etag (str): The profile's entity tag.
+        body (bytes): The serialized profile.
+
+    Returns:
+        make_response: A 200 response carrying the profile, or an empty 304 response.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(body, 200)
+        response.content_type = "application/json"
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
 
 @users_bp.route("/api/v1/users/<int:user_id>", methods=["GET"])
 @auth_required
@@ -31,6 +254,8 @@ def get_user(user_id: int) -> make_response:
 
     This route handler retrieves user information from the database based on the provided user ID.
     It returns the user data as a JSON response if the user is found, or an error message if not.
+    Profiles are served from the in-process profile cache when possible, and responses carry
+    an `ETag` so that clients can revalidate with `If-None-Match` and receive `304`.
 
     Args:
         user_id (int): The ID of the user to fetch data for.
@@ -40,28 +265,26 @@ def get_user(user_id: int) -> make_response:
                                    along with the appropriate HTTP status code.
     """
     logger.info("Fetching data for user ID: %s", user_id)
+    cached = profile_cache.get(user_id)
+    if cached is not None:
+        logger.info("User data served from cache for user ID: %s", user_id)
+        return profile_response(*cached)
+
     try:
-        conn = db_connect()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT user_id, first_name, last_name, email_address, mobile_number, city, admin, creation_time FROM users WHERE user_id = %s",
-            (user_id,),
-        )
-        user = cursor.fetchone()
+        generation = profile_cache.generation()
+        with db_connect() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {USER_COLUMNS}, xmin::text FROM users WHERE user_id = %s",
+                (user_id,),
+            )
+            user = cursor.fetchone()
 
         if user:
-            user_data = {
-                "user_id": user[0],
-                "first_name": user[1],
-                "last_name": user[2],
-                "email_address": user[3],
-                "mobile_number": user[4],
-                "city": user[5],
-                "admin": user[6],
-                "creation_time": user[7].isoformat(),
-            }
+            user_data = serialize_user(user)
             logger.info("User data retrieved successfully: %s", user_data)
-            return make_response(jsonify(user_data), 200)
+            etag, body = profile_etag(user_id, user[8]), encode_profile(user_data)
+            profile_cache.set(user_id, etag, body, generation)
+            return profile_response(etag, body)
         else:
             logger.warning("User not found with ID: %s", user_id)
             return make_response(jsonify({"Not found": "User not found"}), 404)
@@ -70,9 +293,170 @@ def get_user(user_id: int) -> make_response:
         logger.error("Error fetching user data: %s", str(e))
         return make_response(jsonify({"error": "Internal server error"}), 500)
 
-    finally:
-        cursor.close()
-        conn.close()
+
+@users_bp.route("/api/v1/users", methods=["GET"])
+@users_bp.route("/api/v1/users/lookup", methods=["POST"])
+@auth_required
+def lookup_users() -> make_response:
+    """
+    Fetch the profiles of many users with a single query.
+
+    IDs are read from the `ids` query parameter (comma-separated or repeated) on GET, or
+    from an `ids` JSON list on POST, for sets too large for a URL. Profiles are returned in
+    request order, and IDs with no user are listed under `missing`.
+
+    Returns:
+        Tuple[make_response, int]: A Flask response object containing the users found and the missing IDs,
+                                   or an error message, along with the appropriate HTTP status code.
+    """
+    if request.method == "POST":
+        data = request.get_json(silent=True)
+        values = data.get("ids") if isinstance(data, dict) else None
+        if not isinstance(values, list):
+            logger.warning("User lookup failed: No ID list provided.")
+            return make_response(
+                jsonify({"Bad request": "Expected a JSON list of user IDs under 'ids'."}), 400
+            )
+    else:
+        values = request.args.getlist("ids")
+
+    try:
+        user_ids = parse_user_ids(values)
+    except ValueError as e:
+        logger.warning("User lookup failed: %s", str(e))
+        return make_response(jsonify({"Bad request": "User IDs must be integers."}), 400)
+
+    if len(user_ids) > USERS_LOOKUP_MAX_BATCH:
+        logger.warning("User lookup failed: Batch of %s IDs is too large.", len(user_ids))
+        return make_response(
+            jsonify(
+                {
+                    "Unprocessable entity": f"At most {USERS_LOOKUP_MAX_BATCH} users can be looked up per request."
+                }
+            ),
+            422,
+        )
+
+    if not user_ids:
+        return make_response(jsonify({"users": [], "missing": []}), 200)
+
+    try:
+        with db_connect() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {USER_COLUMNS} FROM users WHERE user_id = ANY(%s)",
+                (user_ids,),
+            )
+            rows = cursor.fetchall()
+    except Exception as e:
+        logger.error("Error looking up users: %s", str(e))
+        return make_response(jsonify({"error": "Internal server error"}), 500)
+
+    result = collect_users(user_ids, rows)
+    logger.info(
+        "Looked up %s users, %s missing.", len(user_ids), len(result["missing"])
+    )
+    return make_response(jsonify(result), 200)
+
+
+@users_bp.route("/api/v1/admin/users", methods=["GET"])
+@auth_required
+@admin_required
+def list_users() -> make_response:
+    """
+    List users page by page, newest first. Administrators only.
+
+    Accepts optional `city` and `admin` filters, a page size in `limit`, and the
+    `next_cursor` of the previous page in `cursor`. Every page costs the same, however
+    deep into the listing it is.
+
+    Returns:
+        Tuple[make_response, int]: A Flask response object containing the page of users and the cursor of
+                                   the next page, or an error message, along with the appropriate HTTP
+                                   status code.
+    """
+    try:
+        city, admin, after, limit = listing_params(request.args)
+    except ValueError as e:
+        logger.warning("User listing failed: %s", str(e))
+        return make_response(jsonify({"Bad request": str(e)}), 400)
+
+    query, params = listing_query(city, admin, after, limit)
+    try:
+        with db_connect() as conn, conn.cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+    except Exception as e:
+        logger.error("Error listing users: %s", str(e))
+        return make_response(jsonify({"error": "Internal server error"}), 500)
+
+    logger.info("Listed %s users.", min(len(rows), limit))
+    return make_response(jsonify(listing_page(rows, limit)), 200)
+
+
+@users_bp.route("/api/v1/admin/users/export", methods=["GET"])
+@auth_required
+@admin_required
+def bulk_export_users() -> Response:
+    """
+    Stream every user as NDJSON. Administrators only.
+
+    The body is generated by `bulk_export.export_users` while it is sent, and is gzipped
+    when the client accepts gzip. The first chunk is read before responding, so a
+    database that cannot be reached still produces a 500 rather than an empty export.
+
+    Returns:
+        Response: A streamed Flask response, or an error message with the appropriate HTTP status code.
+    """
+    compress = "gzip" in request.accept_encodings
+    chunks = export_users(compress=compress)
+    try:
+        first = next(chunks, b"")
+    except Exception as e:
+        logger.error("Error exporting users: %s", str(e))
+        return make_response(jsonify({"error": "Internal server error"}), 500)
+
+    response = Response(chain([first], chunks), mimetype="application/x-ndjson")
+    response.headers["Content-Disposition"] = "attachment; filename=users.ndjson"
+    if compress:
+        response.headers["Content-Encoding"] = "gzip"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@users_bp.route("/api/v1/admin/users/import", methods=["POST"])
+@auth_required
+@admin_required
+def bulk_import_users() -> make_response:
+    """
+    Create user accounts in bulk from a CSV or JSON Lines request body. Administrators only.
+
+    The body is streamed through `bulk_import.import_users`, so records are checked and
+    loaded chunk by chunk; records that cannot be imported are listed in the response
+    instead of failing the request.
+
+    Returns:
+        Tuple[make_response, int]: A Flask response object containing the number of users imported and
+                                   the rejected records, or an error message, along with the appropriate
+                                   HTTP status code.
+    """
+    fmt = MEDIA_TYPES.get(request.mimetype)
+    if fmt is None:
+        logger.warning("User import failed: Unsupported content type %s.", request.mimetype)
+        return make_response(
+            jsonify({"Unsupported media type": "Send text/csv or application/x-ndjson."}), 415
+        )
+
+    try:
+        report = import_users(io.TextIOWrapper(request.stream, encoding="utf-8"), fmt)
+    except UnicodeDecodeError:
+        logger.warning("User import failed: Body is not UTF-8.")
+        return make_response(jsonify({"Bad request": "Import must be UTF-8 encoded."}), 400)
+    except Exception as e:
+        logger.error("Error importing users: %s", str(e))
+        return make_response(jsonify({"error": "Internal server error"}), 500)
+
+    logger.info("Imported %s users, rejected %s.", report["imported"], len(report["rejected"]))
+    return make_response(jsonify(report), 200)
 
 
 @users_bp.route("/api/v1/users/<int:user_id>", methods=["PUT"])
@@ -108,14 +492,22 @@ def update_user(user_id: int) -> make_response:
                 if not valid_password(data[field]):
                     logger.warning("Invalid password format for user ID: %s", user_id)
                     return make_response(jsonify({"error": "Invalid password format"}), 422)
-                hashed_password = bcrypt.hashpw(data[field].encode("utf-8"), bcrypt.gensalt())
+                try:
+                    with span("password_hash"):
+                        hashed_password = hash_password(data[field])
+                except HasherOverloaded as e:
+                    logger.warning("Update shed, password hashing overloaded: %s", str(e))
+                    return make_response(
+                        jsonify({"Service unavailable": "Server is busy, try again shortly."}),
+                        503,
+                        {"Retry-After": "1"},
+                    )
                 update_query += f"{field} = %s, "
-                update_values.append(hashed_password.decode("utf-8"))
-            if field == "email_address":
-                if not valid_email(data[field]):
+                update_values.append(hashed_password)
+            else:
+                if field == "email_address" and not valid_email(data[field]):
                     logger.warning("Invalid email format for user ID: %s", user_id)
                     return make_response(jsonify({"error": "Invalid email format"}), 422)
-            else:
                 update_query += f"{field} = %s, "
                 update_values.append(data[field])
 
@@ -128,22 +520,22 @@ def update_user(user_id: int) -> make_response:
     update_values.append(user_id)
 
     try:
-        conn = db_connect()
-        cursor = conn.cursor()
-        cursor.execute(update_query, update_values)
-        conn.commit()
+        with db_connect() as conn, conn.cursor() as cursor:
+            cursor.execute(update_query, update_values)
+            updated = cursor.rowcount
+            conn.commit()
+        profile_cache.invalidate(user_id)
 
-        if cursor.rowcount == 0:
+        if updated == 0:
             logger.warning("User not found with ID: %s", user_id)
             return make_response(jsonify({"Not found": "User not found"}), 404)
 
         logger.info("User data updated successfully for user ID: %s", user_id)
         return make_response(jsonify({"success": "User data updated successfully"}), 200)
 
+    except UniqueViolation:
+        logger.warning("Email address already in use, update rejected for user ID: %s", user_id)
+        return make_response(jsonify({"Conflict": "Email address is already in use."}), 409)
     except Exception as e:
         logger.error("Error updating user data: %s", str(e))
         return make_response(jsonify({"error": "Internal server error"}), 500)
-
-    finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
@@ -0,0 +1,283 @@
+"""
+File: users_async.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import io
+import logging
+from asyncpg.exceptions import UniqueViolationError
+from quart import jsonify, Blueprint, request, Response
+from async_db import async_db_connect
+from async_decorators import async_admin_required, async_auth_required
+from blueprints.users.users import (
+    USER_COLUMNS,
+    collect_users,
+    listing_page,
+    listing_params,
+    listing_query,
+    parse_user_ids,
+    serialize_user,
+)
+from bulk_export_async import export_users_async
+from bulk_import import MEDIA_TYPES
+from bulk_import_async import import_users_async
+from config import USERS_LOOKUP_MAX_BATCH
+from passwords import HasherOverloaded, hash_password_async
+from profiles import encode_profile, profile_cache, profile_etag
+from validations import valid_email, valid_password
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+users_async_bp = Blueprint("users_bp", __name__)
+
+
+def _profile_response(etag: str, body: bytes) -> Response:
+    """Asyncio counterpart of `users.profile_response`."""
+    if request.if_none_match.contains_weak(etag):
+        response = Response("", 304)
+    else:
+        response = Response(body, 200, content_type="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@users_async_bp.route("/api/v1/users/<int:user_id>", methods=["GET"])
+@async_auth_required
+async def get_user(user_id: int):
+    """
+    Fetch and return user data for a given user ID. Asyncio counterpart of `users.get_user`.
+    """
+    logger.info("Fetching data for user ID: %s", user_id)
+    cached = profile_cache.get(user_id)
+    if cached is not None:
+        logger.info("User data served from cache for user ID: %s", user_id)
+        return _profile_response(*cached)
+
+    try:
+        generation = profile_cache.generation()
+        async with async_db_connect() as conn:
+            user = await conn.fetchrow(
+                f"SELECT {USER_COLUMNS}, xmin::text FROM users WHERE user_id = $1", user_id
+            )
+
+        if user:
+            user_data = serialize_user(user)
+            logger.info("User data retrieved successfully: %s", user_data)
+            etag, body = profile_etag(user_id, user[8]), encode_profile(user_data)
+            profile_cache.set(user_id, etag, body, generation)
+            return _profile_response(etag, body)
+        else:
+            logger.warning("User not found with ID: %s", user_id)
+            return jsonify({"Not found": "User not found"}), 404
+
+    except Exception as e:
+        logger.error("Error fetching user data: %s", str(e))
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@users_async_bp.route("/api/v1/users", methods=["GET"])
+@users_async_bp.route("/api/v1/users/lookup", methods=["POST"])
+@async_auth_required
+async def lookup_users():
+    """
+    Fetch the profiles of many users with a single query. Asyncio counterpart of `users.lookup_users`.
+    """
+    if request.method == "POST":
+        data = await request.get_json(silent=True)
+        values = data.get("ids") if isinstance(data, dict) else None
+        if not isinstance(values, list):
+            logger.warning("User lookup failed: No ID list provided.")
+            return jsonify({"Bad request": "Expected a JSON list of user IDs under 'ids'."}), 400
+    else:
+        values = request.args.getlist("ids")
+
+    try:
+        user_ids = parse_user_ids(values)
+    except ValueError as e:
+        logger.warning("User lookup failed: %s", str(e))
+        return jsonify({"Bad request": "User IDs must be integers."}), 400
+
+    if len(user_ids) > USERS_LOOKUP_MAX_BATCH:
+        logger.warning("User lookup failed: Batch of %s IDs is too large.", len(user_ids))
+        return (
+            jsonify(
+                {
+                    "Unprocessable entity": f"At most {USERS_LOOKUP_MAX_BATCH} users can be looked up per request."
+                }
+            ),
+            422,
+        )
+
+    if not user_ids:
+        return jsonify({"users": [], "missing": []}), 200
+
+    try:
+        async with async_db_connect() as conn:
+            rows = await conn.fetch(
+                f"SELECT {USER_COLUMNS} FROM users WHERE user_id = ANY($1::int[])",
+                user_ids,
+            )
+    except Exception as e:
+        logger.error("Error looking up users: %s", str(e))
+        return jsonify({"error": "Internal server error"}), 500
+
+    result = collect_users(user_ids, rows)
+    logger.info("Looked up %s users, %s missing.", len(user_ids), len(result["missing"]))
+    return jsonify(result), 200
+
+
+@users_async_bp.route("/api/v1/admin/users", methods=["GET"])
+@async_auth_required
+@async_admin_required
+async def list_users():
+    """
+    List users page by page, newest first. Asyncio counterpart of `users.list_users`.
+    """
+    try:
+        city, admin, after, limit = listing_params(request.args)
+    except ValueError as e:
+        logger.warning("User listing failed: %s", str(e))
+        return jsonify({"Bad request": str(e)}), 400
+
+    query, params = listing_query(city, admin, after, limit, numbered=True)
+    try:
+        async with async_db_connect() as conn:
+            rows = await conn.fetch(query, *params)
+    except Exception as e:
+        logger.error("Error listing users: %s", str(e))
+        return jsonify({"error": "Internal server error"}), 500
+
+    logger.info("Listed %s users.", min(len(rows), limit))
+    return jsonify(listing_page(rows, limit)), 200
+
+
+@users_async_bp.route("/api/v1/admin/users/export", methods=["GET"])
+@async_auth_required
+@async_admin_required
+async def bulk_export_users():
+    """
+    Stream every user as NDJSON. Asyncio counterpart of `users.bulk_export_users`.
+    """
+    compress = "gzip" in request.accept_encodings
+    chunks = export_users_async(compress=compress)
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    except Exception as e:
+        logger.error("Error exporting users: %s", str(e))
+        return jsonify({"error": "Internal server error"}), 500
+
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    response = Response(body(), mimetype="application/x-ndjson")
+    response.headers["Content-Disposition"] = "attachment; filename=users.ndjson"
+    if compress:
+        response.headers["Content-Encoding"] = "gzip"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@users_async_bp.route("/api/v1/admin/users/import", methods=["POST"])
+@async_auth_required
+@async_admin_required
+async def bulk_import_users():
+    """
+    Create user accounts in bulk. Asyncio counterpart of `users.bulk_import_users`.
+    """
+    fmt = MEDIA_TYPES.get(request.mimetype)
+    if fmt is None:
+        logger.warning("User import failed: Unsupported content type %s.", request.mimetype)
+        return jsonify({"Unsupported media type": "Send text/csv or application/x-ndjson."}), 415
+
+    try:
+        body = (await request.get_data()).decode("utf-8")
+        report = await import_users_async(io.StringIO(body), fmt)
+    except UnicodeDecodeError:
+        logger.warning("User import failed: Body is not UTF-8.")
+        return jsonify({"Bad request": "Import must be UTF-8 encoded."}), 400
+    except Exception as e:
+        logger.error("Error importing users: %s", str(e))
+        return jsonify({"error": "Internal server error"}), 500
+
+    logger.info("Imported %s users, rejected %s.", report["imported"], len(report["rejected"]))
+    return jsonify(report), 200
+
+
+@users_async_bp.route("/api/v1/users/<int:user_id>", methods=["PUT"])
+@async_auth_required
+async def update_user(user_id: int):
+    """
+    Update user data for a given user ID. Asyncio counterpart of `users.update_user`.
+    """
+    logger.info("Updating data for user ID: %s", user_id)
+    data = await request.get_json()
+
+    if not data:
+        logger.warning("No data provided for update for user ID: %s", user_id)
+        return jsonify({"error": "No data provided"}), 400
+
+    fields_to_update = ["first_name", "last_name", "email_address", "mobile_number", "city", "password"]
+    assignments = []
+    update_values = []
+
+    for field in fields_to_update:
+        if field in data:
+            if field == "password":
+                if not valid_password(data[field]):
+                    logger.warning("Invalid password format for user ID: %s", user_id)
+                    return jsonify({"error": "Invalid password format"}), 422
+                try:
+                    value = await hash_password_async(data[field])
+                except HasherOverloaded as e:
+                    logger.warning("Update shed, password hashing overloaded: %s", str(e))
+                    return (
+                        jsonify({"Service unavailable": "Server is busy, try again shortly."}),
+                        503,
+                        {"Retry-After": "1"},
+                    )
+            else:
+                if field == "email_address" and not valid_email(data[field]):
+                    logger.warning("Invalid email format for user ID: %s", user_id)
+                    return jsonify({"error": "Invalid email format"}), 422
+                value = data[field]
+            update_values.append(value)
+            assignments.append(f"{field} = ${len(update_values)}")
+
+    if not update_values:
+        logger.warning("No valid fields provided for update for user ID: %s", user_id)
+        return jsonify({"error": "No valid fields provided"}), 400
+
+    update_values.append(user_id)
+    update_query = (
+        f"UPDATE users SET {', '.join(assignments)} WHERE user_id = ${len(update_values)}"
+    )
+
+    try:
+        async with async_db_connect() as conn:
+            status = await conn.execute(update_query, *update_values)
+        profile_cache.invalidate(user_id)
+
+        if status == "UPDATE 0":
+            logger.warning("User not found with ID: %s", user_id)
+            return jsonify({"Not found": "User not found"}), 404
+
+        logger.info("User data updated successfully for user ID: %s", user_id)
+        return jsonify({"success": "User data updated successfully"}), 200
+
+    except UniqueViolationError:
+        logger.warning("Email address already in use, update rejected for user ID: %s", user_id)
+        return jsonify({"Conflict": "Email address is already in use."}), 409
+    except Exception as e:
+        logger.error("Error updating user data: %s", str(e))
+        return jsonify({"error": "Internal server error"}), 500
@@ -0,0 +1,87 @@
+"""
+File: bulk_export.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import json
+import zlib
+from typing import Iterator, List, Sequence
+from config import USERS_EXPORT_FETCH_SIZE
+from db import db_connect
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = (
+    "user_id",
+    "first_name",
+    "last_name",
+    "email_address",
+    "mobile_number",
+    "city",
+    "admin",
+    "creation_time",
+)
+EXPORT_QUERY = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM users ORDER BY user_id"
+
+
+def encode_rows(rows: Sequence[Sequence]) -> bytes:
+    """
+    Encode a batch of exported rows as NDJSON, one user per line.
+
+    Args:
+        rows (Sequence[Sequence]): Rows selected by `EXPORT_QUERY`.
+
+    Returns:
+        bytes: The UTF-8 encoded lines.
+    """
+    lines: List[str] = []
+    for row in rows:
+        record = dict(zip(EXPORT_COLUMNS, row))
+        record["creation_time"] = record["creation_time"].isoformat()
+        lines.append(json.dumps(record, separators=(",", ":")))
+        lines.append("\n")
+    return "".join(lines).encode("utf-8")
+
+
+def export_users(
+    fetch_size: int = USERS_EXPORT_FETCH_SIZE, compress: bool = False
+) -> Iterator[bytes]:
+    """
+    Stream every user as NDJSON, optionally gzip-compressed.
+
+    Rows are read through a named (server-side) cursor `fetch_size` at a time and
+    encoded batch by batch, so memory stays flat however large the table is. The
+    connection is held until the generator is exhausted or closed, and the whole
+    export reads one consistent snapshot.
+
+    Args:
+        fetch_size (int): Rows fetched from the server per round trip.
+        compress (bool): Gzip the output.
+
+    Yields:
+        bytes: Chunks of the export, one per batch of rows.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    exported = 0
+    with db_connect() as conn, conn.cursor(name="user_export") as cursor:
+        cursor.execute(EXPORT_QUERY)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            exported += len(rows)
+            chunk = encode_rows(rows)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    if compressor is not None:
+        yield compressor.flush()
+    logger.info("Exported %s users.", exported)
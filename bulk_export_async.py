@@ -0,0 +1,45 @@
+"""
+File: bulk_export_async.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import zlib
+from typing import AsyncIterator
+from async_db import async_db_connect
+from bulk_export import EXPORT_QUERY, encode_rows
+from config import USERS_EXPORT_FETCH_SIZE
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def export_users_async(
+    fetch_size: int = USERS_EXPORT_FETCH_SIZE, compress: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Asyncio counterpart of `bulk_export.export_users`, using an asyncpg cursor.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    exported = 0
+    async with async_db_connect() as conn:
+        async with conn.transaction(readonly=True):
+            cursor = await conn.cursor(EXPORT_QUERY)
+            while True:
+                rows = await cursor.fetch(fetch_size)
+                if not rows:
+                    break
+                exported += len(rows)
+                chunk = encode_rows(rows)
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+    if compressor is not None:
+        yield compressor.flush()
+    logger.info("Exported %s users.", exported)
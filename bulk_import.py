@@ -0,0 +1,233 @@
+"""
+File: bulk_import.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import csv
+import datetime
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+from config import USERS_IMPORT_CHUNK_SIZE, USERS_IMPORT_HASH_WORKERS
+from db import db_connect
+from passwords import hash_passwords
+from validations import valid_email, valid_password
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl")
+MEDIA_TYPES = {"text/csv": "csv", "application/x-ndjson": "jsonl", "application/jsonl": "jsonl"}
+REQUIRED_FIELDS = ("first_name", "last_name", "email_address", "mobile_number", "city", "password")
+FIELD_LENGTHS = {"first_name": 50, "last_name": 50, "email_address": 100, "mobile_number": 20, "city": 50}
+STAGING_COLUMNS = ("line",) + REQUIRED_FIELDS
+
+CREATE_STAGING = """
+    CREATE TEMP TABLE user_import (
+        line INTEGER NOT NULL,
+        first_name VARCHAR(50) NOT NULL,
+        last_name VARCHAR(50) NOT NULL,
+        email_address VARCHAR(100) NOT NULL,
+        mobile_number VARCHAR(20) NOT NULL,
+        city VARCHAR(50) NOT NULL,
+        password VARCHAR(255) NOT NULL
+    ) ON COMMIT DROP
+"""
+COPY_STAGING = f"COPY user_import ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+INSERT_USERS = """
+    INSERT INTO users (first_name, last_name, email_address, mobile_number, city, password, admin, creation_time)
+    SELECT first_name, last_name, email_address, mobile_number, city, password, FALSE, {creation_time}
+    FROM user_import ORDER BY line
+    ON CONFLICT ((lower(email_address))) DO NOTHING
+    RETURNING lower(email_address)
+"""
+
+Record = Tuple[int, Any]
+Row = Tuple[Any, ...]
+
+
+def read_records(stream: TextIO, fmt: str) -> Iterator[Record]:
+    """
+    Stream user records from CSV (with a header row) or JSON Lines input.
+
+    Args:
+        stream (TextIO): The input.
+        fmt (str): Either "csv" or "jsonl".
+
+    Yields:
+        Tuple[int, Any]: The input line number and the parsed record, or None for a JSON line that
+                         could not be parsed.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "jsonl":
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except ValueError:
+                yield line, None
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def check_record(record: Any) -> Optional[str]:
+    """
+    Check a record with the same rules as registration.
+
+    Args:
+        record (Any): A record produced by `read_records`.
+
+    Returns:
+        str, optional: Why the record is rejected, or None if it can be imported.
+    """
+    if not isinstance(record, dict):
+        return "Malformed record."
+    missing = [field for field in REQUIRED_FIELDS if not isinstance(record.get(field), str) or not record[field]]
+    if missing:
+        return f"Missing fields: {', '.join(missing)}."
+    if not valid_password(record["password"]):
+        return "Invalid password."
+    if not valid_email(record["email_address"]):
+        return "Invalid email address."
+    too_long = [field for field, length in FIELD_LENGTHS.items() if len(record[field]) > length]
+    if too_long:
+        return f"Fields too long: {', '.join(too_long)}."
+    return None
+
+
+def reject(line: int, record: Any, reason: str) -> dict:
+    """Describe a record that is not imported."""
+    email = record.get("email_address") if isinstance(record, dict) else None
+    return {"line": line, "email_address": email if isinstance(email, str) else None, "reason": reason}
+
+
+def chunked(records: Iterable[Record], size: int) -> Iterator[List[Record]]:
+    """Group records into lists of at most `size`."""
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def screen_chunk(chunk: List[Record], seen: Set[str]) -> Tuple[List[Record], List[dict]]:
+    """Split a chunk into importable records and rejects, skipping emails seen earlier in the import."""
+    accepted, rejected = [], []
+    for line, record in chunk:
+        reason = check_record(record)
+        if reason is None:
+            email = record["email_address"].lower()
+            if email in seen:
+                reason = "Duplicate email address in import."
+            else:
+                seen.add(email)
+        if reason is None:
+            accepted.append((line, record))
+        else:
+            rejected.append(reject(line, record, reason))
+    return accepted, rejected
+
+
+def build_rows(accepted: List[Record], hashes: List[str]) -> List[Row]:
+    """Pair accepted records with their password hashes as staging table rows."""
+    return [
+        (line, *(record[field] for field in REQUIRED_FIELDS[:-1]), hashed)
+        for (line, record), hashed in zip(accepted, hashes)
+    ]
+
+
+def tally(report: dict, rows: List[Row], inserted: Set[str]) -> None:
+    """Count the inserted rows and reject the ones whose email was already registered."""
+    report["imported"] += len(inserted)
+    report["rejected"].extend(
+        reject(row[0], {"email_address": row[3]}, "Email address is already in use.")
+        for row in rows
+        if row[3].lower() not in inserted
+    )
+
+
+def _copy_buffer(rows: List[Row]) -> io.StringIO:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+
+def _load(rows: List[Row]) -> Set[str]:
+    """COPY one chunk into a staging table and move it into users in one transaction."""
+    with db_connect() as conn, conn.cursor() as cursor:
+        cursor.execute(CREATE_STAGING)
+        cursor.copy_expert(COPY_STAGING, _copy_buffer(rows))
+        cursor.execute(INSERT_USERS.format(creation_time="%s"), (datetime.datetime.now(),))
+        inserted = {email for (email,) in cursor.fetchall()}
+        conn.commit()
+    return inserted
+
+
+def import_users(
+    stream: TextIO,
+    fmt: str,
+    chunk_size: int = USERS_IMPORT_CHUNK_SIZE,
+    workers: int = USERS_IMPORT_HASH_WORKERS,
+) -> dict:
+    """
+    Create user accounts in bulk from CSV or JSON Lines input.
+
+    The input is streamed in chunks of `chunk_size` records. Each record is checked like
+    a registration, its password hashed on a pool of `workers` threads, and the chunk
+    loaded with a single COPY into a staging table followed by one INSERT that skips
+    emails already registered. Bad records, duplicates and chunks the database refuses
+    are reported rather than aborting the import; chunks already loaded stay committed.
+
+    Args:
+        stream (TextIO): The input.
+        fmt (str): Either "csv" or "jsonl".
+        chunk_size (int): Records per COPY.
+        workers (int): Password hashing threads.
+
+    Returns:
+        dict: `imported`, the number of accounts created, and `rejected`, a list of
+              `line`, `email_address` and `reason` for every record not imported.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+    report = {"imported": 0, "rejected": []}
+    seen: Set[str] = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="import-hasher") as executor:
+        for chunk in chunked(read_records(stream, fmt), chunk_size):
+            accepted, rejected = screen_chunk(chunk, seen)
+            report["rejected"].extend(rejected)
+            if not accepted:
+                continue
+            rows = build_rows(accepted, hash_passwords([record["password"] for _, record in accepted], executor))
+            try:
+                inserted = _load(rows)
+            except Exception as e:
+                logger.error("Error loading import chunk at line %s: %s", rows[0][0], str(e))
+                report["rejected"].extend(
+                    reject(row[0], {"email_address": row[3]}, "Could not be stored.") for row in rows
+                )
+                continue
+            tally(report, rows, inserted)
+            logger.info("Imported %s users so far.", report["imported"])
+    return report
@@ -0,0 +1,78 @@
+"""
+File: bulk_import_async.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Set, TextIO
+from async_db import async_db_connect
+from bulk_import import (
+    CREATE_STAGING,
+    FORMATS,
+    INSERT_USERS,
+    STAGING_COLUMNS,
+    Row,
+    build_rows,
+    chunked,
+    read_records,
+    reject,
+    screen_chunk,
+    tally,
+)
+from config import USERS_IMPORT_CHUNK_SIZE, USERS_IMPORT_HASH_WORKERS
+from passwords import hash_passwords_async
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def _load(rows: List[Row]) -> Set[str]:
+    """Asyncio counterpart of `bulk_import._load`, using asyncpg's binary COPY."""
+    async with async_db_connect() as conn:
+        async with conn.transaction():
+            await conn.execute(CREATE_STAGING)
+            await conn.copy_records_to_table("user_import", records=rows, columns=STAGING_COLUMNS)
+            records = await conn.fetch(INSERT_USERS.format(creation_time="$1"), datetime.datetime.now())
+    return {record[0] for record in records}
+
+
+async def import_users_async(
+    stream: TextIO,
+    fmt: str,
+    chunk_size: int = USERS_IMPORT_CHUNK_SIZE,
+    workers: int = USERS_IMPORT_HASH_WORKERS,
+) -> dict:
+    """
+    Asyncio counterpart of `bulk_import.import_users`.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+    report = {"imported": 0, "rejected": []}
+    seen: Set[str] = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="import-hasher") as executor:
+        for chunk in chunked(read_records(stream, fmt), chunk_size):
+            accepted, rejected = screen_chunk(chunk, seen)
+            report["rejected"].extend(rejected)
+            if not accepted:
+                continue
+            hashes = await hash_passwords_async([record["password"] for _, record in accepted], executor)
+            rows = build_rows(accepted, hashes)
+            try:
+                inserted = await _load(rows)
+            except Exception as e:
+                logger.error("Error loading import chunk at line %s: %s", rows[0][0], str(e))
+                report["rejected"].extend(
+                    reject(row[0], {"email_address": row[3]}, "Could not be stored.") for row in rows
+                )
+                continue
+            tally(report, rows, inserted)
+            logger.info("Imported %s users so far.", report["imported"])
+    return report
@@ -18,9 +18,93 @@ DB_NAME = os.getenv('DB_NAME')
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_HOST = os.getenv('DB_HOST')
+MIGRATIONS_DIR = os.getenv('MIGRATIONS_DIR', 'sql')
+MIGRATIONS_TABLE = os.getenv('MIGRATIONS_TABLE', 'flyway_schema_history')
+
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+DB_POOL_CHECK_IDLE = float(os.getenv('DB_POOL_CHECK_IDLE', 30))
+ASYNC_DB_POOL_MAX_SIZE = int(os.getenv('ASYNC_DB_POOL_MAX_SIZE', 20))
+
+REVOCATION_BLOOM_CAPACITY = int(os.getenv('REVOCATION_BLOOM_CAPACITY', 100000))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv('REVOCATION_BLOOM_ERROR_RATE', 0.001))
+REVOCATION_LRU_SIZE = int(os.getenv('REVOCATION_LRU_SIZE', 10000))
+REVOCATION_RESYNC_INTERVAL = float(os.getenv('REVOCATION_RESYNC_INTERVAL', 30))
+TOKEN_EPOCH_CACHE_SIZE = int(os.getenv('TOKEN_EPOCH_CACHE_SIZE', 10000))
+TOKEN_EPOCH_CACHE_TTL = float(os.getenv('TOKEN_EPOCH_CACHE_TTL', 30))
+TOKEN_INTROSPECTION_MAX_BATCH = int(os.getenv('TOKEN_INTROSPECTION_MAX_BATCH', 500))
+USERS_LOOKUP_MAX_BATCH = int(os.getenv('USERS_LOOKUP_MAX_BATCH', 500))
+USERS_IMPORT_CHUNK_SIZE = int(os.getenv('USERS_IMPORT_CHUNK_SIZE', 1000))
+USERS_IMPORT_HASH_WORKERS = int(os.getenv('USERS_IMPORT_HASH_WORKERS', os.cpu_count() or 1))
+USERS_EXPORT_FETCH_SIZE = int(os.getenv('USERS_EXPORT_FETCH_SIZE', 2000))
+USERS_PAGE_SIZE = int(os.getenv('USERS_PAGE_SIZE', 50))
+USERS_PAGE_MAX_SIZE = int(os.getenv('USERS_PAGE_MAX_SIZE', 200))
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 10000))
+PROFILE_CACHE_TTL = float(os.getenv('PROFILE_CACHE_TTL', 30))
+CLAIMS_CACHE_SIZE = int(os.getenv('CLAIMS_CACHE_SIZE', 10000))
+CLAIMS_CACHE_TTL = float(os.getenv('CLAIMS_CACHE_TTL', 900))
+REVOCATION_FEED_MAX_LIMIT = int(os.getenv('REVOCATION_FEED_MAX_LIMIT', 1000))
+REVOCATION_FEED_MAX_WAIT = float(os.getenv('REVOCATION_FEED_MAX_WAIT', 30))
+REVOCATION_FEED_KEEPALIVE = float(os.getenv('REVOCATION_FEED_KEEPALIVE', 15))
+# Each server-sent event stream holds a worker thread (WSGI) for as long as it is open.
+REVOCATION_FEED_MAX_STREAMS = int(os.getenv('REVOCATION_FEED_MAX_STREAMS', 16))
+REVOCATION_FEED_RETRY = float(os.getenv('REVOCATION_FEED_RETRY', 5))
+
+LOGIN_THROTTLE_ENABLED = os.getenv('LOGIN_THROTTLE_ENABLED', 'true').lower() == 'true'
+LOGIN_EMAIL_BURST = int(os.getenv('LOGIN_EMAIL_BURST', 5))
+LOGIN_EMAIL_RATE = float(os.getenv('LOGIN_EMAIL_RATE', 0.1))
+LOGIN_EMAIL_FREE_FAILURES = int(os.getenv('LOGIN_EMAIL_FREE_FAILURES', 3))
+LOGIN_IP_BURST = int(os.getenv('LOGIN_IP_BURST', 50))
+LOGIN_IP_RATE = float(os.getenv('LOGIN_IP_RATE', 1))
+LOGIN_IP_FREE_FAILURES = int(os.getenv('LOGIN_IP_FREE_FAILURES', 20))
+LOGIN_BACKOFF_BASE = float(os.getenv('LOGIN_BACKOFF_BASE', 1))
+LOGIN_BACKOFF_MAX = float(os.getenv('LOGIN_BACKOFF_MAX', 900))
+LOGIN_THROTTLE_SIZE = int(os.getenv('LOGIN_THROTTLE_SIZE', 100000))
+LOGIN_THROTTLE_TTL = float(os.getenv('LOGIN_THROTTLE_TTL', 3600))
+LOGIN_THROTTLE_REDIS_URL = os.getenv('LOGIN_THROTTLE_REDIS_URL')
+# Seconds an email and IP pair skips the shared per-email bucket after logging in successfully.
+LOGIN_TRUST_TTL = float(os.getenv('LOGIN_TRUST_TTL', 604800))
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', 32))
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+PASSWORD_HASH_ALGORITHM = os.getenv('PASSWORD_HASH_ALGORITHM', 'bcrypt')
+PASSWORD_HASH_TARGET_MS = float(os.getenv('PASSWORD_HASH_TARGET_MS', 250))
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', 3))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', 65536))
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', 4))
+
+# Also send the per-stage request timings that are always logged in a `Server-Timing`
+# header. Off by default: the header reaches every client, and stage timings such as
+# `password_verify` reveal whether an email is registered, so enable it only where
+# clients are trusted.
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'false').lower() == 'true'
+PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', 0.1))
+PROFILER_INTERVAL = float(os.getenv('PROFILER_INTERVAL', 0.005))
+PROFILER_OUTPUT = os.getenv('PROFILER_OUTPUT', 'profile-{pid}.folded')
+COLD_START_BUDGET_MS = float(os.getenv('COLD_START_BUDGET_MS', 500))
 
 
 FLASK_SECRET_KEY = os.getenv('FLASK_SECRET_KEY')
 FLASK_DEBUG = os.getenv('FLASK_DEBUG')
 FLASK_HOST = os.getenv('FLASK_HOST')
-FLASK_PORT = int(os.getenv('FLASK_PORT'))
\ No newline at end of file
+FLASK_PORT = int(os.getenv('FLASK_PORT'))
+# Number of reverse proxies in front of the app whose X-Forwarded-* headers are trusted.
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 0))
+
+ACCESS_TOKEN_LIFETIME_MINUTES = int(os.getenv('ACCESS_TOKEN_LIFETIME_MINUTES', 15))
+REFRESH_TOKEN_LIFETIME_DAYS = int(os.getenv('REFRESH_TOKEN_LIFETIME_DAYS', 30))
+
+JWT_KEYS_DIR = os.getenv('JWT_KEYS_DIR')
+JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'EdDSA')
+# Keep accepting kid-less HS256 tokens signed with FLASK_SECRET_KEY after a key in
+# JWT_KEYS_DIR starts signing. Off by default: they are then accepted only for one access
+# token lifetime after the first key activates, so tokens issued before the switch expire
+# naturally and the shared secret cannot mint tokens afterwards.
+JWT_ACCEPT_HS256 = os.getenv('JWT_ACCEPT_HS256', 'false').lower() == 'true'
+JWT_KEYS_RELOAD_INTERVAL = float(os.getenv('JWT_KEYS_RELOAD_INTERVAL', 60))
+JWT_KEY_ROTATION_DAYS = float(os.getenv('JWT_KEY_ROTATION_DAYS', 30))
+JWT_KEY_PUBLISH_AHEAD = float(os.getenv('JWT_KEY_PUBLISH_AHEAD', 3600))
+JWKS_MAX_AGE = int(os.getenv('JWKS_MAX_AGE', 300))
\ No newline at end of file
@@ -8,25 +8,50 @@ Email: mcardle-j9@ulster.ac.uk
 B-No: B00733578
 """
 
-import subprocess
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
 import psycopg2
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-from config import DB_NAME, DB_USER, DB_PASSWORD, DB_HOST
+from psycopg2.extensions import (
+    ISOLATION_LEVEL_AUTOCOMMIT,
+    TRANSACTION_STATUS_IDLE,
+    connection,
+    cursor,
+)
+from config import (
+    DB_NAME,
+    DB_USER,
+    DB_PASSWORD,
+    DB_HOST,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_POOL_MAX_LIFETIME,
+    DB_POOL_CHECK_IDLE,
+)
+from migrations import MigrationError, migrate
+from metrics import DB_CONNECT_DURATION, DB_QUERY_DURATION, registry
+from timing import span
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def init_database() -> None:
+def init_database() -> bool:
     """
-    Initialize the database by creating it if it doesn't exist and applying Flyway migrations.
+    Initialize the database by creating it if it doesn't exist and applying migrations.
 
     This function connects to the PostgreSQL server, checks if the database exists,
-    creates it if necessary, and then applies any pending Flyway migrations.
+    creates it if necessary, and then applies any pending migrations from `sql/` with
+    `migrations.migrate`. It is run once per deploy by `manage.py migrate`, never while
+    serving requests.
 
-    Raises:
-        psycopg2.Error: If there is an error connecting to the PostgreSQL server.
+    Returns:
+        bool: True if the database is up to date, False if creation or migration failed.
     """
     try:
         conn = psycopg2.connect(
@@ -51,37 +76,422 @@ def init_database() -> None:
         cursor.close()
         conn.close()
 
-        apply_flyway_migrations()
+        migrate()
+        return True
 
     except psycopg2.Error as e:
-        logger.error(f"Error connecting to PostgreSQL: {e}")
+        logger.error(f"Error migrating PostgreSQL: {e}")
+    except MigrationError as e:
+        logger.error(f"Migration failed: {e}")
+    return False
 
 
-def apply_flyway_migrations() -> None:
-    """
-    Apply Flyway migrations to the database.
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available before the checkout timeout."""
 
-    This function runs the Flyway migration command to apply any pending migrations
-    to the database.
 
-    Raises:
-        subprocess.CalledProcessError: If the Flyway migration command fails.
+class PoolClosed(Exception):
+    """Raised when a connection is requested from a pool that has been closed."""
+
+
+class _PoolEntry:
+    """Book-keeping for a single physical connection owned by the pool."""
+
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn: connection) -> None:
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class TimedCursor(cursor):
     """
-    flyway_command = ["flyway", "-configFiles=flyway.conf", "migrate"]
-    try:
-        subprocess.run(flyway_command, check=True)
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Flyway migration failed: {e}")
+    Cursor recording how long each statement takes in `db_query_duration_seconds`
+    and in the current request's `db_query` timing span.
+    """
+
+    def execute(self, query, vars=None):
+        with DB_QUERY_DURATION.time(), span("db_query"):
+            return super().execute(query, vars)
 
 
-def db_connect() -> psycopg2.connect:
+def open_connection() -> connection:
     """
-    Establish a connection to the PostgreSQL database.
+    Open a new physical connection to the PostgreSQL database, outside the pool.
+
+    Use this only for connections that are held for a long time for a single
+    purpose, such as LISTEN; request handlers should use `db_connect`.
 
     Returns:
-        psycopg2.connect: A connection object to interact with the database.
+        connection: A freshly opened psycopg2 connection.
     """
-    conn = psycopg2.connect(
-        dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST
+    return psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        cursor_factory=TimedCursor,
     )
-    return conn
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections.
+
+    Connections are handed out most-recently-used first so that a small, warm set
+    serves steady traffic. A connection is checked for liveness on checkout once it
+    has been idle for longer than `check_idle` seconds, and is closed and replaced
+    once it is older than `max_lifetime` seconds.
+
+    Args:
+        min_size (int): Number of connections opened up front and kept around.
+        max_size (int): Upper bound on the number of open connections.
+        timeout (float): Seconds a caller waits for a free connection before
+                         `PoolTimeout` is raised.
+        max_lifetime (float): Seconds after which a connection is recycled.
+        check_idle (float): Idle seconds after which a connection is pinged on checkout.
+        connect (Callable[[], connection], optional): Factory for new connections.
+    """
+
+    def __init__(
+        self,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 5.0,
+        max_lifetime: float = 1800.0,
+        check_idle: float = 30.0,
+        connect: Optional[Callable[[], connection]] = None,
+    ) -> None:
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(
+                f"Invalid pool size: min_size={min_size}, max_size={max_size}"
+            )
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self._connect = connect or open_connection
+        self._cond = threading.Condition()
+        self._idle: deque = deque()
+        self._in_use: Dict[int, _PoolEntry] = {}
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+        self._counters = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "failed_health_checks": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    def fill(self) -> None:
+        """
+        Open connections until the pool holds at least `min_size` of them.
+
+        Raises:
+            psycopg2.Error: If a connection cannot be opened.
+        """
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            entry = self._open_reserved()
+            with self._cond:
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def getconn(self) -> connection:
+        """
+        Check a connection out of the pool, blocking until one is available.
+
+        Returns:
+            connection: A live psycopg2 connection with no transaction in progress.
+
+        Raises:
+            PoolTimeout: If no connection becomes available within `timeout` seconds.
+            PoolClosed: If the pool has been closed.
+            psycopg2.Error: If a new connection has to be opened and that fails.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            entry = self._reserve(deadline)
+            if entry is None:
+                entry = self._open_reserved()
+            elif not self._is_healthy(entry):
+                self._discard(entry)
+                continue
+            break
+
+        now = time.monotonic()
+        waited = now - started
+        entry.last_used = now
+        with self._cond:
+            self._in_use[id(entry.conn)] = entry
+            self._counters["checkouts"] += 1
+            self._counters["wait_time_total"] += waited
+            if waited > self._counters["wait_time_max"]:
+                self._counters["wait_time_max"] = waited
+        return entry.conn
+
+    def putconn(self, conn: connection, discard: bool = False) -> None:
+        """
+        Return a connection to the pool.
+
+        Any open transaction is rolled back. Connections that are broken, past
+        `max_lifetime`, or explicitly discarded are closed instead of being reused.
+
+        Args:
+            conn (connection): A connection previously obtained from `getconn`.
+            discard (bool): Close the connection rather than returning it to the pool.
+        """
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            logger.warning("Attempted to return a connection not owned by the pool.")
+            return
+
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error as e:
+                logger.warning(f"Discarding pooled connection after rollback failure: {e}")
+                discard = True
+
+        if discard or self._closed or conn.closed or self._expired(entry):
+            self._discard(entry)
+            return
+
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[connection]:
+        """
+        Context manager that checks a connection out and always returns it.
+
+        Yields:
+            connection: A pooled psycopg2 connection.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self) -> dict:
+        """
+        Return a snapshot of the pool's size and usage counters.
+
+        Returns:
+            dict: Current sizing (`size`, `idle`, `in_use`, `waiting`) together with
+                  cumulative counters such as `checkouts`, `timeouts` and wait times.
+        """
+        with self._cond:
+            snapshot = dict(self._counters)
+            snapshot.update(
+                {
+                    "min_size": self.min_size,
+                    "max_size": self.max_size,
+                    "size": self._size,
+                    "idle": len(self._idle),
+                    "in_use": len(self._in_use),
+                    "waiting": self._waiting,
+                }
+            )
+        checkouts = snapshot["checkouts"]
+        snapshot["wait_time_avg"] = (
+            snapshot["wait_time_total"] / checkouts if checkouts else 0.0
+        )
+        return snapshot
+
+    def close(self) -> None:
+        """
+        Close every idle connection and refuse further checkouts.
+
+        Connections that are still checked out are closed when they are returned.
+        """
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+    def _reserve(self, deadline: float) -> Optional[_PoolEntry]:
+        """Take an idle entry, or reserve a slot for a new connection (returns None)."""
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise PoolClosed("Connection pool is closed.")
+                    if self._idle:
+                        return self._idle.pop()
+                    if self._size < self.max_size:
+                        self._size += 1
+                        return None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No database connection available within {self.timeout}s "
+                            f"(max_size={self.max_size})."
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+    def _open_reserved(self) -> _PoolEntry:
+        """Open a connection for a slot already counted in `_size`."""
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters["connections_opened"] += 1
+        return _PoolEntry(conn)
+
+    def _expired(self, entry: _PoolEntry) -> bool:
+        return (
+            self.max_lifetime > 0
+            and time.monotonic() - entry.created_at > self.max_lifetime
+        )
+
+    def _is_healthy(self, entry: _PoolEntry) -> bool:
+        """Check that an idle connection is still usable before handing it out."""
+        if entry.conn.closed or self._expired(entry):
+            return False
+        if time.monotonic() - entry.last_used < self.check_idle:
+            return True
+        try:
+            cursor = entry.conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+            entry.conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Pooled connection failed health check: {e}")
+            with self._cond:
+                self._counters["failed_health_checks"] += 1
+            return False
+
+    def _discard(self, entry: _PoolEntry) -> None:
+        """Close a connection and release its slot."""
+        try:
+            if not entry.conn.closed:
+                entry.conn.close()
+        except psycopg2.Error as e:
+            logger.warning(f"Error closing pooled connection: {e}")
+        with self._cond:
+            self._size -= 1
+            self._counters["connections_closed"] += 1
+            self._cond.notify()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Return the process-wide connection pool, creating it on first use.
+
+    A new pool is created after a fork so that worker processes never share
+    sockets inherited from their parent.
+
+    Returns:
+        ConnectionPool: The pool used by `db_connect`.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    check_idle=DB_POOL_CHECK_IDLE,
+                )
+                _pool_pid = pid
+                try:
+                    _pool.fill()
+                except psycopg2.Error as e:
+                    logger.error(f"Error pre-filling connection pool: {e}")
+    return _pool
+
+
+def close_pool() -> None:
+    """
+    Close the process-wide connection pool, if one has been created.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close()
+        _pool = None
+        _pool_pid = None
+
+
+def _pool_stats() -> dict:
+    """Return the pool's stats without creating a pool just to report on it."""
+    pool = _pool
+    if pool is None or _pool_pid != os.getpid():
+        return {}
+    return pool.stats()
+
+
+registry.register_stats(
+    "db_pool",
+    "Database connection pool",
+    _pool_stats,
+    counters=(
+        "checkouts",
+        "timeouts",
+        "connections_opened",
+        "connections_closed",
+        "failed_health_checks",
+        "wait_time_total",
+    ),
+)
+
+
+@contextmanager
+def db_connect() -> Iterator[connection]:
+    """
+    Check a connection out of the shared pool for the duration of a `with` block.
+
+    The connection is returned to the pool when the block exits; any transaction
+    left open is rolled back, so callers must commit the work they want to keep.
+
+    Yields:
+        connection: A pooled connection to interact with the database.
+
+    Raises:
+        PoolTimeout: If the pool is exhausted for longer than `DB_POOL_TIMEOUT` seconds.
+    """
+    pool = get_pool()
+    with DB_CONNECT_DURATION.time(), span("db_connect"):
+        conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
@@ -11,9 +11,10 @@ B-No: B00733578
 from functools import wraps
 from flask import request, jsonify, make_response, g
 import jwt
-from db import db_connect
+from revocation import revocation_cache, token_epochs
 import logging
-from config import FLASK_SECRET_KEY
+from timing import span
+from tokens import verify_access_token
 from typing import Callable, Any
 
 
@@ -26,8 +27,13 @@ def auth_required(func: Callable) -> Callable:
     Decorator to enforce authentication for Flask routes.
 
     This decorator checks for the presence and validity of a JWT token in the request headers.
-    It also verifies that the token is not blacklisted. If any checks fail, it returns an
-    unauthorized response.
+    It also verifies that the token is not blacklisted, using the in-process revocation cache
+    so that tokens which were never revoked are accepted without a database round-trip, and
+    that it was not issued before the user's current token epoch (see `/api/v1/logout-all`).
+    If any checks fail, it returns an unauthorized response.
+
+    Verified claims are cached until the token expires (see `tokens.verify_access_token`)
+    and exposed as `g.claims`, so handlers never need to decode the token again.
 
     Args:
         func (Callable): The Flask route function to be decorated.
@@ -46,9 +52,13 @@ def auth_required(func: Callable) -> Callable:
             )
 
         try:
-            data = jwt.decode(token, FLASK_SECRET_KEY, algorithms=["HS256"])
+            with span("jwt_decode"):
+                data = verify_access_token(token)
+            g.claims = data
             g.user_id = data["user_id"]
-        except jwt.InvalidTokenError as e:
+            g.token_exp = data.get("exp")
+            g.admin = bool(data.get("admin"))
+        except (jwt.InvalidTokenError, KeyError) as e:
             logger.warning(
                 f"Unauthorized access attempt: Invalid token. Error: {str(e)}"
             )
@@ -57,32 +67,51 @@ def auth_required(func: Callable) -> Callable:
             )
 
         try:
-            conn = db_connect()
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT 1 FROM blacklisted_tokens WHERE token = %s", (token,)
-            )
-            bl_token = cursor.fetchone()
-            if bl_token:
-                logger.warning(
-                    f"Unauthorized access attempt: Token has been cancelled. Token: {token}"
-                )
-                return make_response(
-                    jsonify({"Unauthorized": "Token has been cancelled."}), 401
-                )
+            with span("revocation_check"):
+                revoked = revocation_cache.is_revoked(
+                    token, data.get("exp")
+                ) or token_epochs.is_stale(data)
         except Exception as e:
             logger.error(f"Error checking token blacklist: {str(e)}")
             return make_response(
                 jsonify({"Unauthorized": "Error checking token blacklist."}),
                 500,
             )
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
+        if revoked:
+            logger.warning(
+                f"Unauthorized access attempt: Token has been cancelled. Token: {token}"
+            )
+            return make_response(
+                jsonify({"Unauthorized": "Token has been cancelled."}), 401
+            )
 
         logger.info(f"Authorized access for user ID: {g.user_id}")
         return func(*args, **kwargs)
 
     return auth_required_wrapper
+
+
+def admin_required(func: Callable) -> Callable:
+    """
+    Decorator restricting a Flask route to administrators.
+
+    It must be applied below `auth_required`, which verifies the token and records its
+    `admin` claim on `g`.
+
+    Args:
+        func (Callable): The Flask route function to be decorated.
+
+    Returns:
+        Callable: The decorated function, answering 403 for non-administrators.
+    """
+
+    @wraps(func)
+    def admin_required_wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not g.get("admin"):
+            logger.warning(f"Forbidden access attempt by user ID: {g.get('user_id')}")
+            return make_response(
+                jsonify({"Forbidden": "Administrator access required."}), 403
+            )
+        return func(*args, **kwargs)
+
+    return admin_required_wrapper
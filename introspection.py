@@ -0,0 +1,113 @@
+"""
+File: introspection.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+import jwt
+from db import db_connect
+from revocation import epoch_is_stale, token_digest, token_epochs
+from tokens import decode_access_token
+
+REVOKED_TOKENS_QUERY = "SELECT token_hash FROM blacklisted_tokens WHERE token_hash = ANY(%s)"
+TOKEN_EPOCHS_QUERY = "SELECT user_id, token_epoch FROM users WHERE user_id = ANY(%s)"
+
+
+def decode_batch(tokens: Iterable) -> Tuple[List[dict], Dict[int, bytes]]:
+    """
+    Verify the signature and expiry of every token in a batch, without touching the database.
+
+    Args:
+        tokens (Iterable): The tokens to introspect, in request order.
+
+    Returns:
+        Tuple[List[dict], Dict[int, bytes]]: One result per token, and the digests of the
+                                             tokens that passed, keyed by their position.
+                                             Those results still need `apply_revocations`.
+    """
+    results = []
+    pending = {}
+    for index, token in enumerate(tokens):
+        if not isinstance(token, str) or not token:
+            results.append({"valid": False, "error": "Token is missing."})
+            continue
+        try:
+            claims = decode_access_token(token)
+            int(claims["user_id"])
+        except jwt.ExpiredSignatureError:
+            results.append({"valid": False, "error": "Token has expired."})
+            continue
+        except (jwt.InvalidTokenError, KeyError, TypeError, ValueError):
+            results.append({"valid": False, "error": "Token is invalid."})
+            continue
+        results.append({"valid": True, "claims": claims})
+        pending[index] = token_digest(token)
+    return results, pending
+
+
+def pending_user_ids(results: List[dict], pending: Mapping[int, bytes]) -> List[int]:
+    """
+    Return the distinct user IDs whose token epochs are needed to finish a batch.
+    """
+    return list({int(results[index]["claims"]["user_id"]) for index in pending})
+
+
+def apply_revocations(
+    results: List[dict],
+    pending: Mapping[int, bytes],
+    revoked: Set[bytes],
+    epochs: Mapping[int, Optional[int]],
+) -> List[dict]:
+    """
+    Mark the tokens of a decoded batch that are revoked or predate their user's epoch.
+
+    Args:
+        results (List[dict]): The results from `decode_batch`, updated in place.
+        pending (Mapping[int, bytes]): Token digests keyed by position, from `decode_batch`.
+        revoked (Set[bytes]): The digests among `pending` that have been revoked.
+        epochs (Mapping[int, Optional[int]]): Current token epoch per user; absent users are deleted.
+
+    Returns:
+        List[dict]: The completed results.
+    """
+    for user_id in pending_user_ids(results, pending):
+        token_epochs.set(user_id, epochs.get(user_id))
+    for index, digest in pending.items():
+        claims = results[index]["claims"]
+        if digest in revoked or epoch_is_stale(
+            claims, epochs.get(int(claims["user_id"]))
+        ):
+            results[index] = {"valid": False, "error": "Token has been cancelled."}
+    return results
+
+
+def introspect_tokens(tokens: Iterable) -> List[dict]:
+    """
+    Validate a batch of tokens with at most one database round-trip per lookup kind.
+
+    Signatures and expiry are verified locally. Revocations for the whole batch are
+    then resolved with a single `= ANY(...)` query against `blacklisted_tokens`, and
+    token epochs with a single query against `users`.
+
+    Args:
+        tokens (Iterable): The tokens to introspect.
+
+    Returns:
+        List[dict]: For each token, in order, `{"valid": True, "claims": {...}}` or
+                    `{"valid": False, "error": "..."}`.
+    """
+    results, pending = decode_batch(tokens)
+    if not pending:
+        return results
+
+    with db_connect() as conn, conn.cursor() as cursor:
+        cursor.execute(REVOKED_TOKENS_QUERY, (list(set(pending.values())),))
+        revoked = {bytes(row[0]) for row in cursor.fetchall()}
+        cursor.execute(TOKEN_EPOCHS_QUERY, (pending_user_ids(results, pending),))
+        epochs = dict(cursor.fetchall())
+    return apply_revocations(results, pending, revoked, epochs)
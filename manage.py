@@ -0,0 +1,368 @@
+"""
+File: manage.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from config import (
+    ACCESS_TOKEN_LIFETIME_MINUTES,
+    COLD_START_BUDGET_MS,
+    JWT_ALGORITHM,
+    JWT_KEY_PUBLISH_AHEAD,
+    JWT_KEY_ROTATION_DAYS,
+    JWT_KEYS_DIR,
+    JWT_KEYS_RELOAD_INTERVAL,
+    PASSWORD_HASH_ALGORITHM,
+    PASSWORD_HASH_TARGET_MS,
+    USERS_EXPORT_FETCH_SIZE,
+    USERS_IMPORT_CHUNK_SIZE,
+    USERS_IMPORT_HASH_WORKERS,
+    ARGON2_MEMORY_COST,
+    ARGON2_PARALLELISM,
+)
+from benchmark import compare, measure_cold_start, run_benchmarks
+from bulk_export import export_users
+from bulk_import import FORMATS, import_users
+from db import init_database
+from passwords import calibrate
+from refresh_tokens import purge_expired_refresh_tokens
+from revocation import purge_expired_revocations
+from signing_keys import ALGORITHMS, create_key, load_keys, retire_keys
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def purge_revocations(args: argparse.Namespace) -> None:
+    """
+    Delete expired token revocations and refresh tokens, once or repeatedly every
+    `--interval` seconds.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    while True:
+        purge_expired_revocations(
+            batch_size=args.batch_size, max_batches=args.max_batches
+        )
+        purge_expired_refresh_tokens(
+            batch_size=args.batch_size, max_batches=args.max_batches
+        )
+        if not args.interval:
+            return
+        time.sleep(args.interval)
+
+
+def calibrate_hasher(args: argparse.Namespace) -> None:
+    """
+    Measure this host and print the password hashing settings that meet the latency target.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    fixed = {}
+    if args.algorithm == "argon2id":
+        fixed = {"memory_cost": args.memory_cost, "parallelism": args.parallelism}
+    hasher, elapsed_ms = calibrate(
+        args.algorithm, args.target_ms, samples=args.samples, **fixed
+    )
+    params = hasher.describe()
+    print(f"# {elapsed_ms:.1f} ms per verification (target {args.target_ms} ms)")
+    print(f"PASSWORD_HASH_ALGORITHM={params.pop('algorithm')}")
+    prefix = "BCRYPT_" if args.algorithm == "bcrypt" else "ARGON2_"
+    for name, value in params.items():
+        print(f"{prefix}{name.upper()}={value}")
+
+
+def benchmark(args: argparse.Namespace) -> None:
+    """
+    Run the microbenchmark suite and optionally fail on regressions against a baseline.
+
+    Exits with status 1 if `--compare` is given and any case regressed.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    results = run_benchmarks(only=args.only, min_time=args.min_time, repeat=args.repeat)
+    for name, result in results["results"].items():
+        print(
+            f"{name:32} {result['median_ns'] / 1000:12.1f} us {result['alloc_bytes']:10} B",
+            file=sys.stderr,
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+    if not args.compare:
+        return
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    regressions = compare(
+        baseline,
+        results,
+        latency_threshold=args.latency_threshold,
+        alloc_threshold=args.alloc_threshold,
+    )
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression['case']} {regression['metric']}: "
+            f"{regression['baseline']:.0f} -> {regression['current']:.0f} "
+            f"({regression['change']:+.1%})",
+            file=sys.stderr,
+        )
+    if regressions:
+        sys.exit(1)
+
+
+def migrate(args: argparse.Namespace) -> None:
+    """
+    Create the database if needed and apply pending migrations, then exit.
+
+    Run it once per deploy before starting workers, e.g. as a release or init step;
+    the app itself never migrates on import.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    if not init_database():
+        sys.exit(1)
+
+
+def cold_start(args: argparse.Namespace) -> None:
+    """
+    Measure how long a new worker takes to import the app, failing above the budget.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    result = measure_cold_start(args.module, repeat=args.repeat)
+    print(
+        f"{args.module}: median {result['median_ms']:.0f} ms, max {result['max_ms']:.0f} ms "
+        f"(budget {args.budget_ms:.0f} ms)"
+    )
+    if result["median_ms"] > args.budget_ms:
+        sys.exit(1)
+
+
+def import_users_command(args: argparse.Namespace) -> None:
+    """
+    Create user accounts in bulk from a CSV or JSON Lines file and print the report.
+
+    Rejected records are printed one JSON object per line, followed by a summary on
+    stderr. Exits with status 1 if any record was rejected.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    fmt = args.format or ("jsonl" if args.file.endswith((".jsonl", ".ndjson")) else "csv")
+    if args.file == "-":
+        report = import_users(sys.stdin, fmt, chunk_size=args.chunk_size, workers=args.workers)
+    else:
+        with open(args.file, newline="", encoding="utf-8") as f:
+            report = import_users(f, fmt, chunk_size=args.chunk_size, workers=args.workers)
+
+    for rejected in report["rejected"]:
+        print(json.dumps(rejected))
+    print(
+        f"Imported {report['imported']} users, rejected {len(report['rejected'])}.",
+        file=sys.stderr,
+    )
+    if report["rejected"]:
+        sys.exit(1)
+
+
+def export_users_command(args: argparse.Namespace) -> None:
+    """
+    Write every user as NDJSON to a file or stdout, optionally gzipped.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    chunks = export_users(fetch_size=args.fetch_size, compress=args.gzip)
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.writelines(chunks)
+    else:
+        sys.stdout.buffer.writelines(chunks)
+        sys.stdout.buffer.flush()
+
+
+def rotate_signing_key(args: argparse.Namespace) -> None:
+    """
+    Create a new signing key when the newest one is due for rotation, then delete keys
+    that no unexpired token can have been signed with.
+
+    The new key is published `--activate-in` seconds before it starts signing, so
+    services holding a cached JWKS fetch it before the first token naming it arrives.
+    Meant to be run regularly, e.g. daily from cron; it does nothing until a rotation is due.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    if not JWT_KEYS_DIR:
+        logger.error("JWT_KEYS_DIR is not set.")
+        sys.exit(1)
+
+    now = time.time()
+    keys = load_keys(JWT_KEYS_DIR) if os.path.isdir(JWT_KEYS_DIR) else []
+    if args.force or not keys or keys[-1].not_before <= now - args.rotation_days * 86400:
+        activate_in = args.activate_in if keys else 0
+        key = create_key(JWT_KEYS_DIR, args.algorithm, now + activate_in)
+        print(f"Created signing key {key.kid}, signing from {activate_in:.0f}s from now.")
+    else:
+        print(f"Signing key {keys[-1].kid} is not due for rotation.")
+
+    retired = retire_keys(
+        JWT_KEYS_DIR, ACCESS_TOKEN_LIFETIME_MINUTES * 60 + JWT_KEYS_RELOAD_INTERVAL, now
+    )
+    if retired:
+        print(f"Retired signing keys: {', '.join(retired)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Management commands for the CommunityEye auth service."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    purge = subparsers.add_parser(
+        "purge-revocations", help="Delete revocations of expired tokens and expired refresh tokens."
+    )
+    purge.add_argument("--batch-size", type=int, default=1000)
+    purge.add_argument("--max-batches", type=int, default=None)
+    purge.add_argument(
+        "--interval",
+        type=float,
+        default=None,
+        help="Keep running and purge every INTERVAL seconds.",
+    )
+    purge.set_defaults(handler=purge_revocations)
+
+    calibrate_parser = subparsers.add_parser(
+        "calibrate-hasher",
+        help="Pick the password hashing cost that meets a latency target on this host.",
+    )
+    calibrate_parser.add_argument(
+        "--algorithm",
+        choices=["bcrypt", "argon2id"],
+        default=PASSWORD_HASH_ALGORITHM,
+    )
+    calibrate_parser.add_argument(
+        "--target-ms", type=float, default=PASSWORD_HASH_TARGET_MS
+    )
+    calibrate_parser.add_argument("--samples", type=int, default=3)
+    calibrate_parser.add_argument(
+        "--memory-cost", type=int, default=ARGON2_MEMORY_COST
+    )
+    calibrate_parser.add_argument(
+        "--parallelism", type=int, default=ARGON2_PARALLELISM
+    )
+    calibrate_parser.set_defaults(handler=calibrate_hasher)
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark",
+        help="Run the microbenchmarks, optionally failing on regressions against a baseline.",
+    )
+    benchmark_parser.add_argument(
+        "--output", help="Write JSON results to this file instead of stdout."
+    )
+    benchmark_parser.add_argument(
+        "--compare", metavar="BASELINE", help="Fail if results regressed against this JSON file."
+    )
+    benchmark_parser.add_argument("--latency-threshold", type=float, default=0.15)
+    benchmark_parser.add_argument("--alloc-threshold", type=float, default=0.10)
+    benchmark_parser.add_argument(
+        "--only",
+        action="append",
+        metavar="PREFIX",
+        help="Run only cases whose name starts with PREFIX. May be repeated.",
+    )
+    benchmark_parser.add_argument("--min-time", type=float, default=0.2)
+    benchmark_parser.add_argument("--repeat", type=int, default=5)
+    benchmark_parser.set_defaults(handler=benchmark)
+
+    import_parser = subparsers.add_parser(
+        "import-users",
+        help="Create user accounts in bulk from a CSV or JSON Lines file.",
+    )
+    import_parser.add_argument("file", help="The file to import, or - for stdin.")
+    import_parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default=None,
+        help="Input format. Defaults to jsonl for .jsonl/.ndjson files and csv otherwise.",
+    )
+    import_parser.add_argument("--chunk-size", type=int, default=USERS_IMPORT_CHUNK_SIZE)
+    import_parser.add_argument(
+        "--workers",
+        type=int,
+        default=USERS_IMPORT_HASH_WORKERS,
+        help="Password hashing threads.",
+    )
+    import_parser.set_defaults(handler=import_users_command)
+
+    export_parser = subparsers.add_parser(
+        "export-users", help="Write every user as NDJSON."
+    )
+    export_parser.add_argument(
+        "--output", help="Write to this file instead of stdout."
+    )
+    export_parser.add_argument("--gzip", action="store_true", help="Gzip the output.")
+    export_parser.add_argument("--fetch-size", type=int, default=USERS_EXPORT_FETCH_SIZE)
+    export_parser.set_defaults(handler=export_users_command)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="Create the database if needed and apply pending migrations."
+    )
+    migrate_parser.set_defaults(handler=migrate)
+
+    cold_start_parser = subparsers.add_parser(
+        "cold-start",
+        help="Measure how long a new worker takes to import the app.",
+    )
+    cold_start_parser.add_argument("--module", choices=["app", "asgi"], default="app")
+    cold_start_parser.add_argument("--repeat", type=int, default=5)
+    cold_start_parser.add_argument("--budget-ms", type=float, default=COLD_START_BUDGET_MS)
+    cold_start_parser.set_defaults(handler=cold_start)
+
+    rotate_parser = subparsers.add_parser(
+        "rotate-signing-key",
+        help="Create a new token signing key when one is due and retire superseded keys.",
+    )
+    rotate_parser.add_argument("--algorithm", choices=ALGORITHMS, default=JWT_ALGORITHM)
+    rotate_parser.add_argument(
+        "--activate-in",
+        type=float,
+        default=JWT_KEY_PUBLISH_AHEAD,
+        help="Seconds the new key is published before it starts signing.",
+    )
+    rotate_parser.add_argument(
+        "--rotation-days",
+        type=float,
+        default=JWT_KEY_ROTATION_DAYS,
+        help="Rotate once the newest key is this many days old.",
+    )
+    rotate_parser.add_argument(
+        "--force", action="store_true", help="Rotate even if the newest key is not due."
+    )
+    rotate_parser.set_defaults(handler=rotate_signing_key)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+"""
+File: metrics.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, bool):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Registry:
+    """
+    The set of metrics rendered by the `/metrics` endpoint.
+
+    Besides metrics updated on the request path, a registry can export the `stats()`
+    snapshots that the connection pool, password executor and caches already keep, so
+    those components need no instrumentation of their own.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: List["_Metric"] = []
+        self._stats: List[Tuple[str, str, Callable[[], dict], frozenset]] = []
+
+    def register(self, metric: "_Metric") -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def register_stats(
+        self,
+        prefix: str,
+        help: str,
+        stats: Callable[[], dict],
+        counters: Iterable[str] = (),
+    ) -> None:
+        """
+        Export every numeric entry of a `stats()` snapshot as `<prefix>_<key>`.
+
+        Args:
+            prefix (str): Metric name prefix.
+            help (str): Description of the component, used in each metric's HELP line.
+            stats (Callable[[], dict]): Returns the current snapshot.
+            counters (Iterable[str]): Keys that only ever increase; they are exported as
+                                      counters with a `_total` suffix, the rest as gauges.
+        """
+        with self._lock:
+            self._stats.append((prefix, help, stats, frozenset(counters)))
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition, ending with a newline.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+            stats = list(self._stats)
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+
+        for prefix, help, snapshot_fn, counters in stats:
+            try:
+                snapshot = snapshot_fn()
+            except Exception as e:
+                logger.warning(f"Could not collect {prefix} metrics: {str(e)}")
+                continue
+            for key, value in snapshot.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                if key in counters:
+                    name, kind = f"{prefix}_{key}", "counter"
+                    if not name.endswith("_total"):
+                        name += "_total"
+                else:
+                    name, kind = f"{prefix}_{key}", "gauge"
+                lines.append(f"# HELP {name} {help} ({key}).")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class _Metric(ABC):
+    """
+    Base class of metrics with an optional fixed set of label names.
+
+    Children, one per combination of label values, are created on first use and then
+    found with a plain dictionary lookup; only their own updates take a lock.
+    """
+
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = registry,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        if registry is not None:
+            registry.register(self)
+
+    @abstractmethod
+    def _new_child(self) -> Any:
+        """
+        Create the state of one combination of label values.
+        """
+
+    def labels(self, *values: Any) -> Any:
+        """
+        Return the child for a combination of label values.
+
+        Args:
+            *values (Any): One value per label name, in order.
+
+        Returns:
+            Any: The child metric, which has the same update methods as an unlabelled metric.
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}.")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self) -> Any:
+        if self.labelnames:
+            raise ValueError(f"{self.name} requires labels {self.labelnames}.")
+        return self._children[()]
+
+    @abstractmethod
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """
+        Return the metric's samples as (sample name, formatted labels, value) for exposition.
+        """
+
+
+class _Value:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+
+class Counter(_Metric):
+    """
+    A value that only increases, such as a number of requests.
+    """
+
+    type = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self._default().inc(amount)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [
+            (self.name, _format_labels(self.labelnames, key), child.value)
+            for key, child in list(self._children.items())
+        ]
+
+
+class Gauge(_Metric):
+    """
+    A value that can go up and down, such as the number of requests in flight.
+    """
+
+    type = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._default().dec(amount)
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [
+            (self.name, _format_labels(self.labelnames, key), child.value)
+            for key, child in list(self._children.items())
+        ]
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_started")
+
+    def __init__(self, histogram: "_HistogramValue") -> None:
+        self._histogram = histogram
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._histogram.observe(time.perf_counter() - self._started)
+
+
+class _HistogramValue:
+    __slots__ = ("_lock", "_bounds", "_counts", "_sum")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self._counts), self._sum
+
+
+class Histogram(_Metric):
+    """
+    Counts of observations in fixed buckets, such as request latencies in seconds.
+
+    Bucket bounds are fixed when the histogram is created, so an observation is one
+    binary search and one counter increment.
+
+    Args:
+        buckets (Sequence[float]): Upper bounds of the buckets, in increasing order.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Optional[Registry] = registry,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self) -> _Timer:
+        """
+        Return a context manager observing the duration of its block.
+        """
+        return self._default().time()
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        samples = []
+        names = self.labelnames + ("le",)
+        for key, child in list(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(
+                    (f"{self.name}_bucket", _format_labels(names, key + (_format_value(bound),)), cumulative)
+                )
+            labels = _format_labels(self.labelnames, key)
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "Requests handled, by endpoint, method and status code.",
+    ("endpoint", "method", "status"),
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling requests, by endpoint and method.",
+    ("endpoint", "method"),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled, by endpoint.",
+    ("endpoint",),
+)
+DB_CONNECT_DURATION = Histogram(
+    "db_connect_duration_seconds",
+    "Time spent checking a connection out of the pool.",
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Time spent executing database statements.",
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "Time spent hashing or verifying passwords, excluding queueing.",
+    ("operation", "algorithm"),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.4, 0.5, 0.75, 1.0, 2.5),
+)
+JWT_DECODE_DURATION = Histogram(
+    "jwt_decode_duration_seconds",
+    "Time spent verifying access tokens.",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01),
+)
+
+
+def instrument(app: Any, request: Any, g: Any, is_async: bool = False) -> None:
+    """
+    Record request counts, latencies and in-flight requests for every route of an app.
+
+    Works for both the Flask and the Quart application, given that framework's
+    `request` and `g` proxies.
+
+    Args:
+        app (Any): The Flask or Quart application.
+        request (Any): The framework's request proxy.
+        g (Any): The framework's application context globals.
+        is_async (bool): Register the hooks as coroutines, so that Quart runs them on the
+                         event loop instead of handing them to a thread.
+    """
+
+    def start_timer() -> None:
+        g.metrics_endpoint = request.endpoint or "unmatched"
+        g.metrics_started = time.perf_counter()
+        HTTP_REQUESTS_IN_FLIGHT.labels(g.metrics_endpoint).inc()
+
+    def record_request(response: Any) -> Any:
+        started = g.get("metrics_started")
+        if started is not None:
+            endpoint = g.metrics_endpoint
+            HTTP_REQUEST_DURATION.labels(endpoint, request.method).observe(
+                time.perf_counter() - started
+            )
+            HTTP_REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+        return response
+
+    def stop_timer(exc: Optional[BaseException]) -> None:
+        endpoint = g.pop("metrics_endpoint", None)
+        if endpoint is not None:
+            HTTP_REQUESTS_IN_FLIGHT.labels(endpoint).dec()
+
+    hooks = (start_timer, record_request, stop_timer)
+    if is_async:
+        hooks = tuple(_as_coroutine(hook) for hook in hooks)
+    app.before_request(hooks[0])
+    app.after_request(hooks[1])
+    app.teardown_request(hooks[2])
+
+
+def _as_coroutine(func: Callable) -> Callable:
+    async def hook(*args: Any) -> Any:
+        return func(*args)
+
+    return hook
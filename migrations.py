@@ -0,0 +1,341 @@
+"""
+File: migrations.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import os
+import re
+import time
+import zlib
+from typing import Callable, Iterable, List, Optional, Tuple
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from config import (
+    DB_NAME,
+    DB_USER,
+    DB_PASSWORD,
+    DB_HOST,
+    MIGRATIONS_DIR,
+    MIGRATIONS_TABLE,
+)
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Session-level advisory lock held while migrating, so concurrent runners apply each
+# migration once: the others wait, then find nothing left to do. Closing the
+# connection releases it, even if a migration fails.
+MIGRATION_LOCK_KEY = 7302
+
+MIGRATION_FILE = re.compile(r"^V(?P<version>\d+(?:[._]\d+)*)__(?P<description>.+)\.sql$")
+LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+# The history table exactly as Flyway creates it, so either tool can take over.
+CREATE_HISTORY = f"""
+    CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+        installed_rank INT NOT NULL CONSTRAINT {MIGRATIONS_TABLE}_pk PRIMARY KEY,
+        version VARCHAR(50),
+        description VARCHAR(200) NOT NULL,
+        type VARCHAR(20) NOT NULL,
+        script VARCHAR(1000) NOT NULL,
+        checksum INTEGER,
+        installed_by VARCHAR(100) NOT NULL,
+        installed_on TIMESTAMP NOT NULL DEFAULT now(),
+        execution_time INTEGER NOT NULL,
+        success BOOLEAN NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS {MIGRATIONS_TABLE}_s_idx ON {MIGRATIONS_TABLE} (success);
+"""
+
+SELECT_HISTORY = f"SELECT version, type, checksum, success FROM {MIGRATIONS_TABLE}"
+
+INSERT_HISTORY = f"""
+    INSERT INTO {MIGRATIONS_TABLE} (
+        installed_rank, version, description, type, script, checksum,
+        installed_by, execution_time, success
+    )
+    SELECT COALESCE(MAX(installed_rank), 0) + 1, %s, %s, 'SQL', %s, %s, current_user, %s, true
+    FROM {MIGRATIONS_TABLE}
+"""
+
+
+class MigrationError(Exception):
+    """Raised when the database's migration history does not match the migration files."""
+
+
+def parse_version(text: str) -> Tuple[int, ...]:
+    """
+    Parse a Flyway version such as "1.8" or "1_8" into a comparable tuple.
+
+    Trailing zeros are dropped, so "1" and "1.0" are the same version, as in Flyway.
+
+    Args:
+        text (str): The version.
+
+    Returns:
+        Tuple[int, ...]: The version's numeric parts.
+    """
+    parts = [int(part) for part in re.split(r"[._]", text)]
+    while len(parts) > 1 and parts[-1] == 0:
+        parts.pop()
+    return tuple(parts)
+
+
+def checksum(text: str) -> int:
+    """
+    Compute a migration's checksum the way Flyway does.
+
+    Flyway takes the CRC32 of every line's UTF-8 bytes without its line break, ignoring a
+    leading byte order mark, so the checksum does not change between LF and CRLF checkouts.
+
+    Args:
+        text (str): The migration's SQL.
+
+    Returns:
+        int: The checksum as a signed 32-bit integer.
+    """
+    lines = LINE_BREAK.split(text.lstrip("\ufeff"))
+    if lines[-1] == "":
+        lines.pop()
+    crc = 0
+    for line in lines:
+        crc = zlib.crc32(line.encode("utf-8"), crc)
+    return crc - (1 << 32) if crc >= 1 << 31 else crc
+
+
+class Migration:
+    """
+    A versioned SQL migration file, e.g. `V1.8__Create_refresh_tokens_table.sql`.
+
+    Args:
+        path (str): Path of the file.
+        version (str): The version as written in the file name.
+        description (str): The file name's description, with underscores as spaces.
+        sql (str): The migration's SQL.
+    """
+
+    __slots__ = ("path", "version", "key", "description", "sql", "checksum")
+
+    def __init__(self, path: str, version: str, description: str, sql: str) -> None:
+        self.path = path
+        self.version = version
+        self.key = parse_version(version)
+        self.description = description
+        self.sql = sql
+        self.checksum = checksum(sql)
+
+    @property
+    def script(self) -> str:
+        return os.path.basename(self.path)
+
+
+def discover_migrations(directory: str) -> List[Migration]:
+    """
+    Read every versioned migration in a directory.
+
+    Args:
+        directory (str): The migrations directory.
+
+    Returns:
+        List[Migration]: The migrations in version order.
+
+    Raises:
+        MigrationError: If two files have the same version.
+    """
+    migrations = []
+    for name in os.listdir(directory):
+        match = MIGRATION_FILE.match(name)
+        if match is None:
+            continue
+        path = os.path.join(directory, name)
+        with open(path, encoding="utf-8") as f:
+            sql = f.read()
+        migrations.append(
+            Migration(path, match["version"], match["description"].replace("_", " "), sql)
+        )
+    migrations.sort(key=lambda migration: migration.key)
+    for previous, current in zip(migrations, migrations[1:]):
+        if previous.key == current.key:
+            raise MigrationError(
+                f"Found more than one migration with version {current.version}: "
+                f"{previous.script}, {current.script}"
+            )
+    return migrations
+
+
+def plan(
+    migrations: List[Migration], history: Iterable[Tuple[Optional[str], str, Optional[int], bool]]
+) -> List[Migration]:
+    """
+    Validate the history table against the migration files and return what is left to apply.
+
+    Like `flyway migrate` with default settings, this refuses to run when a recorded
+    migration failed, an applied migration's file changed or disappeared, or a new file
+    sorts before the latest applied version. Files at or below a baseline are skipped.
+
+    Args:
+        migrations (List[Migration]): The migration files, in version order.
+        history (Iterable[tuple]): The history table's version, type, checksum and success.
+
+    Returns:
+        List[Migration]: The pending migrations, in version order.
+
+    Raises:
+        MigrationError: If the history does not match the files.
+    """
+    applied = {}
+    baseline = None
+    for version, kind, recorded_checksum, success in history:
+        if version is None:
+            continue
+        if not success:
+            raise MigrationError(
+                f"Migration {version} failed; fix the database and delete its history row."
+            )
+        if kind == "BASELINE":
+            baseline = max(baseline or (), parse_version(version))
+        else:
+            applied[parse_version(version)] = (version, recorded_checksum)
+
+    by_key = {migration.key: migration for migration in migrations}
+    for key, (version, _) in applied.items():
+        if key not in by_key:
+            raise MigrationError(f"Applied migration {version} has no file in {MIGRATIONS_DIR}.")
+
+    pending = []
+    for migration in migrations:
+        if migration.key in applied:
+            recorded_checksum = applied[migration.key][1]
+            if recorded_checksum is not None and recorded_checksum != migration.checksum:
+                raise MigrationError(
+                    f"Checksum mismatch for migration {migration.version}: applied "
+                    f"{recorded_checksum}, file {migration.checksum}. Applied migrations must not be edited."
+                )
+        elif baseline is None or migration.key > baseline:
+            pending.append(migration)
+
+    if pending and applied and pending[0].key < max(applied):
+        raise MigrationError(
+            f"Migration {pending[0].version} is older than the latest applied migration "
+            f"{applied[max(applied)][0]}."
+        )
+    return pending
+
+
+def check_unique_lower_email(cursor: psycopg2.extensions.cursor) -> None:
+    """
+    Refuse to build V1.6's unique index on `lower(email_address)` while it would fail.
+
+    Before V1.6 emails were compared case-sensitively, so a database can hold accounts
+    whose addresses differ only in case. Instead of the index aborting with a bare
+    unique violation, list them so an operator can merge or rename the accounts.
+
+    Args:
+        cursor (psycopg2.extensions.cursor): A cursor in the migration's transaction.
+
+    Raises:
+        MigrationError: If any addresses collide, naming up to 50 of them and their user IDs.
+    """
+    cursor.execute(
+        """
+        SELECT lower(email_address), array_agg(user_id ORDER BY user_id)
+        FROM users GROUP BY lower(email_address) HAVING count(*) > 1
+        ORDER BY lower(email_address) LIMIT 50
+        """
+    )
+    duplicates = cursor.fetchall()
+    if duplicates:
+        listing = "\n".join(f"  {email}: user IDs {list(user_ids)}" for email, user_ids in duplicates)
+        raise MigrationError(
+            "Cannot make email addresses unique regardless of case; these addresses belong to "
+            "more than one account. Merge or rename the accounts, then run migrate again:\n"
+            + listing
+        )
+
+
+# Checks run in a migration's transaction before it is applied, keyed by version. They
+# live here rather than in the SQL files so that adding one leaves checksums unchanged.
+PREFLIGHT_CHECKS = {parse_version("1.6"): check_unique_lower_email}
+
+
+def _history(cursor: psycopg2.extensions.cursor) -> list:
+    cursor.execute(SELECT_HISTORY)
+    return cursor.fetchall()
+
+
+def _connect() -> psycopg2.extensions.connection:
+    return psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST)
+
+
+def migrate(
+    connect: Callable[[], psycopg2.extensions.connection] = _connect,
+    directory: Optional[str] = None,
+) -> int:
+    """
+    Apply pending migrations, compatibly with Flyway's schema history table.
+
+    When the database is up to date, which is almost always, this costs one query and
+    takes no lock. Otherwise it takes an advisory lock, re-reads the history in case
+    another runner got there first, and applies each pending migration and its history
+    row in one transaction, so a failed migration leaves no trace and can be retried.
+
+    Args:
+        connect (Callable[[], connection]): Opens a connection to the application database.
+        directory (str, optional): The migrations directory; defaults to `MIGRATIONS_DIR`.
+
+    Returns:
+        int: The number of migrations applied.
+
+    Raises:
+        MigrationError: If the history does not match the migration files, or a
+                        migration's preflight check fails.
+        psycopg2.Error: If a migration fails.
+    """
+    directory = directory or os.path.join(os.path.dirname(os.path.abspath(__file__)), MIGRATIONS_DIR)
+    migrations = discover_migrations(directory)
+
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            try:
+                pending = plan(migrations, _history(cursor))
+            except psycopg2.errors.UndefinedTable:
+                pending = migrations
+            conn.rollback()
+            if not pending:
+                logger.info(f"Database is up to date at version {migrations[-1].version if migrations else None}.")
+                return 0
+
+            cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+            cursor.execute(CREATE_HISTORY)
+            conn.commit()
+            pending = plan(migrations, _history(cursor))
+            for migration in pending:
+                started = time.perf_counter()
+                if migration.key in PREFLIGHT_CHECKS:
+                    PREFLIGHT_CHECKS[migration.key](cursor)
+                cursor.execute(migration.sql)
+                cursor.execute(
+                    INSERT_HISTORY,
+                    (
+                        migration.version,
+                        migration.description,
+                        migration.script,
+                        migration.checksum,
+                        int((time.perf_counter() - started) * 1000),
+                    ),
+                )
+                conn.commit()
+                logger.info(f"Applied migration {migration.script}.")
+    finally:
+        conn.close()
+
+    logger.info(f"Applied {len(pending)} migrations.")
+    return len(pending)
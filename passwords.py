@@ -0,0 +1,566 @@
+"""
+File: passwords.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import statistics
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+import bcrypt
+from config import (
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_QUEUE_SIZE,
+    PASSWORD_HASH_TIMEOUT,
+    PASSWORD_HASH_ALGORITHM,
+    BCRYPT_ROUNDS,
+    ARGON2_TIME_COST,
+    ARGON2_MEMORY_COST,
+    ARGON2_PARALLELISM,
+)
+from metrics import PASSWORD_HASH_DURATION, registry
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class HasherOverloaded(Exception):
+    """Raised when password hashing capacity is exhausted and the request should be shed."""
+
+
+class PasswordExecutor:
+    """
+    Bounded thread pool that runs password hashing and verification.
+
+    bcrypt releases the GIL while it works, so running it on a small dedicated pool
+    caps the CPU that password work can take from the rest of the API. At most
+    `max_workers` hashes run at once and at most `max_queue` more wait for a worker;
+    anything beyond that is rejected immediately with `HasherOverloaded`.
+
+    Args:
+        max_workers (int): Number of hashing threads.
+        max_queue (int): Number of tasks allowed to wait for a free thread.
+        timeout (float): Seconds a caller waits for its result before giving up.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, timeout: float) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password-hasher"
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._counters = {
+            "completed": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "run_time_total": 0.0,
+        }
+
+    def submit(self, func: Callable, *args: Any) -> Future:
+        """
+        Queue `func(*args)` on the pool without waiting for it.
+
+        Args:
+            func (Callable): The CPU-bound function to run.
+            *args (Any): Arguments passed to `func`.
+
+        Returns:
+            Future: The pending result.
+
+        Raises:
+            HasherOverloaded: If the queue is full.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise HasherOverloaded("Password hashing queue is full.")
+
+        submitted = time.monotonic()
+        with self._lock:
+            self._queued += 1
+
+        def task() -> Any:
+            started = time.monotonic()
+            waited = started - submitted
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._counters["wait_time_total"] += waited
+                if waited > self._counters["wait_time_max"]:
+                    self._counters["wait_time_max"] = waited
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._counters["completed"] += 1
+                    self._counters["run_time_total"] += time.monotonic() - started
+                self._slots.release()
+
+        try:
+            return self._executor.submit(task)
+        except RuntimeError:
+            self._slots.release()
+            with self._lock:
+                self._queued -= 1
+            raise
+
+    def run(self, func: Callable, *args: Any) -> Any:
+        """
+        Run `func(*args)` on the pool and wait for its result.
+
+        Args:
+            func (Callable): The CPU-bound function to run.
+            *args (Any): Arguments passed to `func`.
+
+        Returns:
+            Any: The value returned by `func`.
+
+        Raises:
+            HasherOverloaded: If the queue is full or the result is not ready within `timeout`.
+        """
+        future = self.submit(func, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            self._timed_out()
+
+    async def run_async(self, func: Callable, *args: Any) -> Any:
+        """
+        Run `func(*args)` on the pool and await its result without blocking the event loop.
+
+        Args:
+            func (Callable): The CPU-bound function to run.
+            *args (Any): Arguments passed to `func`.
+
+        Returns:
+            Any: The value returned by `func`.
+
+        Raises:
+            HasherOverloaded: If the queue is full or the result is not ready within `timeout`.
+        """
+        future = asyncio.wrap_future(self.submit(func, *args))
+        try:
+            # Shielded so that a timeout never cancels a queued task and leaks its slot.
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self._timed_out()
+
+    def _timed_out(self) -> None:
+        with self._lock:
+            self._counters["timed_out"] += 1
+        raise HasherOverloaded(
+            f"Password hashing did not complete within {self.timeout}s."
+        )
+
+    def stats(self) -> dict:
+        """
+        Return the pool's queue depth, concurrency and wait-time counters.
+
+        Returns:
+            dict: `queue_depth`, `running` and cumulative counters including
+                  `wait_time_avg` and `run_time_avg`.
+        """
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot.update(
+                {
+                    "max_workers": self.max_workers,
+                    "max_queue": self.max_queue,
+                    "queue_depth": self._queued,
+                    "running": self._running,
+                }
+            )
+        completed = snapshot["completed"]
+        snapshot["wait_time_avg"] = (
+            snapshot["wait_time_total"] / completed if completed else 0.0
+        )
+        snapshot["run_time_avg"] = (
+            snapshot["run_time_total"] / completed if completed else 0.0
+        )
+        return snapshot
+
+
+class PasswordHasher(ABC):
+    """
+    Base class for a password hashing scheme.
+
+    Subclasses produce self-describing hashes (the algorithm and its cost
+    parameters are encoded in the hash string), which lets stored hashes be
+    verified after the configured parameters change and upgraded on next login.
+    """
+
+    name = ""
+    prefixes: Tuple[str, ...] = ()
+
+    @abstractmethod
+    def hash(self, password: str) -> str:
+        """
+        Hash a password with the scheme's current parameters.
+        """
+
+    @abstractmethod
+    def verify(self, password: str, hashed_password: str) -> bool:
+        """
+        Check a password against a hash produced by this scheme.
+        """
+
+    @abstractmethod
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """
+        Check whether a hash was produced with parameters other than the current ones.
+        """
+
+    def identifies(self, hashed_password: str) -> bool:
+        """
+        Check whether a stored hash was produced by this scheme.
+        """
+        return hashed_password.startswith(self.prefixes)
+
+    @abstractmethod
+    def describe(self) -> dict:
+        """
+        Return the scheme's name and cost parameters.
+        """
+
+
+class BcryptHasher(PasswordHasher):
+    """
+    bcrypt with a configurable work factor.
+
+    Args:
+        rounds (int): The log2 work factor, between 4 and 31.
+    """
+
+    name = "bcrypt"
+    prefixes = ("$2a$", "$2b$", "$2y$")
+
+    def __init__(self, rounds: int = 12) -> None:
+        if not 4 <= rounds <= 31:
+            raise ValueError(f"bcrypt rounds must be between 4 and 31, got {rounds}")
+        self.rounds = rounds
+
+    def hash(self, password: str) -> str:
+        return bcrypt.hashpw(
+            password.encode("utf-8"), bcrypt.gensalt(rounds=self.rounds)
+        ).decode("utf-8")
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return bcrypt.checkpw(
+            password.encode("utf-8"), hashed_password.encode("utf-8")
+        )
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        try:
+            return int(hashed_password.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def describe(self) -> dict:
+        return {"algorithm": self.name, "rounds": self.rounds}
+
+
+class Argon2Hasher(PasswordHasher):
+    """
+    Argon2id via argon2-cffi.
+
+    Args:
+        time_cost (int): Number of iterations.
+        memory_cost (int): Memory usage in KiB.
+        parallelism (int): Number of lanes.
+    """
+
+    name = "argon2id"
+    prefixes = ("$argon2id$",)
+
+    def __init__(
+        self, time_cost: int = 3, memory_cost: int = 65536, parallelism: int = 4
+    ) -> None:
+        try:
+            import argon2
+        except ImportError as e:
+            raise RuntimeError(
+                "The argon2id password hasher requires the argon2-cffi package."
+            ) from e
+        self._argon2 = argon2
+        self.time_cost = time_cost
+        self.memory_cost = memory_cost
+        self.parallelism = parallelism
+        self._hasher = argon2.PasswordHasher(
+            time_cost=time_cost,
+            memory_cost=memory_cost,
+            parallelism=parallelism,
+            type=argon2.Type.ID,
+        )
+
+    def hash(self, password: str) -> str:
+        return self._hasher.hash(password)
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        try:
+            return self._hasher.verify(hashed_password, password)
+        except (
+            self._argon2.exceptions.VerifyMismatchError,
+            self._argon2.exceptions.VerificationError,
+            self._argon2.exceptions.InvalidHashError,
+        ):
+            return False
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        try:
+            return self._hasher.check_needs_rehash(hashed_password)
+        except self._argon2.exceptions.InvalidHashError:
+            return True
+
+    def describe(self) -> dict:
+        return {
+            "algorithm": self.name,
+            "time_cost": self.time_cost,
+            "memory_cost": self.memory_cost,
+            "parallelism": self.parallelism,
+        }
+
+
+def make_hasher(algorithm: str, **params: Any) -> PasswordHasher:
+    """
+    Build a hasher for the given algorithm name.
+
+    Args:
+        algorithm (str): Either "bcrypt" or "argon2id".
+        **params (Any): Cost parameters passed to the hasher.
+
+    Returns:
+        PasswordHasher: The configured hasher.
+
+    Raises:
+        ValueError: If the algorithm is not supported.
+    """
+    if algorithm == BcryptHasher.name:
+        return BcryptHasher(**params)
+    if algorithm == Argon2Hasher.name:
+        return Argon2Hasher(**params)
+    raise ValueError(f"Unsupported password hashing algorithm: {algorithm}")
+
+
+def configured_hasher() -> PasswordHasher:
+    """
+    Build the hasher selected by `PASSWORD_HASH_ALGORITHM` and its cost settings.
+    """
+    if PASSWORD_HASH_ALGORITHM == Argon2Hasher.name:
+        return make_hasher(
+            PASSWORD_HASH_ALGORITHM,
+            time_cost=ARGON2_TIME_COST,
+            memory_cost=ARGON2_MEMORY_COST,
+            parallelism=ARGON2_PARALLELISM,
+        )
+    return make_hasher(PASSWORD_HASH_ALGORITHM, rounds=BCRYPT_ROUNDS)
+
+
+def _time_verify(hasher: PasswordHasher, samples: int) -> float:
+    """Return the median time in seconds to verify a password with `hasher`."""
+    password = "Calibrate1!"
+    hashed_password = hasher.hash(password)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        hasher.verify(password, hashed_password)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def calibrate(
+    algorithm: str, target_ms: float, samples: int = 3, **fixed: Any
+) -> Tuple[PasswordHasher, float]:
+    """
+    Find the highest cost whose verification time stays within a latency target.
+
+    bcrypt's cost is its rounds (each step doubles the work); argon2id's is its
+    time cost, with memory cost and parallelism held at the values in `fixed`.
+    This is meant to be run once per hardware class (see `manage.py calibrate-hasher`)
+    and the result written to configuration, so that every worker uses the same
+    parameters and logins do not rehash back and forth between them.
+
+    Args:
+        algorithm (str): Either "bcrypt" or "argon2id".
+        target_ms (float): Target verification latency in milliseconds.
+        samples (int): Verifications timed per candidate cost.
+        **fixed (Any): Cost parameters that are not calibrated.
+
+    Returns:
+        Tuple[PasswordHasher, float]: The chosen hasher and its measured latency in milliseconds.
+    """
+    target = target_ms / 1000
+    if algorithm == BcryptHasher.name:
+        param, cost, limit = "rounds", 4, 31
+    elif algorithm == Argon2Hasher.name:
+        param, cost, limit = "time_cost", 1, 100
+    else:
+        raise ValueError(f"Unsupported password hashing algorithm: {algorithm}")
+
+    best = make_hasher(algorithm, **fixed, **{param: cost})
+    best_time = _time_verify(best, samples)
+    while cost < limit:
+        candidate = make_hasher(algorithm, **fixed, **{param: cost + 1})
+        elapsed = _time_verify(candidate, samples)
+        if elapsed > target:
+            break
+        best, best_time, cost = candidate, elapsed, cost + 1
+    logger.info(
+        f"Calibrated {best.describe()} at {best_time * 1000:.1f} ms per verification."
+    )
+    return best, best_time * 1000
+
+
+password_hasher = configured_hasher()
+_known_hashers: Dict[str, PasswordHasher] = {password_hasher.name: password_hasher}
+_hashers_lock = threading.Lock()
+
+
+def _hasher_for(hashed_password: str) -> PasswordHasher:
+    """Return a hasher able to verify a stored hash, whatever scheme produced it."""
+    if password_hasher.identifies(hashed_password):
+        return password_hasher
+    for cls in (BcryptHasher, Argon2Hasher):
+        if hashed_password.startswith(cls.prefixes):
+            with _hashers_lock:
+                if cls.name not in _known_hashers:
+                    _known_hashers[cls.name] = cls()
+                return _known_hashers[cls.name]
+    raise ValueError("Stored password hash uses an unknown scheme.")
+
+
+password_executor = PasswordExecutor(
+    max_workers=PASSWORD_HASH_WORKERS,
+    max_queue=PASSWORD_HASH_QUEUE_SIZE,
+    timeout=PASSWORD_HASH_TIMEOUT,
+)
+
+
+registry.register_stats(
+    "password_executor",
+    "Password hashing executor",
+    password_executor.stats,
+    counters=("completed", "rejected", "timed_out", "wait_time_total", "run_time_total"),
+)
+
+
+def _hash(password: str) -> str:
+    hasher = password_hasher
+    with PASSWORD_HASH_DURATION.labels("hash", hasher.name).time():
+        return hasher.hash(password)
+
+
+def _check(password: str, hashed_password: str) -> bool:
+    hasher = _hasher_for(hashed_password)
+    with PASSWORD_HASH_DURATION.labels("verify", hasher.name).time():
+        return hasher.verify(password, hashed_password)
+
+
+def hash_password(password: str) -> str:
+    """
+    Hash a password with the configured hasher on the password executor.
+
+    Args:
+        password (str): The plain-text password.
+
+    Returns:
+        str: The encoded password hash.
+
+    Raises:
+        HasherOverloaded: If hashing capacity is exhausted.
+    """
+    return password_executor.run(_hash, password)
+
+
+def check_password(password: str, hashed_password: str) -> bool:
+    """
+    Verify a password against a stored hash on the password executor.
+
+    Hashes produced by any supported scheme can be verified, regardless of which
+    one is currently configured.
+
+    Args:
+        password (str): The plain-text password supplied by the user.
+        hashed_password (str): The hash stored for the user.
+
+    Returns:
+        bool: True if the password matches, False otherwise.
+
+    Raises:
+        HasherOverloaded: If hashing capacity is exhausted.
+    """
+    return password_executor.run(_check, password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    """
+    Asyncio counterpart of `hash_password`.
+    """
+    return await password_executor.run_async(_hash, password)
+
+
+async def check_password_async(password: str, hashed_password: str) -> bool:
+    """
+    Asyncio counterpart of `check_password`.
+    """
+    return await password_executor.run_async(_check, password, hashed_password)
+
+
+def hash_passwords(passwords: Iterable[str], executor: ThreadPoolExecutor) -> List[str]:
+    """
+    Hash many passwords at once for bulk work such as imports.
+
+    The work runs on the caller's executor rather than `password_executor`, so a bulk
+    job can use every core without shedding interactive logins. Both bcrypt and
+    argon2-cffi release the GIL while hashing, so threads run in parallel.
+
+    Args:
+        passwords (Iterable[str]): The plain-text passwords.
+        executor (ThreadPoolExecutor): The pool to hash on, sized for the job.
+
+    Returns:
+        List[str]: The encoded hashes, in the order of `passwords`.
+    """
+    return list(executor.map(_hash, passwords))
+
+
+async def hash_passwords_async(passwords: Iterable[str], executor: ThreadPoolExecutor) -> List[str]:
+    """
+    Asyncio counterpart of `hash_passwords`.
+    """
+    return list(
+        await asyncio.gather(
+            *(asyncio.wrap_future(executor.submit(_hash, password)) for password in passwords)
+        )
+    )
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """
+    Check whether a stored hash was made with a different scheme or cost than configured.
+
+    Args:
+        hashed_password (str): The hash stored for the user.
+
+    Returns:
+        bool: True if the hash should be replaced on the user's next successful login.
+    """
+    if not password_hasher.identifies(hashed_password):
+        return True
+    return password_hasher.needs_rehash(hashed_password)
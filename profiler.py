@@ -0,0 +1,220 @@
+"""
+File: profiler.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import os
+import random
+import signal
+import sys
+import threading
+from collections import Counter
+from types import FrameType
+from typing import Any, Dict, List, Optional
+from config import PROFILER_INTERVAL, PROFILER_OUTPUT, PROFILER_SAMPLE_RATE
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame: Optional[FrameType], root: str) -> str:
+    """
+    Render a thread's stack as one line of the "folded" format used by flame graph tools.
+
+    Args:
+        frame (FrameType, optional): The innermost frame of the stack.
+        root (str): Name of the outermost entry, such as the endpoint being served.
+
+    Returns:
+        str: Frame names from outermost to innermost, separated by semicolons.
+    """
+    names: List[str] = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.append(root)
+    names.reverse()
+    return ";".join(names)
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for a sampled fraction of requests.
+
+    While running, a background thread wakes every `interval` seconds and records the
+    stack of each thread that is serving a sampled request. Identical stacks are counted
+    rather than stored, so memory grows with the number of distinct code paths, not with
+    traffic. Unsampled requests pay for one random number.
+
+    The aggregated samples are written in the folded format (`stack count` per line),
+    which `flamegraph.pl`, speedscope and similar tools read directly.
+
+    Args:
+        rate (float): Fraction of requests to sample, between 0 and 1.
+        interval (float): Seconds between samples.
+        output (str): Path of the folded output file; `{pid}` is replaced by the process ID.
+    """
+
+    def __init__(
+        self,
+        rate: float = PROFILER_SAMPLE_RATE,
+        interval: float = PROFILER_INTERVAL,
+        output: str = PROFILER_OUTPUT,
+    ) -> None:
+        self.rate = rate
+        self.interval = interval
+        self.output = output
+        self._lock = threading.Lock()
+        self._tracked: Dict[int, str] = {}
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        """
+        Start sampling, discarding the samples of any previous run.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stacks.clear()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started for {self.rate:.0%} of requests.")
+
+    def stop(self) -> Optional[str]:
+        """
+        Stop sampling and write the aggregated stacks.
+
+        Returns:
+            str, optional: The path written, or None if the profiler was not running.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return None
+        self._stop.set()
+        thread.join()
+        with self._lock:
+            self._tracked.clear()
+        return self.dump()
+
+    def toggle(self) -> None:
+        """
+        Start the profiler if it is stopped, or stop it and write its output.
+        """
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def handle_signal(self, signum: int, frame: Optional[FrameType]) -> None:
+        """
+        Signal handler calling `toggle` on another thread, so that it never blocks on a
+        lock held by the code the signal interrupted.
+        """
+        threading.Thread(target=self.toggle, name="sampling-profiler-toggle").start()
+
+    def begin_request(self, endpoint: str) -> bool:
+        """
+        Decide whether the current request is sampled and, if so, start tracking its thread.
+
+        Args:
+            endpoint (str): Name of the endpoint, used as the root of the request's stacks.
+
+        Returns:
+            bool: True if the request is being sampled.
+        """
+        if self._thread is None or random.random() >= self.rate:
+            return False
+        with self._lock:
+            self._tracked[threading.get_ident()] = endpoint
+        return True
+
+    def end_request(self) -> None:
+        """
+        Stop tracking the current thread.
+        """
+        with self._lock:
+            self._tracked.pop(threading.get_ident(), None)
+
+    def dump(self) -> str:
+        """
+        Write the stacks collected so far in folded format.
+
+        Returns:
+            str: The path written.
+        """
+        path = self.output.format(pid=os.getpid())
+        with self._lock:
+            stacks = self._stacks.most_common()
+        with open(path, "w") as f:
+            for stack, count in stacks:
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Wrote {len(stacks)} distinct stacks to {path}.")
+        return path
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                tracked = list(self._tracked.items())
+            if not tracked:
+                continue
+            frames = sys._current_frames()
+            samples = [
+                collapse(frames[ident], endpoint)
+                for ident, endpoint in tracked
+                if ident in frames
+            ]
+            with self._lock:
+                self._stacks.update(samples)
+
+
+profiler = SamplingProfiler()
+
+
+def instrument(app: Any, request: Any, g: Any) -> None:
+    """
+    Offer every request to the profiler and let operators toggle it with SIGUSR2.
+
+    Sending SIGUSR2 to a worker starts profiling; sending it again stops profiling and
+    writes the worker's folded stacks to `PROFILER_OUTPUT`.
+
+    Args:
+        app (Any): The Flask application.
+        request (Any): Flask's request proxy.
+        g (Any): Flask's application context globals.
+    """
+
+    def begin_profile() -> None:
+        g.profiled = profiler.begin_request(request.endpoint or "unmatched")
+
+    def end_profile(exc: Optional[BaseException]) -> None:
+        if g.pop("profiled", False):
+            profiler.end_request()
+
+    app.before_request(begin_profile)
+    app.teardown_request(end_profile)
+
+    if hasattr(signal, "SIGUSR2"):
+        try:
+            signal.signal(signal.SIGUSR2, profiler.handle_signal)
+        except ValueError:
+            # Signal handlers can only be installed from the main thread.
+            logger.warning("Could not install the SIGUSR2 profiler toggle outside the main thread.")
@@ -0,0 +1,115 @@
+"""
+File: profiles.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import json
+import threading
+from typing import Optional, Tuple
+from cache import TTLCache
+from config import PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL
+from metrics import registry
+
+
+def profile_etag(user_id: int, version: str) -> str:
+    """
+    Build the entity tag of a user's profile from the row version.
+
+    Args:
+        user_id (int): The user's ID.
+        version (str): The row's `xmin`, which changes whenever the row is updated.
+
+    Returns:
+        str: The unquoted entity tag.
+    """
+    return f"{user_id}-{version}"
+
+
+def encode_profile(user_data: dict) -> bytes:
+    """
+    Serialize a profile once, so that cached reads do not serialize it again.
+
+    Args:
+        user_data (dict): The output of `serialize_user`.
+
+    Returns:
+        bytes: The JSON response body.
+    """
+    return json.dumps(user_data).encode()
+
+
+class ProfileCache:
+    """
+    Bounded cache of serialized user profiles and their entity tags.
+
+    Entries expire after `ttl` seconds, which bounds how long other worker processes
+    can serve a profile after it changes; writers in this process call `invalidate`.
+    A reader that started before an invalidation cannot store what it read, so a
+    concurrent update is never hidden behind a stale entry.
+
+    Args:
+        maxsize (int): Maximum number of profiles held.
+        ttl (float): Lifetime of an entry in seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._cache = TTLCache(maxsize, ttl)
+        self._lock = threading.Lock()
+        self._invalidations = 0
+
+    def get(self, user_id: int) -> Optional[Tuple[str, bytes]]:
+        """
+        Return the cached `(etag, body)` of a profile, or None.
+        """
+        return self._cache.get(user_id)
+
+    def generation(self) -> int:
+        """
+        Return a value to pass to `set` for data read after this call.
+        """
+        return self._invalidations
+
+    def set(self, user_id: int, etag: str, body: bytes, generation: int) -> None:
+        """
+        Cache a profile unless any profile was invalidated since `generation` was taken.
+
+        Args:
+            user_id (int): The user's ID.
+            etag (str): The profile's entity tag.
+            body (bytes): The serialized profile.
+            generation (int): The value of `generation()` read before the profile was queried.
+        """
+        with self._lock:
+            if generation == self._invalidations:
+                self._cache.set(user_id, (etag, body))
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Drop a user's cached profile after it was updated or deleted.
+        """
+        with self._lock:
+            self._invalidations += 1
+            self._cache.pop(int(user_id))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._invalidations += 1
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+profile_cache = ProfileCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+
+registry.register_stats(
+    "profile_cache",
+    "User profile cache",
+    profile_cache.stats,
+    counters=("hits", "misses", "evictions"),
+)
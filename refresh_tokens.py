@@ -0,0 +1,214 @@
+"""
+File: refresh_tokens.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import secrets
+from typing import Optional, Tuple
+import psycopg2.extensions
+from config import REFRESH_TOKEN_LIFETIME_DAYS
+from db import db_connect
+from revocation import token_digest
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_ISSUE = """
+    INSERT INTO refresh_tokens (token_hash, family_id, user_id, expires_at)
+    VALUES ({0}, {1}, {2}, now() + make_interval(days => {3}))
+"""
+
+# Marks the presented token used and issues its successor in the same family, returning
+# what the new access token needs. Only an unused, unexpired token matches.
+_ROTATE = """
+    WITH used AS (
+        UPDATE refresh_tokens SET used_at = now()
+        WHERE token_hash = {0} AND used_at IS NULL AND expires_at > now()
+        RETURNING family_id, user_id
+    ), issued AS (
+        INSERT INTO refresh_tokens (token_hash, family_id, user_id, expires_at)
+        SELECT {1}, family_id, user_id, now() + make_interval(days => {2}) FROM used
+    )
+    SELECT users.user_id, users.admin, users.email_address, users.token_epoch
+    FROM used JOIN users ON users.user_id = used.user_id
+"""
+
+# A token that has already been used is being presented again, so it has leaked:
+# revoke every token descended from the same login.
+_REVOKE_REUSED = """
+    DELETE FROM refresh_tokens WHERE family_id = (
+        SELECT family_id FROM refresh_tokens WHERE token_hash = {0} AND used_at IS NOT NULL
+    )
+    RETURNING user_id
+"""
+
+_REVOKE_FAMILY = """
+    DELETE FROM refresh_tokens WHERE family_id = (
+        SELECT family_id FROM refresh_tokens WHERE token_hash = {0}
+    ) AND user_id = {1}
+"""
+
+ISSUE = _ISSUE.format("%s", "%s", "%s", "%s")
+ROTATE = _ROTATE.format("%s", "%s", "%s")
+REVOKE_REUSED = _REVOKE_REUSED.format("%s")
+REVOKE_FAMILY = _REVOKE_FAMILY.format("%s", "%s")
+REVOKE_USER = "DELETE FROM refresh_tokens WHERE user_id = %s"
+
+ISSUE_ASYNC = _ISSUE.format("$1", "$2", "$3", "$4")
+ROTATE_ASYNC = _ROTATE.format("$1", "$2", "$3")
+REVOKE_REUSED_ASYNC = _REVOKE_REUSED.format("$1")
+REVOKE_FAMILY_ASYNC = _REVOKE_FAMILY.format("$1", "$2")
+REVOKE_USER_ASYNC = "DELETE FROM refresh_tokens WHERE user_id = $1"
+
+
+def new_refresh_token() -> Tuple[str, bytes]:
+    """
+    Generate a refresh token.
+
+    Refresh tokens are 256-bit random strings, so storing their SHA-256 digest is enough
+    to make a leaked table useless; no slow password hash is needed to look one up.
+
+    Returns:
+        Tuple[str, bytes]: The token to hand to the client and the digest to store.
+    """
+    token = secrets.token_urlsafe(32)
+    return token, token_digest(token)
+
+
+def issue_refresh_token(cursor: psycopg2.extensions.cursor, user_id: int) -> str:
+    """
+    Store a refresh token starting a new family, using the caller's transaction.
+
+    Args:
+        cursor (psycopg2.extensions.cursor): A cursor on the connection the caller will commit.
+        user_id (int): The ID of the user logging in.
+
+    Returns:
+        str: The refresh token.
+    """
+    token, digest = new_refresh_token()
+    cursor.execute(ISSUE, (digest, secrets.token_bytes(16), user_id, REFRESH_TOKEN_LIFETIME_DAYS))
+    return token
+
+
+def rotate_refresh_token(
+    cursor: psycopg2.extensions.cursor, token: str
+) -> Optional[Tuple[str, tuple]]:
+    """
+    Exchange a refresh token for its successor, using the caller's transaction.
+
+    A valid token is consumed and replaced with a single indexed statement. If the token
+    was already consumed, its whole family is revoked, which logs out both the attacker
+    and the legitimate holder; the caller must commit for the revocation to take effect.
+
+    Args:
+        cursor (psycopg2.extensions.cursor): A cursor on the connection the caller will commit.
+        token (str): The refresh token presented by the client.
+
+    Returns:
+        Tuple[str, tuple], optional: The new refresh token and the user's ID, admin flag, email
+                                     address and token epoch, or None if the token is unknown,
+                                     expired or reused.
+    """
+    new_token, new_digest = new_refresh_token()
+    cursor.execute(ROTATE, (token_digest(token), new_digest, REFRESH_TOKEN_LIFETIME_DAYS))
+    user = cursor.fetchone()
+    if user is not None:
+        return new_token, user
+
+    cursor.execute(REVOKE_REUSED, (token_digest(token),))
+    revoked = cursor.fetchone()
+    if revoked is not None:
+        logger.warning("Refresh token reused, revoked its family for user ID: %s", revoked[0])
+    return None
+
+
+def revoke_refresh_token(cursor: psycopg2.extensions.cursor, token: str, user_id: int) -> None:
+    """
+    Revoke a refresh token and every token rotated from the same login.
+
+    Args:
+        cursor (psycopg2.extensions.cursor): A cursor on the connection the caller will commit.
+        token (str): The refresh token.
+        user_id (int): The ID of the user the token must belong to.
+    """
+    cursor.execute(REVOKE_FAMILY, (token_digest(token), user_id))
+
+
+def revoke_user_refresh_tokens(cursor: psycopg2.extensions.cursor, user_id: int) -> None:
+    """
+    Revoke every refresh token issued to a user.
+
+    Args:
+        cursor (psycopg2.extensions.cursor): A cursor on the connection the caller will commit.
+        user_id (int): The ID of the user.
+    """
+    cursor.execute(REVOKE_USER, (user_id,))
+
+
+def purge_expired_refresh_tokens(
+    batch_size: int = 1000, max_batches: Optional[int] = None
+) -> int:
+    """
+    Delete expired refresh tokens in bounded batches, like `revocation.purge_expired_revocations`.
+
+    Args:
+        batch_size (int): Maximum number of rows deleted per transaction.
+        max_batches (int, optional): Stop after this many batches.
+
+    Returns:
+        int: The number of rows deleted.
+    """
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with db_connect() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM refresh_tokens WHERE token_hash IN (
+                    SELECT token_hash FROM refresh_tokens
+                    WHERE expires_at < now()
+                    LIMIT %s FOR UPDATE SKIP LOCKED
+                )
+                """,
+                (batch_size,),
+            )
+            removed = cur.rowcount
+            conn.commit()
+        deleted += removed
+        batches += 1
+        if removed < batch_size:
+            break
+    logger.info(f"Purged {deleted} expired refresh tokens in {batches} batches.")
+    return deleted
+
+
+async def issue_refresh_token_async(conn, user_id: int) -> str:
+    """
+    Asyncio counterpart of `issue_refresh_token`, taking an asyncpg connection.
+    """
+    token, digest = new_refresh_token()
+    await conn.execute(ISSUE_ASYNC, digest, secrets.token_bytes(16), user_id, REFRESH_TOKEN_LIFETIME_DAYS)
+    return token
+
+
+async def rotate_refresh_token_async(conn, token: str) -> Optional[Tuple[str, tuple]]:
+    """
+    Asyncio counterpart of `rotate_refresh_token`, taking an asyncpg connection. Each
+    statement commits on its own, so no transaction is needed.
+    """
+    new_token, new_digest = new_refresh_token()
+    user = await conn.fetchrow(ROTATE_ASYNC, token_digest(token), new_digest, REFRESH_TOKEN_LIFETIME_DAYS)
+    if user is not None:
+        return new_token, tuple(user)
+
+    user_id = await conn.fetchval(REVOKE_REUSED_ASYNC, token_digest(token))
+    if user_id is not None:
+        logger.warning("Refresh token reused, revoked its family for user ID: %s", user_id)
+    return None
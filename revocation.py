@@ -0,0 +1,546 @@
+"""
+File: revocation.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import datetime
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+import psycopg2.extensions
+from cache import TTLCache
+from db import db_connect
+from metrics import registry
+from config import (
+    REVOCATION_BLOOM_CAPACITY,
+    REVOCATION_BLOOM_ERROR_RATE,
+    REVOCATION_LRU_SIZE,
+    REVOCATION_RESYNC_INTERVAL,
+    TOKEN_EPOCH_CACHE_SIZE,
+    TOKEN_EPOCH_CACHE_TTL,
+)
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Channel notified after every revocation, and the advisory lock key that orders them.
+REVOCATION_CHANNEL = "revocations"
+REVOCATION_LOCK_KEY = 7301
+
+
+def token_digest(token: str) -> bytes:
+    """
+    Compute the fixed-size digest used to identify a token in revocation structures.
+
+    Args:
+        token (str): The encoded JWT.
+
+    Returns:
+        bytes: The 32-byte SHA-256 digest of the token.
+    """
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+class BloomFilter:
+    """
+    Bloom filter over token digests.
+
+    Membership tests can return false positives but never false negatives, so a
+    negative answer proves that a token has not been revoked. Bit positions are
+    derived from the (already uniformly distributed) SHA-256 digest by double hashing.
+
+    Args:
+        capacity (int): Expected number of items.
+        error_rate (float): Target false-positive probability at `capacity` items.
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        capacity = max(capacity, 1)
+        self.num_bits = max(
+            8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        )
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest: bytes) -> Iterable[int]:
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, digest: bytes) -> None:
+        for pos in self._positions(digest):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(
+            self._bits[pos >> 3] & (1 << (pos & 7))
+            for pos in self._positions(digest)
+        )
+
+
+def token_expiry(exp: Optional[float]) -> datetime.datetime:
+    """
+    Convert a token's `exp` claim into the timestamp stored alongside its revocation.
+
+    Args:
+        exp (float, optional): The `exp` claim in seconds since the epoch.
+
+    Returns:
+        datetime.datetime: The aware expiry time; tokens without `exp` never expire.
+    """
+    if exp is None:
+        return datetime.datetime.max.replace(tzinfo=datetime.timezone.utc)
+    return datetime.datetime.fromtimestamp(exp, tz=datetime.timezone.utc)
+
+
+def revoke_token(
+    cursor: psycopg2.extensions.cursor, token: str, exp: Optional[float]
+) -> None:
+    """
+    Insert a revocation for a token using the caller's transaction.
+
+    Revocation writes are serialized with a transaction-scoped advisory lock so that
+    `revocation_id` values become visible in the order they were assigned, which lets
+    feed consumers advance their cursor without skipping a late-committing entry.
+    Subscribers are woken with NOTIFY once the caller commits.
+
+    Args:
+        cursor (psycopg2.extensions.cursor): A cursor on the connection the caller will commit.
+        token (str): The encoded JWT to revoke.
+        exp (float, optional): The token's `exp` claim.
+    """
+    cursor.execute(
+        f"""
+        SELECT pg_advisory_xact_lock(%s);
+        INSERT INTO blacklisted_tokens (token_hash, expires_at, blacklisted_at)
+        VALUES (%s, %s, %s) ON CONFLICT (token_hash) DO NOTHING;
+        NOTIFY {REVOCATION_CHANNEL};
+        """,
+        (
+            REVOCATION_LOCK_KEY,
+            token_digest(token),
+            token_expiry(exp),
+            datetime.datetime.now(),
+        ),
+    )
+
+
+def purge_expired_revocations(
+    batch_size: int = 1000, max_batches: Optional[int] = None
+) -> int:
+    """
+    Delete revocations whose tokens have expired, in bounded batches.
+
+    Each batch is deleted and committed in its own short transaction so that the
+    purge never holds locks on a large part of the table.
+
+    Args:
+        batch_size (int): Maximum number of rows deleted per transaction.
+        max_batches (int, optional): Stop after this many batches.
+
+    Returns:
+        int: The number of rows deleted.
+    """
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with db_connect() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM blacklisted_tokens WHERE token_hash IN (
+                    SELECT token_hash FROM blacklisted_tokens
+                    WHERE expires_at < now()
+                    LIMIT %s FOR UPDATE SKIP LOCKED
+                )
+                """,
+                (batch_size,),
+            )
+            removed = cur.rowcount
+            conn.commit()
+        deleted += removed
+        batches += 1
+        if removed < batch_size:
+            break
+    logger.info(f"Purged {deleted} expired token revocations in {batches} batches.")
+    return deleted
+
+
+def _load_revoked_tokens() -> Iterable[bytes]:
+    """Fetch the digests of every unexpired revoked token from the database."""
+    with db_connect() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT token_hash FROM blacklisted_tokens WHERE expires_at > now()"
+        )
+        return [bytes(row[0]) for row in cur.fetchall()]
+
+
+def _check_revoked_token(digest: bytes) -> bool:
+    """Look a single token digest up in the database."""
+    with db_connect() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT 1 FROM blacklisted_tokens WHERE token_hash = %s", (digest,)
+        )
+        return cur.fetchone() is not None
+
+
+class RevocationCache:
+    """
+    In-process cache answering "has this token been revoked?".
+
+    A Bloom filter holding every revoked token digest answers the common case
+    (token not revoked) without touching the database. Tokens that hit the filter
+    are looked up in an LRU of confirmed revocations, whose entries expire at the
+    token's own `exp`, and only fall through to the database on a miss there.
+    The filter is rebuilt from the `blacklisted_tokens` table every
+    `resync_interval` seconds, which bounds how long a revocation made by another
+    worker process can go unnoticed.
+
+    Args:
+        capacity (int): Expected number of revoked tokens (sizes the Bloom filter).
+        error_rate (float): Target Bloom filter false-positive rate.
+        lru_size (int): Maximum number of confirmed revocations kept in memory.
+        resync_interval (float): Seconds between rebuilds from the database.
+        loader (Callable, optional): Returns the digests of all revoked tokens.
+        checker (Callable, optional): Returns whether a single token digest is revoked.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 100000,
+        error_rate: float = 0.001,
+        lru_size: int = 10000,
+        resync_interval: float = 30.0,
+        loader: Optional[Callable[[], Iterable[bytes]]] = None,
+        checker: Optional[Callable[[bytes], bool]] = None,
+    ) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.lru_size = lru_size
+        self.resync_interval = resync_interval
+        self._loader = loader or _load_revoked_tokens
+        self._checker = checker or _check_revoked_token
+        self._lock = threading.Lock()
+        self._resync_lock = threading.Lock()
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._confirmed: OrderedDict = OrderedDict()
+        self._synced_at: Optional[float] = None
+        self._counters = {
+            "checks": 0,
+            "bloom_negatives": 0,
+            "lru_hits": 0,
+            "db_lookups": 0,
+            "false_positives": 0,
+            "resyncs": 0,
+            "resync_failures": 0,
+        }
+
+    def is_revoked(self, token: str, exp: Optional[float] = None) -> bool:
+        """
+        Check whether a token has been revoked.
+
+        Args:
+            token (str): The encoded JWT.
+            exp (float, optional): The token's `exp` claim, used to expire the cache entry.
+
+        Returns:
+            bool: True if the token has been revoked, False otherwise.
+
+        Raises:
+            Exception: If the cache has never been loaded and the database is unreachable,
+                       or if a database lookup is required and fails.
+        """
+        self._maybe_resync()
+        cached = self.lookup(token)
+        if cached is not None:
+            return cached
+        revoked = self._checker(token_digest(token))
+        self.confirm(token, revoked, exp)
+        return revoked
+
+    def lookup(self, token: str) -> Optional[bool]:
+        """
+        Answer a revocation check from memory alone, without resyncing.
+
+        Args:
+            token (str): The encoded JWT.
+
+        Returns:
+            Optional[bool]: True or False when known, or None when the token hit the Bloom
+                            filter and must be confirmed against the database (see `confirm`).
+        """
+        digest = token_digest(token)
+        with self._lock:
+            self._counters["checks"] += 1
+            if digest not in self._bloom:
+                self._counters["bloom_negatives"] += 1
+                return False
+            expires_at = self._confirmed.get(digest)
+            if expires_at is not None:
+                if expires_at > time.time():
+                    self._confirmed.move_to_end(digest)
+                    self._counters["lru_hits"] += 1
+                    return True
+                del self._confirmed[digest]
+            self._counters["db_lookups"] += 1
+        return None
+
+    def confirm(self, token: str, revoked: bool, exp: Optional[float] = None) -> None:
+        """
+        Record the database's answer for a token that `lookup` could not decide.
+
+        Args:
+            token (str): The encoded JWT.
+            revoked (bool): Whether the database holds a revocation for the token.
+            exp (float, optional): The token's `exp` claim.
+        """
+        with self._lock:
+            if revoked:
+                self._remember(token_digest(token), exp)
+            else:
+                self._counters["false_positives"] += 1
+
+    def add(self, token: str, exp: Optional[float] = None) -> None:
+        """
+        Record a revocation made by this process so it takes effect immediately.
+
+        Args:
+            token (str): The encoded JWT that has just been revoked.
+            exp (float, optional): The token's `exp` claim.
+        """
+        digest = token_digest(token)
+        with self._lock:
+            self._bloom.add(digest)
+            self._remember(digest, exp)
+
+    def resync(self) -> None:
+        """
+        Rebuild the Bloom filter from the database.
+
+        Raises:
+            Exception: If the revoked tokens cannot be loaded.
+        """
+        self.load(self._loader())
+
+    def load(self, digests: Iterable[bytes]) -> None:
+        """
+        Replace the Bloom filter with one built from the given revoked token digests.
+
+        Args:
+            digests (Iterable[bytes]): Digests of every unexpired revoked token.
+        """
+        digests = list(digests)
+        bloom = BloomFilter(max(self.capacity, 2 * len(digests)), self.error_rate)
+        for digest in digests:
+            bloom.add(digest)
+        with self._lock:
+            # Revocations recorded locally while loading must survive the swap.
+            for digest in self._confirmed:
+                bloom.add(digest)
+            self._bloom = bloom
+            self._synced_at = time.monotonic()
+            self._counters["resyncs"] += 1
+        logger.info(f"Revocation cache resynced with {len(digests)} revoked tokens.")
+
+    @property
+    def loaded(self) -> bool:
+        """
+        Whether the cache has been loaded from the database at least once.
+        """
+        return self._synced_at is not None
+
+    def stats(self) -> dict:
+        """
+        Return the cache's counters and current size.
+
+        Returns:
+            dict: Lookup counters together with `bloom_items` and `confirmed_size`.
+        """
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["bloom_items"] = self._bloom.count
+            snapshot["confirmed_size"] = len(self._confirmed)
+        return snapshot
+
+    def _remember(self, digest: bytes, exp: Optional[float]) -> None:
+        """Insert into the confirmed-revocation LRU. Caller must hold `_lock`."""
+        self._confirmed[digest] = float(exp) if exp is not None else math.inf
+        self._confirmed.move_to_end(digest)
+        while len(self._confirmed) > self.lru_size:
+            self._confirmed.popitem(last=False)
+
+    def _maybe_resync(self) -> None:
+        """Resync when due. Only the first load blocks concurrent callers."""
+        synced_at = self._synced_at
+        if (
+            synced_at is not None
+            and time.monotonic() - synced_at < self.resync_interval
+        ):
+            return
+        if not self._resync_lock.acquire(blocking=synced_at is None):
+            return
+        try:
+            if self._synced_at != synced_at:
+                return
+            self.resync()
+        except Exception as e:
+            with self._lock:
+                self._counters["resync_failures"] += 1
+            if synced_at is None:
+                raise
+            logger.error(f"Error resyncing revocation cache: {str(e)}")
+            self._synced_at = time.monotonic()
+        finally:
+            self._resync_lock.release()
+
+
+def _load_token_epoch(user_id: int) -> Optional[int]:
+    """Fetch a user's current token epoch, or None if the user does not exist."""
+    with db_connect() as conn, conn.cursor() as cur:
+        cur.execute("SELECT token_epoch FROM users WHERE user_id = %s", (user_id,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+
+_NOT_CACHED = object()
+
+
+def epoch_is_stale(claims: dict, epoch: Optional[int]) -> bool:
+    """
+    Check a token's `token_epoch` claim against its user's current epoch.
+
+    Args:
+        claims (dict): The decoded token claims.
+        epoch (Optional[int]): The user's current epoch, or None if the user does not exist.
+
+    Returns:
+        bool: True if the token must be rejected.
+    """
+    return epoch is None or claims.get("token_epoch", 0) < epoch
+
+
+class TokenEpochCache:
+    """
+    Cache of each user's current token epoch.
+
+    Every issued token carries the `token_epoch` it was minted in, and a token is
+    stale once the user's epoch has moved past it. Epochs are cached for `ttl`
+    seconds, so a bump made by another worker process takes effect there within
+    that window; bumps made by this process take effect immediately.
+
+    Args:
+        maxsize (int): Maximum number of users whose epoch is cached.
+        ttl (float): Seconds an epoch is trusted before it is re-read.
+        loader (Callable, optional): Returns a user's epoch, or None if the user does not exist.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        ttl: float = 30.0,
+        loader: Optional[Callable[[int], Optional[int]]] = None,
+    ) -> None:
+        self._cache = TTLCache(maxsize, ttl)
+        self._loader = loader or _load_token_epoch
+
+    def current(self, user_id: int) -> Optional[int]:
+        """
+        Return the user's current token epoch.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            Optional[int]: The epoch, or None if the user no longer exists.
+        """
+        found, epoch = self.peek(user_id)
+        if not found:
+            epoch = self._loader(int(user_id))
+            self.set(user_id, epoch)
+        return epoch
+
+    def peek(self, user_id: int) -> Tuple[bool, Optional[int]]:
+        """
+        Return the cached epoch without loading it.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            Tuple[bool, Optional[int]]: Whether an entry was cached, and the cached epoch.
+        """
+        epoch = self._cache.get(int(user_id), _NOT_CACHED)
+        if epoch is _NOT_CACHED:
+            return False, None
+        return True, epoch
+
+    def set(self, user_id: int, epoch: Optional[int]) -> None:
+        """
+        Record an epoch change made by this process.
+
+        Args:
+            user_id (int): The ID of the user.
+            epoch (Optional[int]): The new epoch, or None if the user was deleted.
+        """
+        self._cache.set(int(user_id), epoch)
+
+    def is_stale(self, claims: dict) -> bool:
+        """
+        Check whether a decoded token was issued before its user's current epoch.
+
+        Args:
+            claims (dict): The decoded token claims.
+
+        Returns:
+            bool: True if the token must be rejected.
+        """
+        return epoch_is_stale(claims, self.current(claims["user_id"]))
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+revocation_cache = RevocationCache(
+    capacity=REVOCATION_BLOOM_CAPACITY,
+    error_rate=REVOCATION_BLOOM_ERROR_RATE,
+    lru_size=REVOCATION_LRU_SIZE,
+    resync_interval=REVOCATION_RESYNC_INTERVAL,
+)
+
+
+token_epochs = TokenEpochCache(
+    maxsize=TOKEN_EPOCH_CACHE_SIZE,
+    ttl=TOKEN_EPOCH_CACHE_TTL,
+)
+
+registry.register_stats(
+    "revocation_cache",
+    "Revocation cache",
+    revocation_cache.stats,
+    counters=(
+        "checks",
+        "bloom_negatives",
+        "lru_hits",
+        "db_lookups",
+        "false_positives",
+        "resyncs",
+        "resync_failures",
+    ),
+)
+registry.register_stats(
+    "token_epoch_cache",
+    "Token epoch cache",
+    token_epochs.stats,
+    counters=("hits", "misses", "evictions"),
+)
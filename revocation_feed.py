@@ -0,0 +1,241 @@
+"""
+File: revocation_feed.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import select
+import threading
+from typing import List, Optional, Set, Tuple
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from config import REVOCATION_FEED_MAX_STREAMS
+from db import db_connect, open_connection
+from revocation import REVOCATION_CHANNEL
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+_FETCH = """
+    SELECT revocation_id, token_hash, expires_at FROM blacklisted_tokens
+    WHERE revocation_id > {} AND expires_at > now()
+    ORDER BY revocation_id LIMIT {}
+"""
+FETCH = _FETCH.format("%s", "%s")
+FETCH_ASYNC = _FETCH.format("$1", "$2")
+
+
+def _entries(rows) -> List[dict]:
+    return [
+        {
+            "cursor": row[0],
+            "token_hash": bytes(row[1]).hex(),
+            "expires_at": row[2].isoformat(),
+        }
+        for row in rows
+    ]
+
+
+def fetch_revocations(after: int, limit: int) -> List[dict]:
+    """
+    Return revocations with a cursor greater than `after`, oldest first.
+
+    Args:
+        after (int): The last cursor the consumer has seen (0 to start from the beginning).
+        limit (int): Maximum number of entries returned.
+
+    Returns:
+        List[dict]: Entries with `cursor`, `token_hash` (hex SHA-256 of the token) and `expires_at`.
+    """
+    with db_connect() as conn, conn.cursor() as cursor:
+        cursor.execute(FETCH, (after, limit))
+        rows = cursor.fetchall()
+    return _entries(rows)
+
+
+async def fetch_revocations_async(conn, after: int, limit: int) -> List[dict]:
+    """
+    Asyncio counterpart of `fetch_revocations`, taking an asyncpg connection.
+    """
+    return _entries(await conn.fetch(FETCH_ASYNC, after, limit))
+
+
+class RevocationNotifier:
+    """
+    Wakes waiting feed requests as soon as a revocation is committed by any process.
+
+    A single background thread per process holds a dedicated connection that LISTENs on
+    the revocation channel, so long-poll and SSE requests can wait on a condition variable,
+    or on an asyncio future with `wait_async`, instead of each holding a database
+    connection. If the listener cannot connect, waiters simply time out and re-query.
+
+    Args:
+        channel (str): The NOTIFY channel to listen on.
+        poll_interval (float): Seconds between checks for shutdown while idle.
+    """
+
+    def __init__(self, channel: str = REVOCATION_CHANNEL, poll_interval: float = 5.0) -> None:
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._async_waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def generation(self) -> int:
+        """
+        Counter incremented on every notification; capture it before querying the feed.
+        """
+        with self._cond:
+            return self._generation
+
+    def notify(self) -> None:
+        """
+        Wake every waiter.
+        """
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+            async_waiters, self._async_waiters = self._async_waiters, set()
+        for loop, future in async_waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def wait(self, generation: int, timeout: float) -> bool:
+        """
+        Block until a notification newer than `generation` arrives or `timeout` expires.
+
+        Args:
+            generation (int): The value of `generation` read before the caller's last query.
+            timeout (float): Maximum seconds to wait.
+
+        Returns:
+            bool: True if a notification arrived, False on timeout.
+        """
+        self.start()
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._generation != generation, timeout
+            )
+
+    async def wait_async(self, generation: int, timeout: float) -> bool:
+        """
+        Asyncio counterpart of `wait`; the event loop keeps running while it waits.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._cond:
+            if self._generation != generation:
+                return True
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+
+    def start(self) -> None:
+        """
+        Start the listener thread if it is not running.
+        """
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._listen, name="revocation-listener", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the listener thread.
+        """
+        self._stopped.set()
+
+    def _listen(self) -> None:
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = open_connection()
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                # Anything committed while we were disconnected must be picked up.
+                self.notify()
+                while not self._stopped.is_set():
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self.notify()
+            except (psycopg2.Error, OSError) as e:
+                logger.error(f"Revocation listener error: {str(e)}")
+                self._stopped.wait(self.poll_interval)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class StreamLimit:
+    """
+    Counts the open server-sent event streams and refuses new ones beyond a limit.
+
+    Args:
+        limit (int): Maximum number of streams open at once.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._open = 0
+
+    @property
+    def open(self) -> int:
+        """
+        Number of streams currently open.
+        """
+        with self._lock:
+            return self._open
+
+    def acquire(self) -> bool:
+        """
+        Reserve a stream.
+
+        Returns:
+            bool: False if the limit is reached; the caller must not open the stream.
+        """
+        with self._lock:
+            if self._open >= self.limit:
+                return False
+            self._open += 1
+            return True
+
+    def release(self) -> None:
+        """
+        Give back a stream reserved with `acquire`.
+        """
+        with self._lock:
+            self._open -= 1
+
+
+revocation_notifier = RevocationNotifier()
+stream_limit = StreamLimit(REVOCATION_FEED_MAX_STREAMS)
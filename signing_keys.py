@@ -0,0 +1,282 @@
+"""
+File: signing_keys.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+from config import JWT_KEYS_DIR, JWT_KEYS_RELOAD_INTERVAL
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ALGORITHMS = ("EdDSA", "RS256")
+KID_TIME_FORMAT = "%Y%m%dT%H%M%SZ"
+
+
+class SigningKey:
+    """
+    A private key used to sign access tokens, identified by its `kid`.
+
+    The key starts signing at `not_before`, which is encoded at the start of its `kid`
+    so that a key directory needs no separate manifest. Until then it is only published,
+    giving consumers time to fetch it before the first token signed with it arrives.
+
+    Args:
+        kid (str): The key ID placed in the header of every token the key signs.
+        private_key (Any): An Ed25519 or RSA private key from `cryptography`.
+        not_before (float): When the key starts signing, in seconds since the epoch.
+    """
+
+    __slots__ = ("kid", "private_key", "public_key", "algorithm", "not_before")
+
+    def __init__(self, kid: str, private_key, not_before: float) -> None:
+        self.kid = kid
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.algorithm = "EdDSA" if isinstance(private_key, ed25519.Ed25519PrivateKey) else "RS256"
+        self.not_before = not_before
+
+    def jwk(self) -> dict:
+        """
+        Return the public half of the key as a JSON Web Key.
+        """
+        converter = OKPAlgorithm if self.algorithm == "EdDSA" else RSAAlgorithm
+        jwk = converter.to_jwk(self.public_key, as_dict=True)
+        jwk.update({"kid": self.kid, "alg": self.algorithm, "use": "sig"})
+        return jwk
+
+
+def _not_before(kid: str) -> float:
+    stamp = kid.split("-", 1)[0]
+    return (
+        datetime.datetime.strptime(stamp, KID_TIME_FORMAT)
+        .replace(tzinfo=datetime.timezone.utc)
+        .timestamp()
+    )
+
+
+def load_keys(directory: str) -> List[SigningKey]:
+    """
+    Load every `<kid>.pem` private key in a directory.
+
+    Args:
+        directory (str): The key directory.
+
+    Returns:
+        List[SigningKey]: The keys, oldest first. Files that cannot be loaded are skipped.
+    """
+    keys = []
+    for name in os.listdir(directory):
+        if not name.endswith(".pem"):
+            continue
+        kid = name[: -len(".pem")]
+        try:
+            with open(os.path.join(directory, name), "rb") as f:
+                private_key = serialization.load_pem_private_key(f.read(), password=None)
+            keys.append(SigningKey(kid, private_key, _not_before(kid)))
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Skipping signing key {name}: {str(e)}")
+    keys.sort(key=lambda key: (key.not_before, key.kid))
+    return keys
+
+
+def create_key(directory: str, algorithm: str, not_before: float) -> SigningKey:
+    """
+    Generate a signing key and write it to the key directory, readable only by its owner.
+
+    Args:
+        directory (str): The key directory.
+        algorithm (str): Either "EdDSA" (Ed25519) or "RS256" (RSA-3072).
+        not_before (float): When the key starts signing, in seconds since the epoch.
+
+    Returns:
+        SigningKey: The new key.
+
+    Raises:
+        ValueError: If the algorithm is not supported.
+    """
+    if algorithm == "EdDSA":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    elif algorithm == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=3072)
+    else:
+        raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+
+    stamp = datetime.datetime.fromtimestamp(not_before, datetime.timezone.utc).strftime(KID_TIME_FORMAT)
+    kid = f"{stamp}-{secrets.token_hex(4)}"
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(os.path.join(directory, f"{kid}.pem"), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(pem)
+    logger.info(f"Created {algorithm} signing key {kid}.")
+    return SigningKey(kid, private_key, not_before)
+
+
+def retire_keys(directory: str, retire_after: float, now: Optional[float] = None) -> List[str]:
+    """
+    Delete keys that were superseded long enough ago that no token they signed is still valid.
+
+    A key stops signing when the next key's `not_before` passes. Tokens it signed remain
+    verifiable for `retire_after` seconds after that, which is the overlap window.
+
+    Args:
+        directory (str): The key directory.
+        retire_after (float): Seconds a superseded key stays published.
+        now (float, optional): The current time; defaults to `time.time()`.
+
+    Returns:
+        List[str]: The IDs of the deleted keys.
+    """
+    now = time.time() if now is None else now
+    keys = load_keys(directory)
+    retired = []
+    for key, successor in zip(keys, keys[1:]):
+        if successor.not_before <= now - retire_after:
+            os.remove(os.path.join(directory, f"{key.kid}.pem"))
+            retired.append(key.kid)
+            logger.info(f"Retired signing key {key.kid}.")
+    return retired
+
+
+class Keyring:
+    """
+    The signing keys shared by every worker, read from a directory.
+
+    The directory is re-read every `reload_interval` seconds, and at most once a second
+    when a token names a key this process has not loaded yet, so keys rotated by
+    `manage.py rotate-signing-key` are picked up without restarting.
+
+    Args:
+        directory (str, optional): The key directory. Without one the keyring is empty and
+            tokens fall back to HS256 with `FLASK_SECRET_KEY`.
+        reload_interval (float): Seconds between directory reads.
+        clock (Callable[[], float]): Source of the current time in seconds since the epoch.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str],
+        reload_interval: float,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._keys: List[SigningKey] = []
+        self._by_kid: Dict[str, SigningKey] = {}
+        self._loaded_at: Optional[float] = None
+        self._published: Optional[Tuple[List[SigningKey], str, bytes]] = None
+
+    def _load(self, max_age: float) -> List[SigningKey]:
+        now = self.clock()
+        with self._lock:
+            if self.directory is None or (
+                self._loaded_at is not None and now - self._loaded_at < max_age
+            ):
+                return self._keys
+            self._loaded_at = now
+        keys = load_keys(self.directory) if os.path.isdir(self.directory) else []
+        with self._lock:
+            self._keys = keys
+            self._by_kid = {key.kid: key for key in keys}
+        return keys
+
+    def keys(self) -> List[SigningKey]:
+        """
+        Return every published key, oldest first.
+        """
+        return self._load(self.reload_interval)
+
+    def stale(self) -> bool:
+        """
+        Return whether the next call to `keys` will re-read the directory.
+        """
+        with self._lock:
+            return self.directory is not None and (
+                self._loaded_at is None or self.clock() - self._loaded_at >= self.reload_interval
+            )
+
+    def reload(self) -> List[SigningKey]:
+        """
+        Re-read the directory now and return every published key, oldest first.
+        """
+        return self._load(0)
+
+    def signing_key(self) -> Optional[SigningKey]:
+        """
+        Return the newest key whose `not_before` has passed, or None if there is none.
+        """
+        now = self.clock()
+        current = None
+        for key in self.keys():
+            if key.not_before <= now:
+                current = key
+        return current
+
+    def activated_at(self) -> Optional[float]:
+        """
+        Return when the oldest published key started signing, or None if none has yet.
+        """
+        keys = self.keys()
+        if not keys or keys[0].not_before > self.clock():
+            return None
+        return keys[0].not_before
+
+    def get(self, kid: str) -> Optional[SigningKey]:
+        """
+        Return the published key with the given ID, or None if there is none.
+        """
+        self.keys()
+        key = self._by_kid.get(kid)
+        if key is None:
+            self._load(1.0)
+            key = self._by_kid.get(kid)
+        return key
+
+    def jwks(self) -> dict:
+        """
+        Return every published public key as a JSON Web Key Set.
+        """
+        return {"keys": [key.jwk() for key in self.keys()]}
+
+    def published(self) -> Tuple[str, bytes]:
+        """
+        Return the serialized JSON Web Key Set and its entity tag, rebuilt only when the
+        directory's keys change.
+
+        Returns:
+            Tuple[str, bytes]: The entity tag and the JSON body.
+        """
+        keys = self.keys()
+        published = self._published
+        if published is not None and published[0] is keys:
+            return published[1], published[2]
+        body = json.dumps({"keys": [key.jwk() for key in keys]}, sort_keys=True).encode("utf-8")
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        self._published = (keys, etag, body)
+        return etag, body
+
+
+keyring = Keyring(JWT_KEYS_DIR, JWT_KEYS_RELOAD_INTERVAL)
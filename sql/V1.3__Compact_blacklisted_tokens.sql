@@ -0,0 +1,29 @@
+-- 
+-- File: V1.3__Compact_blacklisted_tokens.sql
+-- Author: Jack McArdle
+
+-- This file is part of CommunityEye.
+
+-- Email: mcardle-j9@ulster.ac.uk
+-- B-No: B00733578
+-- 
+
+-- Key revocations by the SHA-256 digest of the token instead of the full JWT,
+-- and record when each token expires so that expired rows can be purged.
+ALTER TABLE blacklisted_tokens ADD COLUMN token_hash BYTEA;
+ALTER TABLE blacklisted_tokens ADD COLUMN expires_at TIMESTAMPTZ;
+
+-- Tokens issued before this migration lived for at most 30 minutes.
+UPDATE blacklisted_tokens
+SET token_hash = sha256(convert_to(token, 'UTF8')),
+    expires_at = blacklisted_at + INTERVAL '30 minutes';
+
+DELETE FROM blacklisted_tokens WHERE expires_at < now();
+
+ALTER TABLE blacklisted_tokens DROP CONSTRAINT blacklisted_tokens_pkey;
+ALTER TABLE blacklisted_tokens DROP COLUMN token;
+ALTER TABLE blacklisted_tokens ALTER COLUMN token_hash SET NOT NULL;
+ALTER TABLE blacklisted_tokens ALTER COLUMN expires_at SET NOT NULL;
+ALTER TABLE blacklisted_tokens ADD PRIMARY KEY (token_hash);
+
+CREATE INDEX blacklisted_tokens_expires_at_idx ON blacklisted_tokens (expires_at);
\ No newline at end of file
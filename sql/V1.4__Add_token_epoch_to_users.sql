@@ -0,0 +1,13 @@
+-- 
+-- File: V1.4__Add_token_epoch_to_users.sql
+-- Author: Jack McArdle
+
+-- This file is part of CommunityEye.
+
+-- Email: mcardle-j9@ulster.ac.uk
+-- B-No: B00733578
+-- 
+
+-- Tokens carry the epoch they were issued in; bumping it revokes every
+-- token issued to the user before the bump.
+ALTER TABLE users ADD COLUMN token_epoch INTEGER NOT NULL DEFAULT 0;
\ No newline at end of file
@@ -0,0 +1,14 @@
+-- 
+-- File: V1.5__Add_revocation_feed_cursor.sql
+-- Author: Jack McArdle
+
+-- This file is part of CommunityEye.
+
+-- Email: mcardle-j9@ulster.ac.uk
+-- B-No: B00733578
+-- 
+
+-- Monotonically increasing cursor for the /api/v1/revocations feed.
+ALTER TABLE blacklisted_tokens ADD COLUMN revocation_id BIGSERIAL;
+
+CREATE UNIQUE INDEX blacklisted_tokens_revocation_id_idx ON blacklisted_tokens (revocation_id);
\ No newline at end of file
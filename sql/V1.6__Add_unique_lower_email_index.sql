@@ -0,0 +1,13 @@
+-- 
+-- File: V1.6__Add_unique_lower_email_index.sql
+-- Author: Jack McArdle
+
+-- This file is part of CommunityEye.
+
+-- Email: mcardle-j9@ulster.ac.uk
+-- B-No: B00733578
+-- 
+
+-- Email addresses are unique regardless of case. Login and registration look
+-- users up by lower(email_address), so this index serves both.
+CREATE UNIQUE INDEX users_email_address_lower_idx ON users (lower(email_address));
\ No newline at end of file
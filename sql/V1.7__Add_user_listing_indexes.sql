@@ -0,0 +1,17 @@
+-- 
+-- File: V1.7__Add_user_listing_indexes.sql
+-- Author: Jack McArdle
+
+-- This file is part of CommunityEye.
+
+-- Email: mcardle-j9@ulster.ac.uk
+-- B-No: B00733578
+-- 
+
+-- Keyset pagination of the admin user listing walks (creation_time, user_id),
+-- optionally restricted to one city or to administrators.
+CREATE INDEX users_creation_time_user_id_idx ON users (creation_time, user_id);
+
+CREATE INDEX users_city_creation_time_user_id_idx ON users (city, creation_time, user_id);
+
+CREATE INDEX users_admin_creation_time_user_id_idx ON users (creation_time, user_id) WHERE admin;
\ No newline at end of file
@@ -0,0 +1,26 @@
+-- 
+-- File: V1.8__Create_refresh_tokens_table.sql
+-- Author: Jack McArdle
+
+-- This file is part of CommunityEye.
+
+-- Email: mcardle-j9@ulster.ac.uk
+-- B-No: B00733578
+-- 
+
+-- Rotating refresh tokens, keyed by the SHA-256 digest of the token. Every token
+-- rotated from the same login shares a family, which is revoked as a whole when a
+-- used token is presented again.
+CREATE TABLE refresh_tokens (
+    token_hash BYTEA PRIMARY KEY,
+    family_id BYTEA NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+    expires_at TIMESTAMPTZ NOT NULL,
+    used_at TIMESTAMPTZ
+);
+
+CREATE INDEX refresh_tokens_family_id_idx ON refresh_tokens (family_id);
+
+CREATE INDEX refresh_tokens_user_id_idx ON refresh_tokens (user_id);
+
+CREATE INDEX refresh_tokens_expires_at_idx ON refresh_tokens (expires_at);
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""
+File: test_app.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+from flask import request
+from quart import request as async_request
+import app
+import asgi
+from benchmark import measure_cold_start
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Fails the import if building the app touches the database or starts a subprocess.
+GUARDED_IMPORT = """
+import psycopg2, subprocess
+def refuse(*args, **kwargs):
+    raise AssertionError("side effect during import")
+psycopg2.connect = subprocess.run = subprocess.Popen = refuse
+import {module}
+"""
+
+
+class AppFactoryTestCase(unittest.TestCase):
+    def test_import_has_no_side_effects(self):
+        for module in ('app', 'asgi'):
+            result = subprocess.run(
+                [sys.executable, '-c', GUARDED_IMPORT.format(module=module)],
+                cwd=ROOT,
+                capture_output=True,
+                text=True,
+            )
+            self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_client_address_behind_trusted_proxy(self):
+        headers = {'X-Forwarded-For': '203.0.113.7, 198.51.100.1'}
+        for proxies, expected in ((0, '127.0.0.1'), (1, '198.51.100.1'), (2, '203.0.113.7')):
+            with patch('app.TRUSTED_PROXIES', proxies):
+                flask_app = app.create_app()
+            flask_app.add_url_rule('/whoami', 'whoami', lambda: request.remote_addr)
+            self.assertEqual(flask_app.test_client().get('/whoami', headers=headers).text, expected)
+
+    def test_measure_cold_start(self):
+        result = measure_cold_start('app', repeat=1)
+        self.assertEqual(len(result['samples_ms']), 1)
+        self.assertGreater(result['median_ms'], 0)
+
+
+class AsyncAppFactoryTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_client_address_behind_trusted_proxy(self):
+        with patch('asgi.TRUSTED_PROXIES', 1):
+            quart_app = asgi.create_async_app()
+
+        async def whoami():
+            return async_request.remote_addr
+
+        quart_app.add_url_rule('/whoami', 'whoami', whoami)
+        response = await quart_app.test_client().get('/whoami', headers={'X-Forwarded-For': '203.0.113.7'})
+        self.assertEqual(await response.get_data(as_text=True), '203.0.113.7')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+"""
+File: test_async.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import datetime
+import unittest
+from unittest.mock import patch, AsyncMock, MagicMock
+from quart import Quart
+from blueprints.auth.auth_async import auth_async_bp
+from blueprints.users.users_async import users_async_bp
+import jwt
+import config
+from profiles import profile_cache
+from revocation_feed import stream_limit
+from revocation import revocation_cache, token_epochs
+from throttle import login_throttle
+
+MOCK_TOKEN = jwt.encode({'user_id': 1, 'email_address': 'user@example.com', 'admin': False}, config.FLASK_SECRET_KEY, algorithm='HS256')
+
+
+def mock_async_db(mock_db):
+    mock_conn = AsyncMock()
+    mock_conn.transaction = MagicMock()
+    mock_db.return_value.__aenter__.return_value = mock_conn
+    return mock_conn
+
+
+class AsyncAppTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.app = Quart(__name__)
+        self.app.register_blueprint(auth_async_bp)
+        self.app.register_blueprint(users_async_bp)
+        self.client = self.app.test_client()
+
+        for target, name, kwargs in ((revocation_cache, 'lookup', {'return_value': False}),
+                                     (revocation_cache, 'add', {}),
+                                     (type(revocation_cache), 'loaded', {'new': True}),
+                                     (token_epochs, 'peek', {'return_value': (True, 0)}),
+                                     (token_epochs, 'set', {})):
+            patcher = patch.object(target, name, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        profile_cache.clear()
+        login_throttle.clear()
+
+    @patch('blueprints.users.users_async.async_db_connect')
+    async def test_get_user_success(self, mock_db):
+        mock_conn = mock_async_db(mock_db)
+        mock_conn.fetchrow.return_value = (1, 'John', 'Doe', 'john@example.com', '1234567890', 'Belfast', False, datetime.datetime(2024, 1, 1), '42')
+
+        response = await self.client.get('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await response.get_json())['email_address'], 'john@example.com')
+
+        response = await self.client.get('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN, 'If-None-Match': '"1-42"'})
+        self.assertEqual(response.status_code, 304)
+        mock_conn.fetchrow.assert_called_once()
+
+    @patch('blueprints.users.users_async.async_db_connect')
+    async def test_get_user_not_found(self, mock_db):
+        mock_conn = mock_async_db(mock_db)
+        mock_conn.fetchrow.return_value = None
+
+        response = await self.client.get('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_lookup_users_rejects_non_object_body(self):
+        response = await self.client.post('/api/v1/users/lookup', headers={'x-access-token': MOCK_TOKEN}, json=[1, 2])
+        self.assertEqual(response.status_code, 400)
+
+    async def test_get_user_missing_token(self):
+        response = await self.client.get('/api/v1/users/1')
+        self.assertEqual(response.status_code, 401)
+
+    @patch('async_decorators.async_db_connect')
+    async def test_unconfirmed_revocation_checks_database(self, mock_db):
+        mock_conn = mock_async_db(mock_db)
+        mock_conn.fetchval.return_value = 1
+        revocation_cache.lookup.return_value = None
+
+        with patch.object(revocation_cache, 'confirm') as mock_confirm:
+            response = await self.client.get('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN})
+        self.assertEqual(response.status_code, 401)
+        mock_confirm.assert_called_once_with(MOCK_TOKEN, True, None)
+
+    @patch('blueprints.users.users_async.async_db_connect')
+    async def test_update_user_builds_numbered_placeholders(self, mock_db):
+        mock_conn = mock_async_db(mock_db)
+        mock_conn.execute.return_value = 'UPDATE 1'
+
+        payload = {"first_name": "Jane", "city": "Derry"}
+        response = await self.client.put('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN}, json=payload)
+        self.assertEqual(response.status_code, 200)
+        mock_conn.execute.assert_awaited_once_with(
+            "UPDATE users SET first_name = $1, city = $2 WHERE user_id = $3", "Jane", "Derry", 1
+        )
+
+    @patch('blueprints.auth.auth_async.async_db_connect')
+    @patch('blueprints.auth.auth_async.check_password_async', new_callable=AsyncMock, return_value=True)
+    async def test_login_success(self, mock_check_password, mock_db):
+        mock_conn = mock_async_db(mock_db)
+        mock_conn.fetchrow.return_value = (1, False, '$2b$12$hashedpassword', 0)
+
+        payload = {'email': 'john@example.com', 'password': 'Password1!'}
+        response = await self.client.post('/api/v1/login', json=payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('token', await response.get_json())
+
+    @patch('blueprints.auth.auth_async.async_db_connect')
+    async def test_logout_all_success(self, mock_db):
+        mock_conn = mock_async_db(mock_db)
+        mock_conn.fetchval.return_value = 1
+
+        response = await self.client.post('/api/v1/logout-all', headers={'x-access-token': MOCK_TOKEN})
+        self.assertEqual(response.status_code, 200)
+        token_epochs.set.assert_called_once_with(1, 1)
+
+    @patch('blueprints.auth.auth_async.async_db_connect')
+    async def test_refresh_rotates_token(self, mock_db):
+        mock_conn = mock_async_db(mock_db)
+        mock_conn.fetchrow.return_value = (1, False, 'user@example.com', 0)
+
+        response = await self.client.post('/api/v1/token/refresh', json={'refresh_token': 'old'})
+        self.assertEqual(response.status_code, 200)
+        body = await response.get_json()
+        self.assertNotEqual(body['refresh_token'], 'old')
+        self.assertEqual(jwt.decode(body['token'], config.FLASK_SECRET_KEY, algorithms=['HS256'])['user_id'], 1)
+
+        mock_conn.fetchrow.return_value = None
+        mock_conn.fetchval.return_value = 1
+        response = await self.client.post('/api/v1/token/refresh', json={'refresh_token': 'old'})
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('DELETE FROM refresh_tokens', mock_conn.fetchval.call_args[0][0])
+
+        response = await self.client.post('/api/v1/token/refresh', json=[1])
+        self.assertEqual(response.status_code, 400)
+
+    @patch('blueprints.auth.auth_async.async_db_connect')
+    async def test_introspect_batch(self, mock_db):
+        mock_conn = mock_async_db(mock_db)
+        mock_conn.fetch.side_effect = [[], [(1, 0)]]
+
+        response = await self.client.post('/api/v1/introspect', json={'tokens': [MOCK_TOKEN, 'garbage']})
+        self.assertEqual(response.status_code, 200)
+        results = (await response.get_json())['results']
+        self.assertEqual([result['valid'] for result in results], [True, False])
+
+        response = await self.client.post('/api/v1/introspect', json=[1, 2])
+        self.assertEqual(response.status_code, 400)
+
+    @patch('blueprints.auth.auth_async.revocation_notifier')
+    @patch('blueprints.auth.auth_async.async_db_connect')
+    async def test_revocations_long_poll(self, mock_db, mock_notifier):
+        mock_conn = mock_async_db(mock_db)
+        mock_conn.fetch.side_effect = [[], [(7, b'\xab' * 32, datetime.datetime(2030, 1, 1))]]
+        mock_notifier.wait_async = AsyncMock(return_value=True)
+
+        response = await self.client.get('/api/v1/revocations?after=3&wait=10')
+        self.assertEqual(response.status_code, 200)
+        body = await response.get_json()
+        self.assertEqual(body['cursor'], 7)
+        self.assertEqual(body['revocations'][0]['token_hash'], 'ab' * 32)
+        mock_notifier.wait_async.assert_awaited_once_with(mock_notifier.generation, 10.0)
+
+        response = await self.client.get('/api/v1/revocations?after=abc')
+        self.assertEqual(response.status_code, 400)
+
+    @patch('blueprints.auth.auth_async.revocation_notifier')
+    @patch('blueprints.auth.auth_async.async_db_connect')
+    async def test_revocations_event_stream(self, mock_db, mock_notifier):
+        mock_conn = mock_async_db(mock_db)
+        mock_conn.fetch.side_effect = [[(7, b'\xab' * 32, datetime.datetime(2030, 1, 1))], Exception('pool timeout')]
+        mock_notifier.wait_async = AsyncMock(return_value=True)
+
+        response = await self.client.get('/api/v1/revocations', headers={'Accept': 'text/event-stream', 'Last-Event-ID': '5'})
+        frames = (await response.get_data(as_text=True)).split('\n\n')
+        self.assertTrue(frames[0].startswith('id: 7\nevent: revocation\n'))
+        self.assertEqual(frames[1], 'retry: 5000')
+        self.assertEqual(mock_conn.fetch.call_args_list[0].args[1:], (5, 1000))
+        self.assertEqual(stream_limit.open, 0)
+
+        with patch.object(stream_limit, 'limit', 0):
+            response = await self.client.get('/api/v1/revocations', headers={'Accept': 'text/event-stream'})
+        self.assertEqual(response.status_code, 503)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,6 +14,9 @@ from flask import Flask
 from blueprints.auth.auth import auth_bp
 import jwt
 import config
+from revocation import revocation_cache, token_epochs
+from passwords import HasherOverloaded
+from throttle import login_throttle
 
 MOCK_TOKEN = jwt.encode({'user_id': 1, 'email_address': 'user@example.com', 'admin': False}, config.FLASK_SECRET_KEY, algorithm='HS256')
 
@@ -23,16 +26,25 @@ class AuthTestCase(unittest.TestCase):
         self.app.register_blueprint(auth_bp)
         self.client = self.app.test_client()
 
+        for target, name, kwargs in ((revocation_cache, 'is_revoked', {'return_value': False}),
+                                     (revocation_cache, 'add', {}),
+                                     (token_epochs, 'current', {'return_value': 0}),
+                                     (token_epochs, 'set', {})):
+            patcher = patch.object(target, name, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        login_throttle.clear()
+
     # /api/v1/register
     @patch('blueprints.auth.auth.db_connect')
     @patch('blueprints.auth.auth.valid_email', return_value=True)
     @patch('blueprints.auth.auth.valid_password', return_value=True)
-    def test_register_success(self, mock_db):
+    def test_register_success(self, mock_valid_password, mock_valid_email, mock_db):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
-        mock_cursor.fetchone.side_effect = [None, [1]]
-        mock_db.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (1,)
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
         payload = {
             "first_name": "John",
@@ -45,6 +57,30 @@ class AuthTestCase(unittest.TestCase):
         response = self.client.post('/api/v1/register', json=payload)
         self.assertEqual(response.status_code, 201)
         self.assertIn('token', response.json)
+        self.assertIn('refresh_token', response.json)
+        mock_db.assert_called_once()
+        self.assertIn('ON CONFLICT', mock_cursor.execute.call_args_list[0][0][0])
+        self.assertIn('INSERT INTO refresh_tokens', mock_cursor.execute.call_args_list[1][0][0])
+
+    @patch('blueprints.auth.auth.db_connect')
+    @patch('blueprints.auth.auth.hash_password', return_value='$2b$12$hash')
+    def test_register_duplicate_email(self, mock_hash_password, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = None
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        payload = {
+            "first_name": "John",
+            "last_name": "Doe",
+            "email_address": "John@Example.com",
+            "mobile_number": "1234567890",
+            "city": "Belfast",
+            "password": "Password1!"
+        }
+        response = self.client.post('/api/v1/register', json=payload)
+        self.assertEqual(response.status_code, 409)
 
     def test_register_with_token_header(self):
         response = self.client.post('/api/v1/register', headers={'x-access-token': MOCK_TOKEN})
@@ -58,18 +94,107 @@ class AuthTestCase(unittest.TestCase):
     @patch('blueprints.auth.auth.db_connect')
     @patch('blueprints.auth.auth.valid_email', return_value=True)
     @patch('bcrypt.checkpw', return_value=True)
-    def test_login_success(self, mock_db):
+    def test_login_success(self, mock_checkpw, mock_valid_email, mock_db):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
-        mock_cursor.fetchone.return_value = (1, False, '$2b$12$hashedpassword')
-        mock_db.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (1, False, '$2b$12$hashedpassword', 0)
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
         payload = {'email': 'john@example.com', 'password': 'Password1!'}
         response = self.client.post('/api/v1/login', json=payload)
         self.assertEqual(response.status_code, 200)
         self.assertIn('token', response.json)
 
+    @patch('blueprints.auth.auth.db_connect')
+    @patch('blueprints.auth.auth.hash_password', return_value='$2b$12$newhash')
+    @patch('blueprints.auth.auth.check_password', return_value=True)
+    def test_login_rehashes_outdated_hash(self, mock_check_password, mock_hash_password, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (1, False, '$2b$10$hashedpassword', 0)
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        payload = {'email': 'john@example.com', 'password': 'Password1!'}
+        response = self.client.post('/api/v1/login', json=payload)
+        self.assertEqual(response.status_code, 200)
+        mock_cursor.execute.assert_any_call(
+            "UPDATE users SET password = %s WHERE user_id = %s AND password = %s",
+            ('$2b$12$newhash', 1, '$2b$10$hashedpassword'),
+        )
+
+    @patch('blueprints.auth.auth.db_connect')
+    @patch('blueprints.auth.auth.check_password', side_effect=HasherOverloaded)
+    def test_login_hasher_overloaded(self, mock_check_password, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (1, False, '$2b$12$hashedpassword', 0)
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        payload = {'email': 'john@example.com', 'password': 'Password1!'}
+        response = self.client.post('/api/v1/login', json=payload)
+        self.assertEqual(response.status_code, 503)
+
+    @patch('blueprints.auth.auth.db_connect')
+    @patch('blueprints.auth.auth.check_password', return_value=False)
+    def test_login_throttled_before_db(self, mock_check_password, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (1, False, '$2b$12$hashedpassword', 0)
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        payload = {'email': 'john@example.com', 'password': 'WrongPass1!'}
+        statuses = [self.client.post('/api/v1/login', json=payload).status_code for _ in range(config.LOGIN_EMAIL_BURST + 1)]
+        self.assertEqual(statuses[-1], 429)
+        self.assertIn(401, statuses)
+        calls = mock_db.call_count
+
+        response = self.client.post('/api/v1/login', json=payload)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+        self.assertEqual(mock_db.call_count, calls)
+
+    # /api/v1/token/refresh
+    @patch('blueprints.auth.auth.db_connect')
+    def test_refresh_rotates_token(self, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (1, False, 'john@example.com', 0)
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        response = self.client.post('/api/v1/token/refresh', json={'refresh_token': 'old'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json['refresh_token'], 'old')
+        claims = jwt.decode(response.json['token'], config.FLASK_SECRET_KEY, algorithms=['HS256'])
+        self.assertEqual((claims['user_id'], claims['token_epoch']), (1, 0))
+        query, params = mock_cursor.execute.call_args[0]
+        self.assertIn('used_at IS NULL', query)
+        self.assertNotIn(b'old', params)
+        mock_conn.commit.assert_called_once()
+
+    @patch('blueprints.auth.auth.db_connect')
+    def test_refresh_reused_token_revokes_family(self, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.side_effect = [None, (1,)]
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        response = self.client.post('/api/v1/token/refresh', json={'refresh_token': 'used'})
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('DELETE FROM refresh_tokens WHERE family_id', mock_cursor.execute.call_args[0][0])
+        mock_conn.commit.assert_called_once()
+
+    def test_refresh_missing_token(self):
+        response = self.client.post('/api/v1/token/refresh', json={})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/token/refresh', json=[1])
+        self.assertEqual(response.status_code, 400)
+
     def test_login_invalid_email_format(self):
         payload = {'email': 'invalid-email', 'password': 'pass'}
         response = self.client.post('/api/v1/login', json=payload)
@@ -79,9 +204,9 @@ class AuthTestCase(unittest.TestCase):
     def test_login_wrong_password(self, mock_db):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
-        mock_cursor.fetchone.return_value = (1, False, '$2b$12$hashedpassword')
-        mock_db.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (1, False, '$2b$12$hashedpassword', 0)
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
         with patch('bcrypt.checkpw', return_value=False):
             payload = {'email': 'john@example.com', 'password': 'WrongPass'}
@@ -93,8 +218,8 @@ class AuthTestCase(unittest.TestCase):
     def test_logout_success(self, mock_db):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
-        mock_db.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
         response = self.client.get('/api/v1/logout', headers={'x-access-token': MOCK_TOKEN})
         self.assertEqual(response.status_code, 200)
@@ -107,19 +232,37 @@ class AuthTestCase(unittest.TestCase):
     def test_logout_db_error(self, mock_db):
         mock_conn = MagicMock()
         mock_conn.cursor.side_effect = Exception("DB error")
-        mock_db.return_value = mock_conn
+        mock_db.return_value.__enter__.return_value = mock_conn
 
         response = self.client.get('/api/v1/logout', headers={'x-access-token': MOCK_TOKEN})
         self.assertEqual(response.status_code, 500)
 
+    # /api/v1/logout-all
+    @patch('blueprints.auth.auth.db_connect')
+    def test_logout_all_success(self, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (1,)
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        response = self.client.post('/api/v1/logout-all', headers={'x-access-token': MOCK_TOKEN})
+        self.assertEqual(response.status_code, 200)
+        token_epochs.set.assert_called_once_with(1, 1)
+
+    def test_stale_epoch_rejected(self):
+        token_epochs.current.return_value = 1
+        response = self.client.post('/api/v1/logout-all', headers={'x-access-token': MOCK_TOKEN})
+        self.assertEqual(response.status_code, 401)
+
     # /api/v1/delete_account
     @patch('blueprints.auth.auth.db_connect')
     def test_delete_account_success(self, mock_db):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
         mock_cursor.fetchone.return_value = (1,)
-        mock_db.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
         response = self.client.delete('/api/v1/delete_account', headers={'x-access-token': MOCK_TOKEN})
         self.assertEqual(response.status_code, 204)
@@ -134,8 +277,8 @@ class AuthTestCase(unittest.TestCase):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
         mock_cursor.fetchone.return_value = None
-        mock_db.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
         response = self.client.delete('/api/v1/delete_account', headers={'x-access-token': MOCK_TOKEN})
         self.assertEqual(response.status_code, 404)
@@ -146,8 +289,8 @@ class AuthTestCase(unittest.TestCase):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
         mock_cursor.fetchone.return_value = None 
-        mock_db.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
         response = self.client.post('/api/v1/validate-token', json={'token': MOCK_TOKEN})
         self.assertEqual(response.status_code, 200)
@@ -158,8 +301,8 @@ class AuthTestCase(unittest.TestCase):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
         mock_cursor.fetchone.return_value = True
-        mock_db.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
         response = self.client.post('/api/v1/validate-token', json={'token': MOCK_TOKEN})
         self.assertEqual(response.status_code, 401)
@@ -168,5 +311,24 @@ class AuthTestCase(unittest.TestCase):
         response = self.client.post('/api/v1/validate-token', json={})
         self.assertEqual(response.status_code, 401)
 
+    # /api/v1/introspect
+    @patch('blueprints.auth.auth.introspect_tokens')
+    def test_introspect_success(self, mock_introspect):
+        mock_introspect.return_value = [{'valid': True, 'claims': {'user_id': 1}}]
+        response = self.client.post('/api/v1/introspect', json={'tokens': [MOCK_TOKEN]})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json['results'][0]['valid'])
+
+    def test_introspect_missing_tokens(self):
+        response = self.client.post('/api/v1/introspect', json={})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/introspect', json=[1, 2])
+        self.assertEqual(response.status_code, 400)
+
+    def test_introspect_batch_too_large(self):
+        with patch('blueprints.auth.auth.TOKEN_INTROSPECTION_MAX_BATCH', 1):
+            response = self.client.post('/api/v1/introspect', json={'tokens': [MOCK_TOKEN, MOCK_TOKEN]})
+        self.assertEqual(response.status_code, 422)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,52 @@
+"""
+File: test_benchmark.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import unittest
+from benchmark import build_cases, compare, measure, stand_in_environment
+
+
+def make_results(median_ns, alloc_bytes):
+    return {'results': {'case': {'median_ns': median_ns, 'alloc_bytes': alloc_bytes}}}
+
+
+class CompareTestCase(unittest.TestCase):
+    def test_within_thresholds(self):
+        self.assertEqual(compare(make_results(1000, 1000), make_results(1100, 1050)), [])
+
+    def test_latency_regression(self):
+        regressions = compare(make_results(1000, 1000), make_results(1200, 1000))
+        self.assertEqual([r['metric'] for r in regressions], ['median_ns'])
+        self.assertAlmostEqual(regressions[0]['change'], 0.2)
+
+    def test_allocation_regression(self):
+        regressions = compare(make_results(1000, 10000), make_results(1000, 12000))
+        self.assertEqual([r['metric'] for r in regressions], ['alloc_bytes'])
+
+    def test_small_allocation_change_is_noise(self):
+        self.assertEqual(compare(make_results(1000, 0), make_results(1000, 100)), [])
+
+    def test_new_case_is_ignored(self):
+        self.assertEqual(compare({'results': {}}, make_results(1000, 1000)), [])
+
+
+class SuiteTestCase(unittest.TestCase):
+    def test_measure_reports_latency_and_allocations(self):
+        result = measure(lambda: [0] * 1000, min_time=0.001, repeat=2, alloc_samples=2)
+        self.assertGreater(result['median_ns'], 0)
+        self.assertGreaterEqual(result['alloc_bytes'], 8000)
+
+    def test_every_route_case_reaches_its_success_branch(self):
+        with stand_in_environment() as client:
+            cases = build_cases(client)
+        self.assertIn('route.login', cases)
+        self.assertIn('auth_required.guarded', cases)
+
+if __name__ == '__main__':
+    unittest.main()
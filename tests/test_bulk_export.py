@@ -0,0 +1,60 @@
+"""
+File: test_bulk_export.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import datetime
+import gzip
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+from bulk_export import export_users
+
+CREATED = datetime.datetime(2024, 1, 1)
+ROWS = [(1, 'John', 'Doe', 'john@example.com', '0123', 'Belfast', False, CREATED),
+        (2, 'Ann', 'Lee', 'ann@example.com', '0456', 'Derry', True, CREATED),
+        (3, 'Sam', 'Roe', 'sam@example.com', '0789', 'Newry', False, CREATED)]
+
+
+class BulkExportTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('bulk_export.db_connect')
+        self.mock_db = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_conn = MagicMock()
+        self.mock_cursor = MagicMock()
+        self.mock_cursor.fetchmany.side_effect = [ROWS[:2], ROWS[2:], []]
+        self.mock_db.return_value.__enter__.return_value = self.mock_conn
+        self.mock_conn.cursor.return_value.__enter__.return_value = self.mock_cursor
+
+    def test_export_streams_batches(self):
+        chunks = list(export_users(fetch_size=2))
+
+        self.assertEqual(len(chunks), 2)
+        records = [json.loads(line) for line in b''.join(chunks).splitlines()]
+        self.assertEqual([record['user_id'] for record in records], [1, 2, 3])
+        self.assertEqual(records[1]['creation_time'], '2024-01-01T00:00:00')
+        self.assertNotIn('password', records[0])
+        self.mock_conn.cursor.assert_called_once_with(name='user_export')
+        self.mock_cursor.fetchmany.assert_called_with(2)
+
+    def test_export_gzip(self):
+        data = gzip.decompress(b''.join(export_users(fetch_size=2, compress=True)))
+        self.assertEqual(len(data.splitlines()), 3)
+
+    def test_export_is_lazy(self):
+        chunks = export_users(fetch_size=2)
+        self.mock_db.assert_not_called()
+        next(chunks)
+        chunks.close()
+        self.assertEqual(self.mock_cursor.fetchmany.call_count, 1)
+        self.mock_db.return_value.__exit__.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
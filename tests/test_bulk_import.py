@@ -0,0 +1,94 @@
+"""
+File: test_bulk_import.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import io
+import unittest
+from unittest.mock import patch, MagicMock
+from bulk_import import check_record, import_users
+from passwords import BcryptHasher
+
+CSV_INPUT = """first_name,last_name,email_address,mobile_number,city,password
+John,Doe,john@example.com,0123,Belfast,Password1!
+Ann,Lee,ann@example.com,0456,Derry,short
+Jo,Doe,JOHN@example.com,0789,Belfast,Password1!
+Sam,Roe,sam@example.com,0111,Newry,Password2!
+"""
+
+
+class BulkImportTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('passwords.password_hasher', BcryptHasher(rounds=4))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = patch('bulk_import.db_connect')
+        self.mock_db = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_conn = MagicMock()
+        self.mock_cursor = MagicMock()
+        self.mock_db.return_value.__enter__.return_value = self.mock_conn
+        self.mock_conn.cursor.return_value.__enter__.return_value = self.mock_cursor
+        self.copied = []
+        self.mock_cursor.copy_expert.side_effect = lambda sql, buffer: self.copied.append(buffer.getvalue())
+
+    def test_check_record(self):
+        record = {'first_name': 'John', 'last_name': 'Doe', 'email_address': 'john@example.com',
+                  'mobile_number': '0123', 'city': 'Belfast', 'password': 'Password1!'}
+        self.assertIsNone(check_record(record))
+        self.assertEqual(check_record(None), 'Malformed record.')
+        self.assertEqual(check_record({**record, 'city': ''}), 'Missing fields: city.')
+        self.assertEqual(check_record({**record, 'email_address': 'john'}), 'Invalid email address.')
+        self.assertEqual(check_record({**record, 'mobile_number': '0' * 21}), 'Fields too long: mobile_number.')
+
+    def test_import_csv_reports_rejects(self):
+        # sam@example.com is already registered, so the insert skips it.
+        self.mock_cursor.fetchall.return_value = [('john@example.com',)]
+
+        report = import_users(io.StringIO(CSV_INPUT), 'csv', workers=2)
+
+        self.assertEqual(report['imported'], 1)
+        self.assertEqual(
+            [(rejected['line'], rejected['reason']) for rejected in report['rejected']],
+            [(3, 'Invalid password.'), (4, 'Duplicate email address in import.'), (5, 'Email address is already in use.')],
+        )
+        self.mock_cursor.copy_expert.assert_called_once()
+        self.assertIn('john@example.com', self.copied[0])
+        self.assertNotIn('Password1!', self.copied[0])
+        self.assertIn('$2b$04$', self.copied[0])
+        self.mock_conn.commit.assert_called_once()
+
+    def test_import_jsonl_continues_past_failed_chunk(self):
+        lines = [
+            '{"first_name": "John", "last_name": "Doe", "email_address": "john@example.com", '
+            '"mobile_number": "0123", "city": "Belfast", "password": "Password1!"}',
+            'not json',
+            '{"first_name": "Sam", "last_name": "Roe", "email_address": "sam@example.com", '
+            '"mobile_number": "0111", "city": "Newry", "password": "Password2!"}',
+        ]
+        self.mock_cursor.fetchall.return_value = [('sam@example.com',)]
+        self.mock_cursor.copy_expert.side_effect = [Exception('DB Error'), None]
+
+        report = import_users(io.StringIO('\n'.join(lines)), 'jsonl', chunk_size=1, workers=1)
+
+        self.assertEqual(report['imported'], 1)
+        self.assertEqual(
+            report['rejected'],
+            [{'line': 1, 'email_address': 'john@example.com', 'reason': 'Could not be stored.'},
+             {'line': 2, 'email_address': None, 'reason': 'Malformed record.'}],
+        )
+        self.assertEqual(self.mock_db.call_count, 2)
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            import_users(io.StringIO(''), 'xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+File: test_db.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import unittest
+from unittest.mock import MagicMock, patch
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from db import ConnectionPool, PoolTimeout
+
+
+def make_conn():
+    conn = MagicMock()
+    conn.closed = 0
+    conn.get_transaction_status.return_value = TRANSACTION_STATUS_IDLE
+    return conn
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connect = MagicMock(side_effect=make_conn)
+        self.pool = ConnectionPool(min_size=1, max_size=2, timeout=0.05, connect=self.connect)
+
+    def test_fill_opens_min_size(self):
+        self.pool.fill()
+        self.assertEqual(self.connect.call_count, 1)
+        self.assertEqual(self.pool.stats()['idle'], 1)
+
+    def test_connection_is_reused(self):
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(self.connect.call_count, 1)
+        self.assertEqual(self.pool.stats()['checkouts'], 2)
+
+    def test_checkout_times_out_when_exhausted(self):
+        self.pool.getconn()
+        self.pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            self.pool.getconn()
+        stats = self.pool.stats()
+        self.assertEqual(stats['in_use'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+
+    def test_open_transaction_rolled_back_on_return(self):
+        conn = self.pool.getconn()
+        conn.get_transaction_status.return_value = TRANSACTION_STATUS_INTRANS
+        self.pool.putconn(conn)
+        conn.rollback.assert_called_once()
+        self.assertEqual(self.pool.stats()['idle'], 1)
+
+    def test_closed_connection_is_replaced(self):
+        conn = self.pool.getconn()
+        self.pool.putconn(conn)
+        conn.closed = 1
+        replacement = self.pool.getconn()
+        self.assertIsNot(conn, replacement)
+        self.assertEqual(self.pool.stats()['connections_closed'], 1)
+
+    def test_expired_connection_is_recycled(self):
+        self.pool.max_lifetime = 10
+        with patch('db.time.monotonic', return_value=0):
+            conn = self.pool.getconn()
+            self.pool.putconn(conn)
+        with patch('db.time.monotonic', return_value=11):
+            replacement = self.pool.getconn()
+        self.assertIsNot(conn, replacement)
+        conn.close.assert_called_once()
+
+    def test_idle_connection_is_pinged(self):
+        self.pool.check_idle = 0
+        conn = self.pool.getconn()
+        self.pool.putconn(conn)
+        self.pool.getconn()
+        conn.cursor.return_value.execute.assert_called_with("SELECT 1")
+
+if __name__ == '__main__':
+    unittest.main()
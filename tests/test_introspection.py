@@ -0,0 +1,68 @@
+"""
+File: test_introspection.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import datetime
+import unittest
+from unittest.mock import patch, MagicMock
+import jwt
+import config
+from introspection import introspect_tokens
+from revocation import token_digest, token_epochs
+
+
+def make_token(user_id, **claims):
+    return jwt.encode({'user_id': user_id, 'token_epoch': 0, **claims}, config.FLASK_SECRET_KEY, algorithm='HS256')
+
+
+class IntrospectionTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(token_epochs, 'set')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('introspection.db_connect')
+    def test_batch_resolved_with_one_query_each(self, mock_db):
+        valid, revoked, stale = make_token(1), make_token(2), make_token(3)
+        expired = make_token(1, exp=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc))
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.side_effect = [[(token_digest(revoked),)], [(1, 0), (2, 0), (3, 1)]]
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        results = introspect_tokens([valid, revoked, stale, expired, 'garbage', None])
+
+        self.assertEqual(mock_cursor.execute.call_count, 2)
+        self.assertTrue(results[0]['valid'])
+        self.assertEqual(results[0]['claims']['user_id'], 1)
+        self.assertEqual(results[1], {'valid': False, 'error': 'Token has been cancelled.'})
+        self.assertEqual(results[2], {'valid': False, 'error': 'Token has been cancelled.'})
+        self.assertEqual(results[3], {'valid': False, 'error': 'Token has expired.'})
+        self.assertEqual(results[4], {'valid': False, 'error': 'Token is invalid.'})
+        self.assertEqual(results[5], {'valid': False, 'error': 'Token is missing.'})
+
+    @patch('introspection.db_connect')
+    def test_deleted_user_token_is_cancelled(self, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.side_effect = [[], []]
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        self.assertFalse(introspect_tokens([make_token(1)])[0]['valid'])
+
+    @patch('introspection.db_connect')
+    def test_invalid_only_batch_skips_database(self, mock_db):
+        results = introspect_tokens(['garbage'])
+        self.assertFalse(results[0]['valid'])
+        mock_db.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
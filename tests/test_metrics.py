@@ -0,0 +1,84 @@
+"""
+File: test_metrics.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import unittest
+from app import app
+from metrics import Counter, Gauge, Histogram, Registry, _Metric
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0), registry=self.registry)
+        for value in (0.05, 0.1, 0.5, 5.0):
+            histogram.observe(value)
+        output = self.registry.render()
+        self.assertIn('latency_seconds_bucket{le="0.1"} 2', output)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 3', output)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4', output)
+        self.assertIn('latency_seconds_count 4', output)
+        self.assertIn('latency_seconds_sum 5.65', output)
+
+    def test_labelled_counter_and_gauge(self):
+        counter = Counter('requests_total', 'Requests.', ('status',), registry=self.registry)
+        gauge = Gauge('in_flight', 'In flight.', registry=self.registry)
+        counter.labels(200).inc()
+        counter.labels(200).inc()
+        counter.labels('say "hi"').inc()
+        gauge.inc()
+        gauge.dec()
+        output = self.registry.render()
+        self.assertIn('# TYPE requests_total counter', output)
+        self.assertIn('requests_total{status="200"} 2.0', output)
+        self.assertIn('requests_total{status="say \\"hi\\""} 1.0', output)
+        self.assertIn('in_flight 0.0', output)
+
+    def test_labels_are_required(self):
+        counter = Counter('requests_total', 'Requests.', ('status',), registry=self.registry)
+        with self.assertRaises(ValueError):
+            counter.inc()
+        with self.assertRaises(ValueError):
+            counter.labels()
+
+    def test_incomplete_metric_fails_on_creation(self):
+        class ChildOnlyMetric(_Metric):
+            def _new_child(self):
+                return None
+
+        with self.assertRaises(TypeError):
+            ChildOnlyMetric('broken', 'Broken.', registry=self.registry)
+
+    def test_stats_snapshots(self):
+        self.registry.register_stats('pool', 'Pool', lambda: {'size': 3, 'checkouts': 7, 'mode': 'lifo'},
+                                     counters=('checkouts',))
+        output = self.registry.render()
+        self.assertIn('# TYPE pool_size gauge\npool_size 3', output)
+        self.assertIn('# TYPE pool_checkouts_total counter\npool_checkouts_total 7', output)
+        self.assertNotIn('mode', output)
+
+
+class MetricsEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+
+    def test_requests_are_counted(self):
+        self.app.post('/api/v1/login', json={})
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        body = response.get_data(as_text=True)
+        self.assertIn('http_requests_total{endpoint="auth_bp.login",method="POST",status="401"}', body)
+        self.assertIn('http_requests_in_flight{endpoint="metrics_bp.metrics"} 1.0', body)
+        self.assertIn('revocation_cache_checks_total', body)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+File: test_migrations.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+import psycopg2.errors
+from migrations import (
+    MIGRATION_LOCK_KEY,
+    MigrationError,
+    checksum,
+    discover_migrations,
+    migrate,
+    parse_version,
+    plan,
+)
+
+
+def write_migrations(directory, files):
+    for name, sql in files.items():
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(sql)
+
+
+def mock_connection(*history):
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.side_effect = list(history)
+    return conn, cursor
+
+
+class MigrationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        write_migrations(self.directory, {
+            'V1__Create_users_table.sql': 'CREATE TABLE users (user_id SERIAL);\n',
+            'V1.1__Add_city.sql': 'ALTER TABLE users ADD COLUMN city TEXT;\n',
+            'V1.10__Add_admin.sql': 'ALTER TABLE users ADD COLUMN admin BOOLEAN;\n',
+            'README.md': 'not a migration',
+        })
+        self.migrations = discover_migrations(self.directory)
+        self.history = [(m.version, 'SQL', m.checksum, True) for m in self.migrations]
+
+    def test_discovers_in_version_order(self):
+        self.assertEqual([m.version for m in self.migrations], ['1', '1.1', '1.10'])
+        self.assertEqual(self.migrations[0].description, 'Create users table')
+        self.assertEqual(parse_version('1.0'), parse_version('1'))
+
+    def test_checksum_matches_flyway(self):
+        self.assertEqual(checksum(''), 0)
+        self.assertEqual(checksum('SELECT 1;\nSELECT 2;\n'), checksum('\ufeffSELECT 1;\r\nSELECT 2;'))
+        self.assertNotEqual(checksum('SELECT 1;'), checksum('SELECT 2;'))
+        self.assertTrue(-2 ** 31 <= checksum('SELECT 1;') < 2 ** 31)
+
+    def test_plan(self):
+        self.assertEqual(plan(self.migrations, self.history), [])
+        self.assertEqual(plan(self.migrations, self.history[:1]), self.migrations[1:])
+        self.assertEqual(plan(self.migrations, [(None, 'SCHEMA', None, True), ('1.1', 'BASELINE', None, True)]),
+                         self.migrations[2:])
+
+    def test_plan_rejects_mismatched_history(self):
+        cases = (
+            [('1', 'SQL', self.migrations[0].checksum + 1, True)],
+            [('1', 'SQL', self.migrations[0].checksum, False)],
+            [('2', 'SQL', 1, True)],
+            [self.history[0], self.history[2]],
+        )
+        for history in cases:
+            with self.assertRaises(MigrationError):
+                plan(self.migrations, history)
+
+    def test_up_to_date_is_one_query_without_lock(self):
+        conn, cursor = mock_connection(self.history)
+        self.assertEqual(migrate(lambda: conn, self.directory), 0)
+        cursor.execute.assert_called_once()
+        conn.close.assert_called_once()
+
+    def test_applies_pending_under_lock(self):
+        conn, cursor = mock_connection(self.history[:1], self.history[:2])
+        self.assertEqual(migrate(lambda: conn, self.directory), 1)
+
+        statements = [call[0][0] for call in cursor.execute.call_args_list]
+        self.assertEqual(cursor.execute.call_args_list[1][0], ('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_KEY,)))
+        self.assertIn('ALTER TABLE users ADD COLUMN admin BOOLEAN;\n', statements)
+        self.assertEqual(cursor.execute.call_args_list[-1][0][1][:4],
+                         ('1.10', 'Add admin', 'V1.10__Add_admin.sql', self.migrations[2].checksum))
+        conn.close.assert_called_once()
+
+    def test_duplicate_emails_stop_unique_index(self):
+        write_migrations(self.directory, {'V1.6__Add_unique_lower_email_index.sql': 'CREATE UNIQUE INDEX;\n'})
+        history = self.history[:2]
+        conn, cursor = mock_connection(history, history, [('a@example.com', [3, 7])])
+        with self.assertRaises(MigrationError) as ctx:
+            migrate(lambda: conn, self.directory)
+        self.assertIn('a@example.com: user IDs [3, 7]', str(ctx.exception))
+        self.assertNotIn('CREATE UNIQUE INDEX;\n', [call[0][0] for call in cursor.execute.call_args_list])
+        conn.commit.assert_called_once()
+        conn.close.assert_called_once()
+
+    def test_creates_history_table(self):
+        conn, cursor = mock_connection(psycopg2.errors.UndefinedTable(), [])
+        self.assertEqual(migrate(lambda: conn, self.directory), 3)
+        self.assertTrue(any('CREATE TABLE IF NOT EXISTS flyway_schema_history' in call[0][0]
+                            for call in cursor.execute.call_args_list))
+
+
+if __name__ == '__main__':
+    unittest.main()
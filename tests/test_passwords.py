@@ -0,0 +1,103 @@
+"""
+File: test_passwords.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import threading
+import unittest
+from unittest.mock import patch
+from passwords import (
+    Argon2Hasher,
+    BcryptHasher,
+    HasherOverloaded,
+    PasswordExecutor,
+    PasswordHasher,
+    calibrate,
+    check_password,
+    make_hasher,
+    needs_rehash,
+)
+
+
+class PasswordExecutorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.executor = PasswordExecutor(max_workers=1, max_queue=1, timeout=1)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def test_run_returns_result(self):
+        self.assertEqual(self.executor.run(sum, [1, 2]), 3)
+        self.assertEqual(self.executor.stats()['completed'], 1)
+
+    def test_full_queue_is_rejected(self):
+        started = threading.Event()
+
+        def block():
+            started.set()
+            self.release.wait()
+
+        threading.Thread(target=self.executor.run, args=(block,)).start()
+        started.wait()
+        threading.Thread(target=self.executor.run, args=(block,)).start()
+        while self.executor.stats()['queue_depth'] < 1:
+            pass
+
+        with self.assertRaises(HasherOverloaded):
+            self.executor.run(sum, [1])
+        stats = self.executor.stats()
+        self.assertEqual(stats['running'], 1)
+        self.assertEqual(stats['rejected'], 1)
+
+    def test_slow_result_times_out(self):
+        self.executor.timeout = 0.01
+        with self.assertRaises(HasherOverloaded):
+            self.executor.run(self.release.wait)
+        self.assertEqual(self.executor.stats()['timed_out'], 1)
+
+class PasswordHasherTestCase(unittest.TestCase):
+    def test_bcrypt_round_trip(self):
+        hasher = BcryptHasher(rounds=4)
+        hashed = hasher.hash('Password1!')
+        self.assertTrue(hasher.verify('Password1!', hashed))
+        self.assertFalse(hasher.verify('Password2!', hashed))
+        self.assertFalse(hasher.needs_rehash(hashed))
+        self.assertTrue(BcryptHasher(rounds=5).needs_rehash(hashed))
+
+    def test_argon2_round_trip(self):
+        hasher = Argon2Hasher(time_cost=1, memory_cost=1024, parallelism=1)
+        hashed = hasher.hash('Password1!')
+        self.assertTrue(hasher.verify('Password1!', hashed))
+        self.assertFalse(hasher.verify('Password2!', hashed))
+        self.assertFalse(hasher.needs_rehash(hashed))
+        self.assertTrue(Argon2Hasher(time_cost=2, memory_cost=1024, parallelism=1).needs_rehash(hashed))
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            make_hasher('md5')
+
+    def test_incomplete_hasher_fails_on_creation(self):
+        class HashOnlyHasher(PasswordHasher):
+            def hash(self, password):
+                return password
+
+        with self.assertRaises(TypeError):
+            HashOnlyHasher()
+
+    def test_other_scheme_verifies_and_needs_rehash(self):
+        hashed = Argon2Hasher(time_cost=1, memory_cost=1024, parallelism=1).hash('Password1!')
+        self.assertTrue(check_password('Password1!', hashed))
+        self.assertTrue(needs_rehash(hashed))
+
+    def test_calibrate_stops_at_target(self):
+        with patch('passwords._time_verify', side_effect=[0.01, 0.02, 0.04, 0.08]):
+            hasher, elapsed_ms = calibrate('bcrypt', target_ms=50)
+        self.assertEqual(hasher.rounds, 6)
+        self.assertAlmostEqual(elapsed_ms, 40)
+
+if __name__ == '__main__':
+    unittest.main()
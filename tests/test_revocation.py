@@ -0,0 +1,123 @@
+"""
+File: test_revocation.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from revocation import BloomFilter, RevocationCache, TokenEpochCache, purge_expired_revocations, token_digest
+
+
+class BloomFilterTestCase(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        digests = [token_digest(f"token-{i}") for i in range(1000)]
+        for digest in digests:
+            bloom.add(digest)
+        self.assertTrue(all(digest in bloom for digest in digests))
+
+    def test_false_positive_rate_is_bounded(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(token_digest(f"token-{i}"))
+        hits = sum(token_digest(f"other-{i}") in bloom for i in range(10000))
+        self.assertLess(hits, 300)
+
+
+class RevocationCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loader = MagicMock(return_value=[token_digest('revoked')])
+        self.checker = MagicMock(return_value=True)
+        self.cache = RevocationCache(capacity=100, error_rate=0.001, lru_size=2,
+                                     resync_interval=60, loader=self.loader, checker=self.checker)
+
+    def test_unrevoked_token_skips_database(self):
+        self.assertFalse(self.cache.is_revoked('fresh'))
+        self.checker.assert_not_called()
+        self.assertEqual(self.cache.stats()['bloom_negatives'], 1)
+
+    def test_revoked_token_confirmed_once(self):
+        self.assertTrue(self.cache.is_revoked('revoked', time.time() + 60))
+        self.assertTrue(self.cache.is_revoked('revoked', time.time() + 60))
+        self.checker.assert_called_once_with(token_digest('revoked'))
+        self.assertEqual(self.cache.stats()['lru_hits'], 1)
+
+    def test_add_takes_effect_without_database(self):
+        self.cache.add('logged-out', time.time() + 60)
+        self.assertTrue(self.cache.is_revoked('logged-out'))
+        self.checker.assert_not_called()
+
+    def test_confirmed_entry_expires_at_exp(self):
+        self.cache.add('logged-out', time.time() - 1)
+        self.cache.is_revoked('logged-out')
+        self.checker.assert_called_once_with(token_digest('logged-out'))
+
+    def test_lru_is_bounded(self):
+        for i in range(5):
+            self.cache.add(f"token-{i}")
+        self.assertEqual(self.cache.stats()['confirmed_size'], 2)
+
+    def test_resync_only_when_due(self):
+        self.cache.is_revoked('fresh')
+        self.cache.is_revoked('fresh')
+        self.loader.assert_called_once()
+        self.cache.resync_interval = 0
+        self.cache.is_revoked('fresh')
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_initial_load_failure_is_raised(self):
+        self.loader.side_effect = Exception("DB error")
+        with self.assertRaises(Exception):
+            self.cache.is_revoked('fresh')
+        self.assertEqual(self.cache.stats()['resync_failures'], 1)
+
+class PurgeTestCase(unittest.TestCase):
+    @patch('revocation.db_connect')
+    def test_purge_runs_until_short_batch(self, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        type(mock_cursor).rowcount = property(MagicMock(side_effect=[100, 100, 7]))
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        self.assertEqual(purge_expired_revocations(batch_size=100), 207)
+        self.assertEqual(mock_conn.commit.call_count, 3)
+
+    @patch('revocation.db_connect')
+    def test_purge_respects_max_batches(self, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.rowcount = 100
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        self.assertEqual(purge_expired_revocations(batch_size=100, max_batches=2), 200)
+
+class TokenEpochCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loader = MagicMock(return_value=2)
+        self.epochs = TokenEpochCache(maxsize=10, ttl=60, loader=self.loader)
+
+    def test_epoch_is_cached(self):
+        self.assertEqual(self.epochs.current('1'), 2)
+        self.assertEqual(self.epochs.current(1), 2)
+        self.loader.assert_called_once_with(1)
+
+    def test_older_epoch_is_stale(self):
+        self.assertTrue(self.epochs.is_stale({'user_id': 1, 'token_epoch': 1}))
+        self.assertTrue(self.epochs.is_stale({'user_id': 1}))
+        self.assertFalse(self.epochs.is_stale({'user_id': 1, 'token_epoch': 2}))
+
+    def test_deleted_user_is_stale(self):
+        self.epochs.set(1, None)
+        self.assertTrue(self.epochs.is_stale({'user_id': 1, 'token_epoch': 5}))
+        self.loader.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+File: test_revocation_feed.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+from app import app
+from revocation_feed import RevocationNotifier, stream_limit
+
+ENTRY = {'cursor': 7, 'token_hash': 'ab' * 32, 'expires_at': '2030-01-01T00:00:00+00:00'}
+
+
+class RevocationNotifierTestCase(unittest.TestCase):
+    def setUp(self):
+        self.notifier = RevocationNotifier()
+        patcher = patch.object(self.notifier, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_wait_times_out_without_notification(self):
+        self.assertFalse(self.notifier.wait(self.notifier.generation, 0.01))
+
+    def test_wait_wakes_on_notification(self):
+        generation = self.notifier.generation
+        threading.Timer(0.01, self.notifier.notify).start()
+        self.assertTrue(self.notifier.wait(generation, 5))
+
+    def test_async_wait_wakes_on_notification(self):
+        async def wait(timeout):
+            generation = self.notifier.generation
+            threading.Timer(0.01, self.notifier.notify).start()
+            return await self.notifier.wait_async(generation, timeout)
+
+        self.assertTrue(asyncio.run(wait(5)))
+        self.assertFalse(asyncio.run(self.notifier.wait_async(self.notifier.generation, 0.01)))
+
+    def test_notification_before_wait_is_not_missed(self):
+        generation = self.notifier.generation
+        self.notifier.notify()
+        self.assertTrue(self.notifier.wait(generation, 0))
+
+
+class RevocationFeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+
+    @patch('blueprints.auth.auth.fetch_revocations')
+    def test_returns_entries_and_cursor(self, mock_fetch):
+        mock_fetch.return_value = [ENTRY]
+        response = self.app.get('/api/v1/revocations?after=3&limit=100000')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'revocations': [ENTRY], 'cursor': 7})
+        mock_fetch.assert_called_once_with(3, 1000)
+
+    @patch('blueprints.auth.auth.revocation_notifier')
+    @patch('blueprints.auth.auth.fetch_revocations')
+    def test_long_poll_requeries_after_notification(self, mock_fetch, mock_notifier):
+        mock_fetch.side_effect = [[], [ENTRY]]
+        mock_notifier.wait.return_value = True
+        response = self.app.get('/api/v1/revocations?after=3&wait=10')
+        self.assertEqual(response.json['cursor'], 7)
+        self.assertEqual(mock_fetch.call_count, 2)
+
+    @patch('blueprints.auth.auth.revocation_notifier')
+    @patch('blueprints.auth.auth.fetch_revocations')
+    def test_long_poll_timeout_keeps_cursor(self, mock_fetch, mock_notifier):
+        mock_fetch.return_value = []
+        mock_notifier.wait.return_value = False
+        response = self.app.get('/api/v1/revocations?after=3&wait=10')
+        self.assertEqual(response.json, {'revocations': [], 'cursor': 3})
+
+    def test_invalid_cursor(self):
+        response = self.app.get('/api/v1/revocations?after=abc')
+        self.assertEqual(response.status_code, 400)
+
+    @patch('blueprints.auth.auth.fetch_revocations')
+    def test_event_stream_resumes_from_last_event_id(self, mock_fetch):
+        mock_fetch.return_value = [ENTRY]
+        response = self.app.get('/api/v1/revocations', buffered=False,
+                                headers={'Accept': 'text/event-stream', 'Last-Event-ID': '5'})
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        frame = next(response.response)
+        response.close()
+        self.assertTrue(frame.startswith(b'id: 7\nevent: revocation\n'))
+        mock_fetch.assert_called_once_with(5, 1000)
+        self.assertEqual(stream_limit.open, 0)
+
+    @patch('blueprints.auth.auth.revocation_notifier')
+    @patch('blueprints.auth.auth.fetch_revocations')
+    def test_event_stream_asks_client_to_retry_on_error(self, mock_fetch, mock_notifier):
+        mock_fetch.side_effect = [[ENTRY], Exception('pool timeout')]
+        mock_notifier.wait.return_value = True
+        response = self.app.get('/api/v1/revocations', headers={'Accept': 'text/event-stream'})
+        frames = response.get_data(as_text=True).split('\n\n')
+        response.close()
+        self.assertTrue(frames[0].startswith('id: 7\n'))
+        self.assertEqual(frames[1], 'retry: 5000')
+        self.assertEqual(stream_limit.open, 0)
+
+    @patch.object(stream_limit, 'limit', 0)
+    def test_event_stream_refused_beyond_limit(self):
+        response = self.app.get('/api/v1/revocations', headers={'Accept': 'text/event-stream'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(stream_limit.open, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+File: test_signing_keys.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from flask import Flask
+import jwt
+import config
+from blueprints.auth.auth import auth_bp
+from signing_keys import Keyring, create_key, retire_keys
+from tokens import decode_access_token, issue_access_token, issue_access_token_async
+
+NOW = 1_800_000_000.0
+
+
+class SigningKeysTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.now = NOW
+        self.keyring = Keyring(self.directory, reload_interval=0, clock=lambda: self.now)
+        patcher = patch('tokens.keyring', self.keyring)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_token_names_signing_key(self):
+        key = create_key(self.directory, 'EdDSA', NOW)
+        token = issue_access_token(1, False, 'user@example.com', 0)
+
+        self.assertEqual(jwt.get_unverified_header(token), {'alg': 'EdDSA', 'kid': key.kid, 'typ': 'JWT'})
+        self.assertEqual(decode_access_token(token)['user_id'], 1)
+        self.assertEqual(os.stat(os.path.join(self.directory, f'{key.kid}.pem')).st_mode & 0o777, 0o600)
+
+    def test_rotation_overlaps_old_and_new_keys(self):
+        old = create_key(self.directory, 'EdDSA', NOW)
+        new = create_key(self.directory, 'RS256', NOW + 3600)
+        old_token = issue_access_token(1, False, 'user@example.com', 0)
+
+        self.assertEqual([jwk['kid'] for jwk in self.keyring.jwks()['keys']], [old.kid, new.kid])
+        self.assertEqual(self.keyring.signing_key().kid, old.kid)
+
+        self.now = NOW + 3600
+        new_token = issue_access_token(1, False, 'user@example.com', 0)
+        self.assertEqual(jwt.get_unverified_header(new_token)['kid'], new.kid)
+        self.assertEqual(decode_access_token(old_token)['user_id'], 1)
+
+        self.assertEqual(retire_keys(self.directory, 900, now=NOW + 3600 + 899), [])
+        self.assertEqual(retire_keys(self.directory, 900, now=NOW + 3600 + 900), [old.kid])
+        with self.assertRaises(jwt.InvalidTokenError):
+            decode_access_token(old_token)
+        self.assertEqual(decode_access_token(new_token)['user_id'], 1)
+
+    def test_async_signing_keeps_slow_work_off_the_loop(self):
+        async def issue():
+            loop = asyncio.get_running_loop()
+            with patch.object(loop, 'run_in_executor', wraps=loop.run_in_executor) as run_in_executor:
+                token = await issue_access_token_async(1, False, 'user@example.com', 0)
+            return jwt.get_unverified_header(token)['alg'], run_in_executor.called
+
+        self.keyring.reload_interval = 60
+        create_key(self.directory, 'EdDSA', NOW)
+        self.assertTrue(self.keyring.stale())
+        self.assertEqual(asyncio.run(issue()), ('EdDSA', True))
+        self.assertFalse(self.keyring.stale())
+        self.assertEqual(asyncio.run(issue()), ('EdDSA', False))
+
+        create_key(self.directory, 'RS256', NOW + 1)
+        self.now = NOW + 1
+        self.keyring.reload()
+        self.assertEqual(asyncio.run(issue()), ('RS256', True))
+
+    def test_algorithm_pinned_to_key(self):
+        key = create_key(self.directory, 'EdDSA', NOW)
+        forged = jwt.encode({'user_id': 2}, 'secret', algorithm='HS256', headers={'kid': key.kid})
+        with self.assertRaises(jwt.InvalidTokenError):
+            decode_access_token(forged)
+
+    def test_legacy_hs256_tokens(self):
+        legacy = jwt.encode({'user_id': 1}, config.FLASK_SECRET_KEY, algorithm='HS256')
+        self.assertEqual(decode_access_token(legacy)['user_id'], 1)
+
+        create_key(self.directory, 'EdDSA', NOW)
+        self.now = NOW + config.ACCESS_TOKEN_LIFETIME_MINUTES * 60 - 1
+        self.assertEqual(decode_access_token(legacy)['user_id'], 1)
+
+        self.now += 1
+        with self.assertRaises(jwt.InvalidTokenError):
+            decode_access_token(legacy)
+        with patch('config.JWT_ACCEPT_HS256', True):
+            self.assertEqual(decode_access_token(legacy)['user_id'], 1)
+
+    def test_jwks_endpoint_revalidates(self):
+        key = create_key(self.directory, 'EdDSA', NOW)
+        app = Flask(__name__)
+        app.register_blueprint(auth_bp)
+        client = app.test_client()
+
+        with patch('blueprints.auth.auth.keyring', self.keyring):
+            response = client.get('/.well-known/jwks.json')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('public', response.headers['Cache-Control'])
+            self.assertEqual(response.get_json()['keys'][0]['kid'], key.kid)
+            self.assertNotIn('d', response.get_json()['keys'][0])
+
+            response = client.get('/.well-known/jwks.json', headers={'If-None-Match': response.headers['ETag']})
+            self.assertEqual(response.status_code, 304)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+File: test_throttle.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import unittest
+from throttle import Limit, LoginThrottle, MemoryStore, ThrottleStore
+
+
+class LoginThrottleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.throttle = LoginThrottle(
+            MemoryStore(maxsize=100, ttl=3600),
+            email=Limit(burst=3, rate=0.5, free_failures=2),
+            ip=Limit(burst=10, rate=1, free_failures=100),
+            backoff_base=1,
+            backoff_max=4,
+            trust_ttl=60,
+            clock=lambda: self.now,
+        )
+
+    def test_bucket_limits_burst_and_refills(self):
+        for _ in range(3):
+            self.assertEqual(self.throttle.check('user@example.com', '10.0.0.1'), 0)
+        self.assertAlmostEqual(self.throttle.check('USER@example.com', '10.0.0.1'), 2.0)
+        self.assertEqual(self.throttle.check('other@example.com', '10.0.0.1'), 0)
+
+        self.now += 2
+        self.assertEqual(self.throttle.check('user@example.com', '10.0.0.1'), 0)
+        stats = self.throttle.stats()
+        self.assertEqual((stats['allowed'], stats['rejected']), (5, 1))
+
+    def test_ip_bucket_is_shared_across_emails(self):
+        for i in range(10):
+            self.assertEqual(self.throttle.check(f'user{i}@example.com', '10.0.0.1'), 0)
+        self.assertGreater(self.throttle.check('user99@example.com', '10.0.0.1'), 0)
+        self.assertEqual(self.throttle.check('user99@example.com', '10.0.0.2'), 0)
+
+    def test_failures_back_off_exponentially(self):
+        waits = []
+        for _ in range(5):
+            self.throttle.failed('user@example.com', '10.0.0.1')
+            waits.append(self.throttle.check('user@example.com', '10.0.0.1'))
+            self.now += 10
+        self.assertEqual(waits, [0, 0, 1, 2, 4])
+
+        self.throttle.succeeded('user@example.com', '10.0.0.1')
+        self.throttle.failed('user@example.com', '10.0.0.1')
+        self.assertEqual(self.throttle.check('user@example.com', '10.0.0.1'), 0)
+
+    def test_failures_do_not_lock_out_other_clients(self):
+        for _ in range(10):
+            self.throttle.failed('user@example.com', '10.0.0.1')
+        self.assertGreater(self.throttle.check('user@example.com', '10.0.0.1'), 0)
+        self.assertEqual(self.throttle.check('user@example.com', '10.0.0.2'), 0)
+
+    def test_rejected_attempts_are_not_charged(self):
+        for i in range(3):
+            self.assertEqual(self.throttle.check('user@example.com', f'10.0.0.{i}'), 0)
+        for _ in range(5):
+            self.assertGreater(self.throttle.check('user@example.com', '10.0.0.9'), 0)
+        for i in range(10):
+            self.assertEqual(self.throttle.check(f'user{i}@example.com', '10.0.0.9'), 0)
+
+    def test_owner_bypasses_email_bucket_after_login(self):
+        self.throttle.succeeded('user@example.com', '10.0.0.1')
+        for i in range(10):
+            self.throttle.check('user@example.com', f'192.168.0.{i}')
+        self.assertGreater(self.throttle.check('user@example.com', '10.0.0.2'), 0)
+        self.assertEqual(self.throttle.check('user@example.com', '10.0.0.1'), 0)
+
+        self.now += 61
+        for i in range(10):
+            self.throttle.check('user@example.com', f'192.168.1.{i}')
+        self.assertGreater(self.throttle.check('user@example.com', '10.0.0.1'), 0)
+
+    def test_memory_is_bounded(self):
+        throttle = LoginThrottle(MemoryStore(maxsize=5, ttl=60), email=Limit(1, 1, 1), ip=Limit(1, 1, 1),
+                                 backoff_base=1, backoff_max=1)
+        for i in range(20):
+            throttle.check(f'user{i}@example.com', None)
+        self.assertEqual(throttle.stats()['size'], 5)
+
+    def test_incomplete_store_fails_on_creation(self):
+        class TakeOnlyStore(ThrottleStore):
+            def take(self, keys, now):
+                return 0.0
+
+        with self.assertRaises(TypeError):
+            TakeOnlyStore()
+
+    def test_disabled(self):
+        self.throttle.enabled = False
+        for _ in range(10):
+            self.throttle.failed('user@example.com', '10.0.0.1')
+            self.assertEqual(self.throttle.check('user@example.com', '10.0.0.1'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
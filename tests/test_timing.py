@@ -0,0 +1,101 @@
+"""
+File: test_timing.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+from app import app, create_app
+from profiler import SamplingProfiler, collapse
+from timing import server_timing, span, summarize
+
+
+class TimingTestCase(unittest.TestCase):
+    def test_span_outside_request_records_nothing(self):
+        with span('db_query') as timer:
+            pass
+        self.assertGreater(timer.started, 0)
+
+    def test_spans_are_summed_by_stage(self):
+        totals = summarize([('db_query', 0.001), ('password_verify', 0.25), ('db_query', 0.002)])
+        self.assertEqual(list(totals), ['db_query', 'password_verify'])
+        self.assertEqual(
+            server_timing(totals, 260.0),
+            'db_query;dur=3.0;desc="x2", password_verify;dur=250.0, total;dur=260.0',
+        )
+
+    @patch('blueprints.auth.auth.check_password')
+    @patch('blueprints.auth.auth.db_connect')
+    def test_login_reports_server_timing(self, mock_db, mock_check):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (1, False, '$2b$12$hash', 0)
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_check.return_value = False
+
+        with patch('app.SERVER_TIMING_ENABLED', True):
+            timed_app = create_app()
+        response = timed_app.test_client().post('/api/v1/login', json={'email': 'a@example.com', 'password': 'x'})
+
+        header = response.headers['Server-Timing']
+        self.assertIn('password_verify;dur=', header)
+        self.assertIn('total;dur=', header)
+
+        with self.assertLogs('timing', level='INFO') as logs:
+            response = app.test_client().post('/api/v1/login', json={'email': 'a@example.com', 'password': 'x'})
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertIn('Timing POST /api/v1/login: ', logs.output[0])
+        self.assertIn('password_verify;dur=', logs.output[0])
+
+
+class ProfilerTestCase(unittest.TestCase):
+    def test_collapse_orders_outermost_first(self):
+        def inner():
+            return collapse(sys._getframe(), 'endpoint')
+
+        stack = inner().split(';')
+        self.assertEqual(stack[0], 'endpoint')
+        self.assertTrue(stack[-1].startswith('inner (test_timing.py:'))
+
+    def test_sampled_request_stacks_are_written(self):
+        output = os.path.join(tempfile.mkdtemp(), 'profile-{pid}.folded')
+        profiler = SamplingProfiler(rate=1.0, interval=0.001, output=output)
+        release = threading.Event()
+        sampled = threading.Event()
+
+        def request():
+            self.assertTrue(profiler.begin_request('auth_bp.login'))
+            sampled.set()
+            release.wait(5)
+            profiler.end_request()
+
+        profiler.start()
+        worker = threading.Thread(target=request)
+        worker.start()
+        sampled.wait(5)
+        threading.Event().wait(0.05)
+        release.set()
+        worker.join()
+        path = profiler.stop()
+
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(all(line.startswith('auth_bp.login;') for line in lines))
+        self.assertTrue(any('request (test_timing.py:' in line for line in lines))
+
+    def test_unsampled_when_stopped(self):
+        self.assertFalse(SamplingProfiler(rate=1.0).begin_request('auth_bp.login'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+File: test_tokens.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import time
+import unittest
+from unittest.mock import patch
+from flask import Flask, g, jsonify
+import jwt
+import config
+from decorators import auth_required
+from revocation import revocation_cache, token_epochs
+from tokens import claims_cache, decode_access_token, verify_access_token
+
+
+class ClaimsCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        claims_cache.clear()
+        self.token = jwt.encode({'user_id': 1, 'exp': int(time.time()) + 60}, config.FLASK_SECRET_KEY, algorithm='HS256')
+
+    def test_claims_decoded_once_until_expiry(self):
+        with patch('tokens.decode_access_token', wraps=decode_access_token) as mock_decode:
+            self.assertEqual(verify_access_token(self.token)['user_id'], 1)
+            self.assertEqual(verify_access_token(self.token)['user_id'], 1)
+            mock_decode.assert_called_once_with(self.token)
+
+            with patch('cache.time.time', return_value=time.time() + 61):
+                verify_access_token(self.token)
+            self.assertEqual(mock_decode.call_count, 2)
+
+    def test_invalid_token_not_cached(self):
+        forged = jwt.encode({'user_id': 1}, 'not-the-secret', algorithm='HS256')
+        for _ in range(2):
+            with self.assertRaises(jwt.InvalidTokenError):
+                verify_access_token(forged)
+        self.assertEqual(claims_cache.stats()['size'], 0)
+
+    def test_auth_required_exposes_claims(self):
+        app = Flask(__name__)
+
+        @app.route('/protected')
+        @auth_required
+        def protected():
+            return jsonify(g.claims)
+
+        with patch.object(revocation_cache, 'is_revoked', return_value=False), \
+                patch.object(token_epochs, 'current', return_value=0):
+            response = app.test_client().get('/protected', headers={'x-access-token': self.token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['user_id'], 1)
+        self.assertEqual(claims_cache.stats()['size'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,14 +8,19 @@ Email: mcardle-j9@ulster.ac.uk
 B-No: B00733578
 """
 
+import datetime
 import unittest
+from psycopg2.errors import UniqueViolation
 from unittest.mock import patch, MagicMock
 from flask import Flask
-from blueprints.users.users import users_bp
+from blueprints.users.users import decode_cursor, users_bp
 import jwt
 import config
+from profiles import profile_cache
+from revocation import revocation_cache, token_epochs
 
 MOCK_TOKEN = jwt.encode({'user_id': 1, 'email_address': 'user@example.com', 'admin': False}, config.FLASK_SECRET_KEY, algorithm='HS256')
+ADMIN_TOKEN = jwt.encode({'user_id': 2, 'email_address': 'admin@example.com', 'admin': True}, config.FLASK_SECRET_KEY, algorithm='HS256')
 
 class UserTestCase(unittest.TestCase):
     def setUp(self):
@@ -23,26 +28,59 @@ class UserTestCase(unittest.TestCase):
         self.app.register_blueprint(users_bp)
         self.client = self.app.test_client()
 
+        for target, name, kwargs in ((revocation_cache, 'is_revoked', {'return_value': False}),
+                                     (revocation_cache, 'add', {}),
+                                     (token_epochs, 'current', {'return_value': 0}),
+                                     (token_epochs, 'set', {})):
+            patcher = patch.object(target, name, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        profile_cache.clear()
+
     # GET /api/v1/users/<user_id>
     @patch('blueprints.users.users.db_connect')
     def test_get_user_success(self, mock_db):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
-        mock_cursor.fetchone.return_value = (1, 'John', 'Doe', 'john@example.com', '1234567890', 'Belfast', False, MagicMock(isoformat=lambda: '2024-01-01T00:00:00'))
-        mock_db.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (1, 'John', 'Doe', 'john@example.com', '1234567890', 'Belfast', False, MagicMock(isoformat=lambda: '2024-01-01T00:00:00'), '42')
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
         response = self.client.get('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN})
         self.assertEqual(response.status_code, 200)
         self.assertIn('email_address', response.json)
+        self.assertEqual(response.headers['ETag'], '"1-42"')
+
+    @patch('blueprints.users.users.db_connect')
+    def test_get_user_cached_and_revalidated(self, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (1, 'John', 'Doe', 'john@example.com', '1234567890', 'Belfast', False, MagicMock(isoformat=lambda: '2024-01-01T00:00:00'), '42')
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        self.client.get('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN})
+        response = self.client.get('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN})
+        self.assertEqual(response.json['first_name'], 'John')
+        response = self.client.get('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN, 'If-None-Match': '"1-42"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        mock_cursor.execute.assert_called_once()
+
+        mock_cursor.rowcount = 1
+        self.client.put('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN}, json={'city': 'Derry'})
+        mock_cursor.fetchone.return_value = mock_cursor.fetchone.return_value[:8] + ('43',)
+        response = self.client.get('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN, 'If-None-Match': '"1-42"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['ETag'], '"1-43"')
 
     @patch('blueprints.users.users.db_connect')
     def test_get_user_not_found(self, mock_db):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
         mock_cursor.fetchone.return_value = None
-        mock_db.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
         response = self.client.get('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN})
         self.assertEqual(response.status_code, 404)
@@ -51,21 +89,131 @@ class UserTestCase(unittest.TestCase):
     def test_get_user_db_error(self, mock_db):
         mock_conn = MagicMock()
         mock_conn.cursor.side_effect = Exception("DB Error")
-        mock_db.return_value = mock_conn
+        mock_db.return_value.__enter__.return_value = mock_conn
 
         response = self.client.get('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN})
         self.assertEqual(response.status_code, 500)
 
+    # GET /api/v1/users?ids=...
+    @patch('blueprints.users.users.db_connect')
+    def test_lookup_users_reports_missing(self, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        created = MagicMock(isoformat=lambda: '2024-01-01T00:00:00')
+        mock_cursor.fetchall.return_value = [(3, 'Ann', 'Lee', 'ann@example.com', '1', 'Derry', False, created),
+                                             (1, 'John', 'Doe', 'john@example.com', '2', 'Belfast', False, created)]
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        response = self.client.get('/api/v1/users?ids=1,2,3&ids=1', headers={'x-access-token': MOCK_TOKEN})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user['user_id'] for user in response.json['users']], [1, 3])
+        self.assertEqual(response.json['missing'], [2])
+        mock_cursor.execute.assert_called_once()
+        self.assertEqual(mock_cursor.execute.call_args[0][1], ([1, 2, 3],))
+
+    def test_lookup_users_invalid_ids(self):
+        response = self.client.get('/api/v1/users?ids=1,abc', headers={'x-access-token': MOCK_TOKEN})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/users/lookup', headers={'x-access-token': MOCK_TOKEN}, json={'ids': [1, True]})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/users/lookup', headers={'x-access-token': MOCK_TOKEN}, json=[1, 2])
+        self.assertEqual(response.status_code, 400)
+
+    @patch('blueprints.users.users.USERS_LOOKUP_MAX_BATCH', 2)
+    def test_lookup_users_batch_too_large(self):
+        response = self.client.post('/api/v1/users/lookup', headers={'x-access-token': MOCK_TOKEN}, json={'ids': [1, 2, 3]})
+        self.assertEqual(response.status_code, 422)
+
+    # GET /api/v1/admin/users
+    def test_list_users_requires_admin(self):
+        response = self.client.get('/api/v1/admin/users', headers={'x-access-token': MOCK_TOKEN})
+        self.assertEqual(response.status_code, 403)
+
+    @patch('blueprints.users.users.db_connect')
+    def test_list_users_pages_with_cursor(self, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        created = datetime.datetime(2024, 1, 1)
+        mock_cursor.fetchall.return_value = [(3, 'Ann', 'Lee', 'ann@example.com', '1', 'Derry', False, created),
+                                             (2, 'John', 'Doe', 'john@example.com', '2', 'Derry', False, created),
+                                             (1, 'Jo', 'Doe', 'jo@example.com', '3', 'Derry', False, created)]
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        response = self.client.get('/api/v1/admin/users?limit=2&city=Derry&admin=false', headers={'x-access-token': ADMIN_TOKEN})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user['user_id'] for user in response.json['users']], [3, 2])
+        self.assertEqual(decode_cursor(response.json['next_cursor']), (created, 2))
+        query, params = mock_cursor.execute.call_args[0]
+        self.assertIn('NOT admin', query)
+        self.assertEqual(params, ['Derry', 3])
+
+        mock_cursor.fetchall.return_value = mock_cursor.fetchall.return_value[2:]
+        response = self.client.get(f"/api/v1/admin/users?limit=2&cursor={response.json['next_cursor']}", headers={'x-access-token': ADMIN_TOKEN})
+        self.assertEqual([user['user_id'] for user in response.json['users']], [1])
+        self.assertIsNone(response.json['next_cursor'])
+        query, params = mock_cursor.execute.call_args[0]
+        self.assertIn('(creation_time, user_id) < (%s, %s)', query)
+        self.assertEqual(params, [created, 2, 3])
+
+    def test_list_users_invalid_params(self):
+        for query in ('cursor=not-a-cursor', 'admin=maybe', 'limit=ten'):
+            response = self.client.get(f'/api/v1/admin/users?{query}', headers={'x-access-token': ADMIN_TOKEN})
+            self.assertEqual(response.status_code, 400)
+
+    # GET /api/v1/admin/users/export
+    @patch('blueprints.users.users.export_users')
+    def test_bulk_export_users(self, mock_export):
+        mock_export.side_effect = lambda compress: iter([b'{"user_id":1}\n', b'{"user_id":2}\n'])
+        response = self.client.get('/api/v1/admin/users/export', headers={'x-access-token': ADMIN_TOKEN})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(response.data.splitlines(), [b'{"user_id":1}', b'{"user_id":2}'])
+        self.assertNotIn('Content-Encoding', response.headers)
+
+        response = self.client.get('/api/v1/admin/users/export', headers={'x-access-token': ADMIN_TOKEN, 'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        mock_export.assert_called_with(compress=True)
+
+    @patch('blueprints.users.users.export_users')
+    def test_bulk_export_users_db_error(self, mock_export):
+        def fail(compress):
+            raise Exception("DB Error")
+            yield
+        mock_export.side_effect = fail
+        response = self.client.get('/api/v1/admin/users/export', headers={'x-access-token': ADMIN_TOKEN})
+        self.assertEqual(response.status_code, 500)
+
+    # POST /api/v1/admin/users/import
+    @patch('blueprints.users.users.import_users', return_value={'imported': 1, 'rejected': []})
+    def test_bulk_import_users(self, mock_import):
+        body = 'first_name,last_name,email_address,mobile_number,city,password\n'
+        response = self.client.post('/api/v1/admin/users/import', headers={'x-access-token': MOCK_TOKEN},
+                                    data=body, content_type='text/csv')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post('/api/v1/admin/users/import', headers={'x-access-token': ADMIN_TOKEN},
+                                    data=body, content_type='application/xml')
+        self.assertEqual(response.status_code, 415)
+
+        response = self.client.post('/api/v1/admin/users/import', headers={'x-access-token': ADMIN_TOKEN},
+                                    data=body, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['imported'], 1)
+        stream, fmt = mock_import.call_args[0]
+        self.assertEqual(fmt, 'csv')
+
     # PUT /api/v1/users/<user_id>
     @patch('blueprints.users.users.db_connect')
     @patch('blueprints.users.users.valid_email', return_value=True)
     @patch('blueprints.users.users.valid_password', return_value=True)
-    def test_update_user_success(self, mock_db):
+    def test_update_user_success(self, mock_valid_password, mock_valid_email, mock_db):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
         mock_cursor.rowcount = 1
-        mock_db.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
         payload = {"first_name": "Jane", "email_address": "jane@example.com", "password": "Password1!"}
         response = self.client.put('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN}, json=payload)
@@ -80,12 +228,24 @@ class UserTestCase(unittest.TestCase):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
         mock_cursor.rowcount = 0
-        mock_db.return_value = mock_conn
-        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
 
         payload = {"first_name": "NewName"}
         response = self.client.put('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN}, json=payload)
         self.assertEqual(response.status_code, 404)
 
+    @patch('blueprints.users.users.db_connect')
+    def test_update_user_email_in_use(self, mock_db):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.execute.side_effect = UniqueViolation()
+        mock_db.return_value.__enter__.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        payload = {"email_address": "taken@example.com"}
+        response = self.client.put('/api/v1/users/1', headers={'x-access-token': MOCK_TOKEN}, json=payload)
+        self.assertEqual(response.status_code, 409)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+File: test_verifier.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import datetime
+import hashlib
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from flask import Flask, g, jsonify
+import jwt
+import config
+from signing_keys import Keyring, create_key
+from verifier import TokenRejected, TokenVerifier
+
+MOCK_TOKEN = jwt.encode({'user_id': 1, 'email_address': 'user@example.com', 'admin': False}, config.FLASK_SECRET_KEY, algorithm='HS256')
+
+
+class TokenVerifierTestCase(unittest.TestCase):
+    def setUp(self):
+        self.introspector = MagicMock(side_effect=lambda tokens: [{'valid': True} for _ in tokens])
+        self.verifier = TokenVerifier(config.FLASK_SECRET_KEY, introspector=self.introspector)
+
+    def test_claims_cached_after_first_verification(self):
+        self.assertEqual(self.verifier.verify(MOCK_TOKEN)['user_id'], 1)
+        self.assertEqual(self.verifier.verify(MOCK_TOKEN)['user_id'], 1)
+        self.introspector.assert_called_once_with([MOCK_TOKEN])
+        self.assertEqual(self.verifier.stats()['hits'], 1)
+
+    def test_expired_token_rejected_locally(self):
+        expired = jwt.encode({'user_id': 1, 'exp': datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)},
+                             config.FLASK_SECRET_KEY, algorithm='HS256')
+        with self.assertRaises(TokenRejected):
+            self.verifier.verify(expired)
+        self.introspector.assert_not_called()
+
+    def test_bad_signature_rejected_locally(self):
+        forged = jwt.encode({'user_id': 1}, 'not-the-secret', algorithm='HS256')
+        with self.assertRaises(TokenRejected):
+            self.verifier.verify(forged)
+        self.introspector.assert_not_called()
+
+    def test_refresh_picks_up_revocation(self):
+        self.verifier.verify(MOCK_TOKEN)
+        self.introspector.side_effect = lambda tokens: [{'valid': False, 'error': 'Token has been cancelled.'}]
+        self.verifier.refresh()
+        with self.assertRaises(TokenRejected):
+            self.verifier.verify(MOCK_TOKEN)
+
+    def test_refresh_reads_revocation_feed(self):
+        tokens = [jwt.encode({'user_id': user_id, 'token_epoch': 0, 'n': n}, config.FLASK_SECRET_KEY, algorithm='HS256')
+                  for user_id, n in ((1, 0), (1, 1), (2, 0))]
+        feed = MagicMock(side_effect=[([{'cursor': 9, 'token_hash': hashlib.sha256(tokens[1].encode()).hexdigest()}], 9), ([], 9)])
+        verifier = TokenVerifier(config.FLASK_SECRET_KEY, introspector=self.introspector, revocation_feed=feed)
+        for token in tokens:
+            verifier.verify(token)
+        self.introspector.reset_mock()
+
+        verifier.refresh()
+        self.assertEqual([c.args[0] for c in feed.call_args_list], [0, 9])
+        self.introspector.assert_called_once_with([tokens[0], tokens[2]])
+        with self.assertRaises(TokenRejected):
+            verifier.verify(tokens[1])
+
+        feed.side_effect = OSError("connection refused")
+        self.introspector.reset_mock()
+        verifier.refresh()
+        self.introspector.assert_called_once_with([tokens[0], tokens[2]])
+
+    def test_refresh_picks_up_logout_all(self):
+        tokens = [jwt.encode({'user_id': 1, 'token_epoch': 0, 'n': n}, config.FLASK_SECRET_KEY, algorithm='HS256')
+                  for n in range(3)]
+        verifier = TokenVerifier(config.FLASK_SECRET_KEY, introspector=self.introspector,
+                                 revocation_feed=MagicMock(return_value=([], 0)))
+        for token in tokens:
+            verifier.verify(token)
+
+        self.introspector.side_effect = lambda batch: [{'valid': False, 'error': 'Token has been cancelled.'} for _ in batch]
+        verifier.refresh()
+        self.assertEqual([c.args[0] for c in self.introspector.call_args_list[-2:]], [[tokens[0]], tokens[1:]])
+        for token in tokens:
+            with self.assertRaises(TokenRejected):
+                verifier.verify(token)
+
+    def test_unreachable_service_fails_closed(self):
+        self.introspector.side_effect = OSError("connection refused")
+        with self.assertRaises(TokenRejected) as ctx:
+            self.verifier.verify(MOCK_TOKEN)
+        self.assertEqual(ctx.exception.status, 503)
+
+    def test_flask_decorator(self):
+        app = Flask(__name__)
+
+        @app.route('/protected')
+        @self.verifier.auth_required
+        def protected():
+            return jsonify({'user_id': g.user_id})
+
+        client = app.test_client()
+        self.assertEqual(client.get('/protected').status_code, 401)
+        response = client.get('/protected', headers={'x-access-token': MOCK_TOKEN})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['user_id'], 1)
+
+    def test_jwks_verification(self):
+        directory = tempfile.mkdtemp()
+        key = create_key(directory, 'EdDSA', time.time())
+        keyring = Keyring(directory, reload_interval=0)
+        token = jwt.encode({'user_id': 1}, key.private_key, algorithm='EdDSA', headers={'kid': key.kid})
+        verifier = TokenVerifier(jwks_url='https://auth.example.com/.well-known/jwks.json')
+
+        with patch.object(jwt.PyJWKClient, 'fetch_data', return_value=keyring.jwks()):
+            self.assertEqual(verifier.verify(token)['user_id'], 1)
+            with self.assertRaises(TokenRejected):
+                verifier.verify(MOCK_TOKEN)
+
+        with patch.object(jwt.PyJWKClient, 'fetch_data', side_effect=jwt.PyJWKClientConnectionError('down')):
+            forged = jwt.encode({'user_id': 1}, key.private_key, algorithm='EdDSA', headers={'kid': 'unknown'})
+            with self.assertRaises(TokenRejected) as ctx:
+                verifier.verify(forged)
+        self.assertEqual(ctx.exception.status, 503)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,463 @@
+"""
+File: throttle.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Optional, Sequence, Tuple
+from cache import TTLCache
+from config import (
+    LOGIN_THROTTLE_ENABLED,
+    LOGIN_EMAIL_BURST,
+    LOGIN_EMAIL_RATE,
+    LOGIN_EMAIL_FREE_FAILURES,
+    LOGIN_IP_BURST,
+    LOGIN_IP_RATE,
+    LOGIN_IP_FREE_FAILURES,
+    LOGIN_BACKOFF_BASE,
+    LOGIN_BACKOFF_MAX,
+    LOGIN_THROTTLE_SIZE,
+    LOGIN_THROTTLE_TTL,
+    LOGIN_THROTTLE_REDIS_URL,
+    LOGIN_TRUST_TTL,
+)
+from metrics import registry
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Limit:
+    """
+    Throttling policy for one kind of key.
+
+    Args:
+        burst (int): Attempts allowed back to back; the bucket's capacity.
+        rate (float): Attempts regained per second.
+        free_failures (int): Consecutive failures allowed before backing off.
+    """
+
+    __slots__ = ("burst", "rate", "free_failures")
+
+    def __init__(self, burst: int, rate: float, free_failures: int) -> None:
+        self.burst = burst
+        self.rate = rate
+        self.free_failures = free_failures
+
+
+class ThrottleStore(ABC):
+    """
+    Storage for the state of each throttled key: the tokens left in its bucket, when
+    they were counted, its consecutive failures and when its backoff ends.
+    """
+
+    @abstractmethod
+    def take(self, keys: Sequence[Tuple[str, Limit]], now: float) -> float:
+        """
+        Take one token from each key's bucket, or from none of them.
+
+        Every bucket is checked before any is charged, so an attempt rejected by one key
+        costs the others nothing.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until every key has one.
+        """
+
+    @abstractmethod
+    def fail(self, key: str, limit: Limit, base: float, cap: float, now: float) -> float:
+        """
+        Count a failed attempt, backing off exponentially once `limit.free_failures` is exceeded.
+
+        Returns:
+            float: When the key's backoff ends, or 0 if it is not backing off.
+        """
+
+    @abstractmethod
+    def reset(self, key: str) -> None:
+        """
+        Forget the key's state.
+        """
+
+    @abstractmethod
+    def trust(self, key: str, seconds: float, now: float) -> None:
+        """
+        Mark the key as trusted for `seconds`.
+        """
+
+    @abstractmethod
+    def trusted(self, key: str, now: float) -> bool:
+        """
+        Return whether the key is trusted.
+        """
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Forget the state of every key.
+        """
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """
+        Return the store's cache statistics.
+        """
+
+
+def _refill(state: Optional[Tuple], limit: Limit, now: float) -> Tuple[float, int, float]:
+    """Return the key's tokens as of `now`, its failures and its backoff end."""
+    if state is None:
+        return float(limit.burst), 0, 0.0
+    tokens, counted, failures, blocked_until = state
+    return min(limit.burst, tokens + (now - counted) * limit.rate), failures, blocked_until
+
+
+class MemoryStore(ThrottleStore):
+    """
+    Per-process store kept in a `TTLCache`.
+
+    Memory is bounded by `maxsize` keys, the least recently used being dropped first,
+    and a key is forgotten `ttl` seconds after its last attempt.
+
+    Args:
+        maxsize (int): Maximum number of keys held.
+        ttl (float): Seconds a key's state is kept after its last attempt.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._state = TTLCache(maxsize, ttl)
+        self._trusted = TTLCache(maxsize, ttl)
+        self._lock = threading.Lock()
+
+    def take(self, keys: Sequence[Tuple[str, Limit]], now: float) -> float:
+        with self._lock:
+            states = [_refill(self._state.get(key), limit, now) for key, limit in keys]
+            wait = 0.0
+            for (_, limit), (tokens, _, blocked_until) in zip(keys, states):
+                if blocked_until > now:
+                    wait = max(wait, blocked_until - now)
+                elif tokens < 1:
+                    wait = max(wait, (1 - tokens) / limit.rate)
+            if wait:
+                return wait
+            for (key, _), (tokens, failures, blocked_until) in zip(keys, states):
+                self._state.set(key, (tokens - 1, now, failures, blocked_until))
+            return 0.0
+
+    def fail(self, key: str, limit: Limit, base: float, cap: float, now: float) -> float:
+        with self._lock:
+            tokens, failures, blocked_until = _refill(self._state.get(key), limit, now)
+            failures += 1
+            if failures > limit.free_failures:
+                blocked_until = now + min(base * 2 ** (failures - limit.free_failures - 1), cap)
+            self._state.set(key, (tokens, now, failures, blocked_until))
+            return blocked_until if blocked_until > now else 0.0
+
+    def reset(self, key: str) -> None:
+        self._state.pop(key)
+
+    def trust(self, key: str, seconds: float, now: float) -> None:
+        self._trusted.set(key, now + seconds, expires_at=time.time() + seconds)
+
+    def trusted(self, key: str, now: float) -> bool:
+        return self._trusted.get(key, 0.0) > now
+
+    def clear(self) -> None:
+        self._state.clear()
+        self._trusted.clear()
+
+    def stats(self) -> dict:
+        return self._state.stats()
+
+
+_TAKE_SCRIPT = """
+local now, ttl = tonumber(ARGV[1]), tonumber(ARGV[2])
+local tokens, wait, limiting = {}, 0, 0
+for i, key in ipairs(KEYS) do
+    local burst, rate = tonumber(ARGV[2 * i + 1]), tonumber(ARGV[2 * i + 2])
+    local state = redis.call('HMGET', key, 'tokens', 'counted', 'blocked_until')
+    local blocked_until = tonumber(state[3]) or 0
+    tokens[i] = burst
+    if state[1] then
+        tokens[i] = math.min(burst, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+    end
+    local key_wait = 0
+    if blocked_until > now then
+        key_wait = blocked_until - now
+    elseif tokens[i] < 1 then
+        key_wait = (1 - tokens[i]) / rate
+    end
+    if key_wait > wait then
+        wait, limiting = key_wait, i
+    end
+end
+if wait > 0 then
+    return {limiting, tostring(wait)}
+end
+for i, key in ipairs(KEYS) do
+    redis.call('HSET', key, 'tokens', tostring(tokens[i] - 1), 'counted', tostring(now))
+    redis.call('EXPIRE', key, ttl)
+end
+return {0, '0'}
+"""
+
+_FAIL_SCRIPT = """
+local free, base, cap, now, ttl = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+local blocked_until = 0
+if failures > free then
+    blocked_until = now + math.min(base * 2 ^ (failures - free - 1), cap)
+    redis.call('HSET', KEYS[1], 'blocked_until', tostring(blocked_until))
+end
+redis.call('EXPIRE', KEYS[1], ttl)
+return tostring(blocked_until)
+"""
+
+
+class RedisStore(ThrottleStore):
+    """
+    Store shared by every worker through Redis, so that limits hold across processes
+    and hosts.
+
+    Each update is a Lua script, so concurrent attempts on the same keys are applied
+    atomically, and an attempt checks and charges all its buckets in one round trip.
+    Keys expire `ttl` seconds after their last attempt. Backoffs are also remembered in
+    a local `TTLCache`, so a key that is backing off is rejected without a round trip to
+    Redis. Requires the `redis` package.
+
+    Args:
+        url (str): The Redis URL.
+        maxsize (int): Maximum number of backoffs remembered locally.
+        ttl (float): Seconds a key's state is kept after its last attempt.
+        prefix (str): Prefix of every Redis key.
+    """
+
+    def __init__(self, url: str, maxsize: int, ttl: float, prefix: str = "login-throttle:") -> None:
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(
+                "The shared login throttle requires the redis package."
+            ) from e
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+        self._fail = self._client.register_script(_FAIL_SCRIPT)
+        self._blocked = TTLCache(maxsize, ttl)
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    def take(self, keys: Sequence[Tuple[str, Limit]], now: float) -> float:
+        wait = max(self._blocked.get(key, 0.0) for key, _ in keys) - now
+        if wait > 0:
+            return wait
+        args = [now, self.ttl]
+        for _, limit in keys:
+            args += [limit.burst, limit.rate]
+        limiting, wait = self._take(keys=[self.prefix + key for key, _ in keys], args=args)
+        wait = float(wait)
+        if wait:
+            self._blocked.set(keys[limiting - 1][0], now + wait, expires_at=now + wait)
+        return wait
+
+    def fail(self, key: str, limit: Limit, base: float, cap: float, now: float) -> float:
+        blocked_until = float(
+            self._fail(keys=[self.prefix + key], args=[limit.free_failures, base, cap, now, self.ttl])
+        )
+        if blocked_until:
+            self._blocked.set(key, blocked_until, expires_at=blocked_until)
+        return blocked_until
+
+    def reset(self, key: str) -> None:
+        self._blocked.pop(key)
+        self._client.delete(self.prefix + key)
+
+    def trust(self, key: str, seconds: float, now: float) -> None:
+        self._client.set(self.prefix + "trusted:" + key, 1, ex=max(1, int(seconds)))
+
+    def trusted(self, key: str, now: float) -> bool:
+        return bool(self._client.exists(self.prefix + "trusted:" + key))
+
+    def clear(self) -> None:
+        self._blocked.clear()
+        for key in self._client.scan_iter(f"{self.prefix}*"):
+            self._client.delete(key)
+
+    def stats(self) -> dict:
+        return self._blocked.stats()
+
+
+class LoginThrottle:
+    """
+    Token-bucket throttle for login attempts, keyed by email address and by client IP.
+
+    Every attempt takes a token from the bucket of the email address, of the IP and of
+    the pair of both, so a burst of attempts is cut to each bucket's refill rate. All
+    buckets are checked before any is charged, so a rejected attempt costs nothing.
+    Failed attempts count against the IP and against the pair, and once either exceeds
+    its free failures it is shut out for a period that doubles with each further
+    failure, up to `backoff_max`. The email address alone never backs off.
+
+    The email bucket is shared by everyone, so on its own an attacker sending one attempt
+    every `1 / email.rate` seconds from anywhere would keep the owner throttled. A
+    successful login therefore clears the pair's state and trusts the pair for
+    `trust_ttl` seconds, during which it skips the email bucket: the owner's usual
+    browser and network keep working while the address is under attack.
+
+    `check` is meant to run before any database lookup or password hashing, so that
+    rejected attempts cost only a dictionary lookup.
+
+    Args:
+        store (ThrottleStore): Where the state of each key is kept.
+        email (Limit): Policy applied per email address; its `free_failures` apply per
+            pair of email address and IP.
+        ip (Limit): Policy applied per client IP.
+        backoff_base (float): Seconds shut out after the first failure beyond the free ones.
+        backoff_max (float): Longest backoff in seconds.
+        trust_ttl (float): Seconds a pair skips the email bucket after a successful login.
+        enabled (bool): When False, every attempt is allowed.
+        clock (Callable[[], float]): Source of the current time in seconds since the epoch.
+    """
+
+    def __init__(
+        self,
+        store: ThrottleStore,
+        email: Limit,
+        ip: Limit,
+        backoff_base: float,
+        backoff_max: float,
+        trust_ttl: float = 0.0,
+        enabled: bool = True,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.store = store
+        self.email = email
+        self.ip = ip
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.trust_ttl = trust_ttl
+        self.enabled = enabled
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._counters = {"allowed": 0, "rejected": 0, "failures": 0}
+
+    def _failure_keys(self, email: str, ip: Optional[str]) -> Tuple[Tuple[str, Limit], ...]:
+        """Return the keys a failed attempt counts against."""
+        if not ip:
+            return ()
+        return (("pair:" + email.lower() + "|" + ip, self.email), ("ip:" + ip, self.ip))
+
+    def _keys(self, email: str, ip: Optional[str], now: float) -> Tuple[Tuple[str, Limit], ...]:
+        """Return the keys an attempt takes a token from."""
+        keys = self._failure_keys(email, ip)
+        if not (keys and self.trust_ttl and self.store.trusted(keys[0][0], now)):
+            keys += (("email:" + email.lower(), self.email),)
+        return keys
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def check(self, email: str, ip: Optional[str]) -> float:
+        """
+        Decide whether a login attempt may proceed, taking a token for it if so.
+
+        Args:
+            email (str): The email address being logged in to.
+            ip (str, optional): The client's IP address.
+
+        Returns:
+            float: 0 if the attempt may proceed, otherwise the seconds to wait before retrying.
+        """
+        if not self.enabled:
+            return 0.0
+        now = self.clock()
+        wait = self.store.take(self._keys(email, ip, now), now)
+        if wait:
+            self._count("rejected")
+            logger.warning("Login attempt throttled for %s from %s, retry in %.1fs.", email, ip, wait)
+            return wait
+        self._count("allowed")
+        return 0.0
+
+    def failed(self, email: str, ip: Optional[str]) -> None:
+        """
+        Record a failed login attempt.
+
+        Args:
+            email (str): The email address being logged in to.
+            ip (str, optional): The client's IP address.
+        """
+        if not self.enabled:
+            return
+        now = self.clock()
+        self._count("failures")
+        for key, limit in self._failure_keys(email, ip):
+            self.store.fail(key, limit, self.backoff_base, self.backoff_max, now)
+
+    def succeeded(self, email: str, ip: Optional[str]) -> None:
+        """
+        Record a successful login, clearing the failures of the email address from this IP
+        and trusting the pair for `trust_ttl` seconds.
+
+        Args:
+            email (str): The email address logged in to.
+            ip (str, optional): The client's IP address.
+        """
+        if self.enabled and ip:
+            key = "pair:" + email.lower() + "|" + ip
+            self.store.reset(key)
+            if self.trust_ttl:
+                self.store.trust(key, self.trust_ttl, self.clock())
+
+    def clear(self) -> None:
+        """
+        Forget every key's state.
+        """
+        self.store.clear()
+
+    def stats(self) -> dict:
+        """
+        Return the throttle's counters and its store's size.
+
+        Returns:
+            dict: `allowed`, `rejected` and `failures` counts, and the store's cache statistics.
+        """
+        with self._lock:
+            snapshot = dict(self._counters)
+        snapshot.update(self.store.stats())
+        return snapshot
+
+
+def configured_store() -> ThrottleStore:
+    """
+    Build the store selected by `LOGIN_THROTTLE_REDIS_URL`: Redis if it is set, memory otherwise.
+    """
+    if LOGIN_THROTTLE_REDIS_URL:
+        return RedisStore(LOGIN_THROTTLE_REDIS_URL, LOGIN_THROTTLE_SIZE, LOGIN_THROTTLE_TTL)
+    return MemoryStore(LOGIN_THROTTLE_SIZE, LOGIN_THROTTLE_TTL)
+
+
+login_throttle = LoginThrottle(
+    configured_store(),
+    email=Limit(LOGIN_EMAIL_BURST, LOGIN_EMAIL_RATE, LOGIN_EMAIL_FREE_FAILURES),
+    ip=Limit(LOGIN_IP_BURST, LOGIN_IP_RATE, LOGIN_IP_FREE_FAILURES),
+    backoff_base=LOGIN_BACKOFF_BASE,
+    backoff_max=LOGIN_BACKOFF_MAX,
+    trust_ttl=LOGIN_TRUST_TTL,
+    enabled=LOGIN_THROTTLE_ENABLED,
+)
+
+
+registry.register_stats(
+    "login_throttle",
+    "Login throttle",
+    login_throttle.stats,
+    counters=("allowed", "rejected", "failures", "hits", "misses", "evictions"),
+)
@@ -0,0 +1,123 @@
+"""
+File: timing.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+
+
+class span:
+    """
+    Context manager timing one stage of the current request.
+
+    Durations are collected per request and reported by the hooks installed with
+    `instrument`. Outside a request, or when timing is disabled, a span records nothing.
+
+    Args:
+        name (str): The stage name, used as the `Server-Timing` metric name.
+
+    Example:
+        with span("password_verify"):
+            check_password(password, hashed_password)
+    """
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> "span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((self.name, time.perf_counter() - self.started))
+
+
+def summarize(spans: List[Tuple[str, float]]) -> Dict[str, Tuple[float, int]]:
+    """
+    Add up the spans of a request by stage.
+
+    Args:
+        spans (List[Tuple[str, float]]): (name, seconds) pairs in the order they finished.
+
+    Returns:
+        Dict[str, Tuple[float, int]]: Total milliseconds and number of spans per stage, in
+                                      order of first appearance.
+    """
+    totals: Dict[str, Tuple[float, int]] = {}
+    for name, seconds in spans:
+        duration, count = totals.get(name, (0.0, 0))
+        totals[name] = (duration + seconds * 1000, count + 1)
+    return totals
+
+
+def server_timing(totals: Dict[str, Tuple[float, int]], total_ms: float) -> str:
+    """
+    Format per-stage totals as a `Server-Timing` header value.
+
+    Args:
+        totals (Dict[str, Tuple[float, int]]): The result of `summarize`.
+        total_ms (float): The duration of the whole request, in milliseconds.
+
+    Returns:
+        str: The header value, e.g. `db_query;dur=1.2;desc="x2", total;dur=3.4`.
+    """
+    entries = [
+        f'{name};dur={duration:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+        for name, (duration, count) in totals.items()
+    ]
+    entries.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(entries)
+
+
+def instrument(app: Any, request: Any, g: Any, send_header: bool = True) -> None:
+    """
+    Collect the spans of every request and report them in a log line and, optionally, a
+    `Server-Timing` header.
+
+    Args:
+        app (Any): The Flask application.
+        request (Any): Flask's request proxy.
+        g (Any): Flask's application context globals.
+        send_header (bool): Whether to send the timings to the client as well.
+    """
+
+    def start_spans() -> None:
+        g.timing_started = time.perf_counter()
+        g.timing_token = _spans.set([])
+
+    def report_spans(response: Any) -> Any:
+        spans = _spans.get()
+        started = g.get("timing_started")
+        if spans is None or started is None:
+            return response
+        header = server_timing(summarize(spans), (time.perf_counter() - started) * 1000)
+        if send_header:
+            response.headers["Server-Timing"] = header
+        logger.info("Timing %s %s: %s", request.method, request.path, header)
+        return response
+
+    def stop_spans(exc: Optional[BaseException]) -> None:
+        token = g.pop("timing_token", None)
+        if token is not None:
+            _spans.reset(token)
+
+    app.before_request(start_spans)
+    app.after_request(report_spans)
+    app.teardown_request(stop_spans)
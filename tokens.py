@@ -0,0 +1,159 @@
+"""
+File: tokens.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import datetime
+import time
+from typing import Union
+import jwt
+import config
+from cache import TTLCache
+from metrics import JWT_DECODE_DURATION, registry
+from revocation import token_digest
+from signing_keys import keyring
+
+# Verified claims keyed by token digest. Entries expire with the token, so a cached
+# token is never accepted past its `exp`; revocation is still checked on every request.
+claims_cache = TTLCache(maxsize=config.CLAIMS_CACHE_SIZE, ttl=config.CLAIMS_CACHE_TTL)
+
+
+def issue_access_token(
+    user_id: Union[int, str], admin: bool, email_address: str, token_epoch: int
+) -> str:
+    """
+    Create a signed access token for a user.
+
+    The token is signed with the keyring's current key and names it in its `kid` header,
+    so other services can verify it against `/.well-known/jwks.json`. Without a key
+    directory it falls back to HS256 with `FLASK_SECRET_KEY`.
+
+    Args:
+        user_id (Union[int, str]): The ID of the user.
+        admin (bool): Whether the user is an administrator.
+        email_address (str): The user's email address.
+        token_epoch (int): The user's current token epoch.
+
+    Returns:
+        str: The encoded JWT.
+    """
+    claims = {
+        "user_id": user_id,
+        "admin": admin,
+        "email_address": email_address,
+        "token_epoch": token_epoch,
+        "exp": datetime.datetime.now(datetime.timezone.utc)
+        + datetime.timedelta(minutes=config.ACCESS_TOKEN_LIFETIME_MINUTES),
+    }
+    signing_key = keyring.signing_key()
+    if signing_key is None:
+        return jwt.encode(claims, config.FLASK_SECRET_KEY, algorithm="HS256")
+    return jwt.encode(
+        claims,
+        signing_key.private_key,
+        algorithm=signing_key.algorithm,
+        headers={"kid": signing_key.kid},
+    )
+
+
+async def issue_access_token_async(
+    user_id: Union[int, str], admin: bool, email_address: str, token_epoch: int
+) -> str:
+    """
+    Asyncio counterpart of `issue_access_token`.
+
+    An RSA signature costs milliseconds of CPU, and re-reading a stale key directory costs
+    file I/O and PEM parsing, so either runs in the default executor rather than on the
+    event loop. Ed25519 and HS256 signatures take microseconds, less than the hand-off.
+    """
+    args = (user_id, admin, email_address, token_epoch)
+    if not keyring.stale():
+        signing_key = keyring.signing_key()
+        if signing_key is None or signing_key.algorithm != "RS256":
+            return issue_access_token(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, issue_access_token, *args)
+
+
+def _accepts_hs256() -> bool:
+    if config.JWT_ACCEPT_HS256:
+        return True
+    activated_at = keyring.activated_at()
+    return (
+        activated_at is None
+        or keyring.clock() < activated_at + config.ACCESS_TOKEN_LIFETIME_MINUTES * 60
+    )
+
+
+def decode_access_token(token: str) -> dict:
+    """
+    Verify an access token's signature and expiry and return its claims.
+
+    A token naming a `kid` is verified with that key's public half and only that key's
+    algorithm. A token without one is verified as HS256 with `FLASK_SECRET_KEY` only while
+    no key has started signing, for one access token lifetime after the first key does
+    (so tokens issued before the switch expire naturally), or if `JWT_ACCEPT_HS256` is set.
+
+    Args:
+        token (str): The encoded JWT.
+
+    Returns:
+        dict: The decoded claims.
+
+    Raises:
+        jwt.InvalidTokenError: If the token is malformed, badly signed, expired or signed
+                               with an unknown key.
+    """
+    with JWT_DECODE_DURATION.time():
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            if not _accepts_hs256():
+                raise jwt.InvalidTokenError("Token has no key ID.")
+            return jwt.decode(token, config.FLASK_SECRET_KEY, algorithms=["HS256"])
+        signing_key = keyring.get(kid) if isinstance(kid, str) else None
+        if signing_key is None:
+            raise jwt.InvalidTokenError("Token is signed with an unknown key.")
+        return jwt.decode(token, signing_key.public_key, algorithms=[signing_key.algorithm])
+
+
+def verify_access_token(token: str) -> dict:
+    """
+    Return an access token's verified claims, decoding it only the first time it is seen.
+
+    Clients present the same token on every request until it expires, so the claims are
+    cached by token digest until the token's `exp` (at most `CLAIMS_CACHE_TTL` seconds).
+    Invalid tokens are never cached. The returned dict is shared and must not be modified.
+
+    Args:
+        token (str): The encoded JWT.
+
+    Returns:
+        dict: The decoded claims.
+
+    Raises:
+        jwt.InvalidTokenError: If the token is malformed, badly signed, expired or signed
+                               with an unknown key.
+    """
+    digest = token_digest(token)
+    claims = claims_cache.get(digest)
+    if claims is None:
+        claims = decode_access_token(token)
+        exp = claims.get("exp")
+        expires_at = time.time() + claims_cache.ttl
+        if isinstance(exp, (int, float)):
+            expires_at = min(exp, expires_at)
+        claims_cache.set(digest, claims, expires_at)
+    return claims
+
+
+registry.register_stats(
+    "claims_cache",
+    "Verified access token claims cache",
+    claims_cache.stats,
+    counters=("hits", "misses", "evictions"),
+)
@@ -0,0 +1,13 @@
+"""
+File: __init__.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+from verifier.verifier import TokenRejected, TokenVerifier, HttpIntrospector, HttpRevocationFeed
+
+__all__ = ["TokenRejected", "TokenVerifier", "HttpIntrospector", "HttpRevocationFeed"]
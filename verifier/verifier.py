@@ -0,0 +1,365 @@
+"""
+File: verifier.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import hashlib
+import json
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import jwt
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenRejected(Exception):
+    """
+    Raised when a token fails verification.
+
+    Args:
+        reason (str): Human-readable reason, e.g. "Token has expired.".
+        status (int): HTTP status code a service should answer with.
+    """
+
+    def __init__(self, reason: str, status: int = 401) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+
+
+class HttpIntrospector:
+    """
+    Client for the auth service's batch introspection endpoint.
+
+    Args:
+        url (str): Full URL of `/api/v1/introspect`.
+        timeout (float): Seconds to wait for a response.
+        batch_size (int): Maximum tokens sent per request; must not exceed the service's limit.
+    """
+
+    def __init__(self, url: str, timeout: float = 2.0, batch_size: int = 500) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.batch_size = batch_size
+
+    def __call__(self, tokens: Sequence[str]) -> List[dict]:
+        results = []
+        for start in range(0, len(tokens), self.batch_size):
+            body = json.dumps({"tokens": list(tokens[start:start + self.batch_size])})
+            req = urllib.request.Request(
+                self.url,
+                data=body.encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                results.extend(json.loads(response.read())["results"])
+        return results
+
+
+class HttpRevocationFeed:
+    """
+    Client for the auth service's incremental revocation feed.
+
+    Args:
+        url (str): Full URL of `/api/v1/revocations`.
+        timeout (float): Seconds to wait for a response.
+        limit (int): Maximum revocations fetched per request.
+    """
+
+    def __init__(self, url: str, timeout: float = 2.0, limit: int = 1000) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.limit = limit
+
+    def __call__(self, after: int) -> Tuple[List[dict], int]:
+        query = urllib.parse.urlencode({"after": after, "limit": self.limit})
+        with urllib.request.urlopen(f"{self.url}?{query}", timeout=self.timeout) as response:
+            body = json.loads(response.read())
+        return body["revocations"], body["cursor"]
+
+
+class _Entry:
+    __slots__ = ("token", "claims", "expires_at", "revoked")
+
+    def __init__(self, token: str, claims: dict, expires_at: float) -> None:
+        self.token = token
+        self.claims = claims
+        self.expires_at = expires_at
+        self.revoked = False
+
+
+class TokenVerifier:
+    """
+    Verifies CommunityEye access tokens inside a downstream service.
+
+    Performs the same checks as the auth service's `auth_required` decorator: the
+    signature and expiry are verified locally, and revocation (logout, account deletion,
+    logout-all) is resolved through the auth service's introspection endpoint. Verified
+    claims are cached by token digest until the token's `exp`, so a token only causes a
+    remote call the first time it is seen. A background thread refreshes the local
+    revocation state every `refresh_interval` seconds.
+
+    Given a `revocation_feed`, a refresh reads only the revocations published since the
+    last one and re-introspects one cached token per user and token epoch, which is enough
+    to notice a logout-all. Without one, or when the feed cannot be read, every cached
+    token is re-introspected.
+
+    Tokens are verified either with a fixed `key`, or, given `jwks_url`, with the key named
+    by the token's `kid` header, fetched from the auth service's `/.well-known/jwks.json`.
+    Fetched keys are cached for `jwks_lifespan` seconds and an unknown `kid` triggers a
+    refetch, so signing key rotations are followed without configuration changes.
+
+    Args:
+        key (str, optional): The key used to verify token signatures.
+        algorithms (Sequence[str]): Accepted signing algorithms when verifying with `key`.
+        introspector (Callable, optional): Called with a list of tokens and returning one
+            introspection result per token, e.g. `HttpIntrospector(url)`. Without one,
+            only signature and expiry are checked.
+        refresh_interval (float): Seconds between background revocation refreshes.
+        cache_size (int): Maximum number of tokens whose claims are cached.
+        max_ttl (float): Upper bound in seconds on how long a token is cached.
+        fail_open (bool): Accept locally verified tokens when the auth service is unreachable.
+        jwks_url (str, optional): Full URL of `/.well-known/jwks.json`, used instead of `key`.
+        jwks_lifespan (float): Seconds fetched signing keys are cached.
+        revocation_feed (Callable, optional): Called with a cursor and returning the
+            revocations after it and the cursor to resume from, e.g.
+            `HttpRevocationFeed(url)`.
+    """
+
+    def __init__(
+        self,
+        key: Optional[str] = None,
+        algorithms: Sequence[str] = ("HS256",),
+        introspector: Optional[Callable[[Sequence[str]], List[dict]]] = None,
+        refresh_interval: float = 30.0,
+        cache_size: int = 10000,
+        max_ttl: float = 3600.0,
+        fail_open: bool = False,
+        jwks_url: Optional[str] = None,
+        jwks_lifespan: float = 300.0,
+        revocation_feed: Optional[Callable[[int], Tuple[List[dict], int]]] = None,
+    ) -> None:
+        if key is None and jwks_url is None:
+            raise ValueError("Either key or jwks_url is required.")
+        self.key = key
+        self.algorithms = list(algorithms)
+        self.jwks_client = (
+            jwt.PyJWKClient(jwks_url, lifespan=jwks_lifespan) if jwks_url is not None else None
+        )
+        self.introspector = introspector
+        self.revocation_feed = revocation_feed
+        self.refresh_interval = refresh_interval
+        self.cache_size = cache_size
+        self.max_ttl = max_ttl
+        self.fail_open = fail_open
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._refresher: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._cursor = 0
+        self._counters = {"hits": 0, "misses": 0, "remote_calls": 0, "refreshes": 0}
+
+    def verify(self, token: str) -> dict:
+        """
+        Verify a token and return its claims.
+
+        Args:
+            token (str): The encoded JWT.
+
+        Returns:
+            dict: The verified claims.
+
+        Raises:
+            TokenRejected: If the token is invalid, expired or revoked, or cannot be checked.
+        """
+        if not token:
+            raise TokenRejected("Token is missing.")
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(digest)
+                self._counters["hits"] += 1
+                if entry.revoked:
+                    raise TokenRejected("Token has been cancelled.")
+                return entry.claims
+            if entry is not None:
+                del self._entries[digest]
+            self._counters["misses"] += 1
+
+        try:
+            if self.jwks_client is not None:
+                signing_key = self.jwks_client.get_signing_key_from_jwt(token)
+                claims = jwt.decode(token, signing_key.key, algorithms=[signing_key.algorithm_name])
+            else:
+                claims = jwt.decode(token, self.key, algorithms=self.algorithms)
+        except jwt.ExpiredSignatureError:
+            raise TokenRejected("Token has expired.")
+        except jwt.PyJWKClientConnectionError as e:
+            logger.error(f"Error fetching signing keys: {str(e)}")
+            raise TokenRejected("Unable to fetch signing keys.", 503)
+        except (jwt.InvalidTokenError, jwt.PyJWKClientError):
+            raise TokenRejected("Token is invalid.")
+
+        entry = _Entry(token, claims, min(claims.get("exp", now + self.max_ttl), now + self.max_ttl))
+        if self.introspector is not None:
+            try:
+                with self._lock:
+                    self._counters["remote_calls"] += 1
+                result = self.introspector([token])[0]
+                entry.revoked = not result.get("valid", False)
+                if entry.revoked and result.get("error") != "Token has been cancelled.":
+                    raise TokenRejected(result.get("error", "Token is invalid."))
+            except TokenRejected:
+                raise
+            except Exception as e:
+                logger.error(f"Error introspecting token: {str(e)}")
+                if not self.fail_open:
+                    raise TokenRejected("Unable to check token revocation.", 503)
+                return claims
+
+        with self._lock:
+            self._entries[digest] = entry
+            while len(self._entries) > self.cache_size:
+                self._entries.popitem(last=False)
+        if entry.revoked:
+            raise TokenRejected("Token has been cancelled.")
+        return claims
+
+    def refresh(self) -> None:
+        """
+        Bring the revocation state of every cached, unexpired token up to date.
+        """
+        if self.introspector is None:
+            return
+        now = time.time()
+        with self._lock:
+            for digest in [d for d, e in self._entries.items() if e.expires_at <= now]:
+                del self._entries[digest]
+
+        if self.revocation_feed is not None and self._read_feed():
+            with self._lock:
+                groups: Dict[tuple, List[_Entry]] = {}
+                for entry in self._entries.values():
+                    if not entry.revoked:
+                        key = (entry.claims.get("user_id"), entry.claims.get("token_epoch"))
+                        groups.setdefault(key, []).append(entry)
+            # A rejected representative is either revoked on its own or behind its user's
+            # epoch; only then are the rest of its group checked one by one.
+            suspects = set(self._introspect([group[0] for group in groups.values()]))
+            self._introspect(
+                [entry for group in groups.values() if group[0] in suspects for entry in group[1:]]
+            )
+        else:
+            with self._lock:
+                entries = [e for e in self._entries.values() if not e.revoked]
+            self._introspect(entries)
+        with self._lock:
+            self._counters["refreshes"] += 1
+
+    def _read_feed(self) -> bool:
+        """Mark cached tokens revoked since the last cursor; False if the feed failed."""
+        try:
+            while True:
+                revocations, cursor = self.revocation_feed(self._cursor)
+                with self._lock:
+                    for revocation in revocations:
+                        entry = self._entries.get(bytes.fromhex(revocation["token_hash"]))
+                        if entry is not None:
+                            entry.revoked = True
+                self._cursor = cursor
+                if not revocations:
+                    return True
+        except Exception as e:
+            logger.error(f"Error reading revocation feed, re-introspecting every token: {str(e)}")
+            return False
+
+    def _introspect(self, entries: List[_Entry]) -> List[_Entry]:
+        """Re-introspect entries, marking and returning the ones no longer valid."""
+        if not entries:
+            return []
+        results = self.introspector([entry.token for entry in entries])
+        rejected = [entry for entry, result in zip(entries, results) if not result.get("valid", False)]
+        with self._lock:
+            for entry in rejected:
+                entry.revoked = True
+        return rejected
+
+    def start(self) -> "TokenVerifier":
+        """
+        Start the background refresh thread. Returns the verifier for chaining.
+        """
+        if self._refresher is None and self.introspector is not None:
+            self._stopped.clear()
+            self._refresher = threading.Thread(
+                target=self._refresh_forever, name="token-verifier-refresh", daemon=True
+            )
+            self._refresher.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop the background refresh thread.
+        """
+        self._stopped.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+
+    def stats(self) -> dict:
+        """
+        Return cache size and hit/miss counters.
+        """
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["size"] = len(self._entries)
+        return snapshot
+
+    def auth_required(self, func: Callable) -> Callable:
+        """
+        Flask route decorator equivalent to the auth service's `auth_required`.
+
+        Reads the `x-access-token` header and, when the token is accepted, exposes its
+        claims as `flask.g.claims` and the user's ID as `flask.g.user_id`.
+
+        Args:
+            func (Callable): The Flask route function to be decorated.
+
+        Returns:
+            Callable: The decorated function with authentication checks.
+        """
+        from flask import request, jsonify, make_response, g
+
+        @wraps(func)
+        def verifier_auth_required_wrapper(*args: Any, **kwargs: Any) -> Any:
+            try:
+                claims = self.verify(request.headers.get("x-access-token"))
+            except TokenRejected as e:
+                logger.warning(f"Unauthorized access attempt: {e.reason}")
+                return make_response(jsonify({"Unauthorized": e.reason}), e.status)
+            g.claims = claims
+            g.user_id = claims.get("user_id")
+            return func(*args, **kwargs)
+
+        return verifier_auth_required_wrapper
+
+    def _refresh_forever(self) -> None:
+        while not self._stopped.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing token revocations: {str(e)}")